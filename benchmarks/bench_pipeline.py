@@ -0,0 +1,220 @@
+# benchmarks/bench_pipeline.py
+# ------------------------------------------------------------
+# 엔드투엔드 처리량: 합성 신고필증(synth_corpus) × 저장소 템플릿(receipt_template_*.json)
+# - stages: 문서별 단계 지연(open / extract / postprocess / close) 백분위 + 배치 단계(validate/type/sort/export)
+# - throughput: route_files(혼합 배치 템플릿 판별 — 파일마다 열어 첫 페이지 지문) docs/sec,
+#   run_batch(실제 변환 경로) docs/sec, 전체(변환+프레임+내보내기) docs/sec
+# - accuracy: 추출값 == 기대값(써 넣은 원문의 postprocess_field 결과) 비율
+# - peak_rss_mb: 케이스마다 새 프로세스에서 실행해 케이스별 최대 RSS(본 프로세스 / 워커) 측정
+#   코퍼스는 케이스 전에 synth_corpus.py가 임시 폴더에 써 두고 경로로 전달 → 측정 프로세스(와 그 자식)에는
+#   생성 비용·PDF 사본이 섞이지 않음
+# 실행: python benchmarks/bench_pipeline.py [--scales 100,1000,10000] [--mode clip] [--workers 4] [--json] [--out r.json]
+# ------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+try:
+    import resource  # POSIX 전용 (Windows에서는 RSS 생략)
+except ImportError:
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pandas as pd  # noqa: E402
+
+from receipt_engine import (  # noqa: E402
+    EXPORT_FORMATS, EXTRACT_MODES, FIELD_SPECS, FIELDS, PdfExtractionSession, ResultExporter, TemplateIndex,
+    pdf_fingerprint, postprocess_field, route_files, run_batch, sort_by_date, type_frame, validate_frame,
+)
+from synth_corpus import load_template_rects, template_files  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+PERCENTILES = (50, 90, 99)
+
+
+def percentiles(xs: List[float]) -> Dict[str, float]:
+    """ms 단위 p50/p90/p99 + 평균 (최근접 순위 방식)."""
+    if not xs:
+        return {}
+    s = sorted(xs)
+    out = {f"p{p}": round(s[min(len(s) - 1, max(0, -(-p * len(s) // 100) - 1))] * 1e3, 4) for p in PERCENTILES}
+    out["mean"] = round(sum(s) / len(s) * 1e3, 4)
+    return out
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    if resource is None:
+        return {}
+    # ru_maxrss: Linux KB, macOS bytes
+    unit = 1 if sys.platform == "darwin" else 1024
+    self_ = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20
+    return {"self": round(self_, 1), "workers": round(children, 1)}
+
+
+def write_case_corpus(template: str, n: int, seed: int, corpus: str) -> float:
+    """합성 코퍼스 n건을 별도 프로세스로 corpus 폴더에 생성 → 경과 초."""
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, str(Path(__file__).with_name("synth_corpus.py")), "-t", template,
+                    "-n", str(n), "-o", corpus, "--seed", str(seed)],
+                   cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - t0
+
+
+def run_case(template: str, n: int, mode: str, workers: int, fmt: str, corpus: str) -> dict:
+    """템플릿 1개 × 문서 n건 측정 (corpus: write_case_corpus로 만든 폴더)."""
+    rects = load_template_rects(template)
+    fields = [f for f in FIELDS if f in rects]
+    corpus = Path(corpus)
+    items = [(f"synth_{i:06d}.pdf", str(corpus / f"synth_{i:06d}.pdf")) for i in range(n)]
+
+    # ---- 문서별 단계 지연 (단일 프로세스, 단계 사이 타이머) · 정확도는 manifest와 바로 비교 ----
+    lat: Dict[str, List[float]] = {"open": [], "extract": [], "postprocess": [], "close": []}
+    correct = 0
+    clock = time.perf_counter
+    with open(corpus / "manifest.jsonl", encoding="utf-8") as manifest:
+        for (_, path), line in zip(items, manifest):
+            t0 = clock()
+            sess = PdfExtractionSession(path)
+            t1 = clock()
+            raws = sess.extract_texts(rects, fields, mode=mode)
+            t2 = clock()
+            row = {f: postprocess_field(f, raws[f]) for f in fields}
+            t3 = clock()
+            sess.close()
+            t4 = clock()
+            lat["open"].append(t1 - t0)
+            lat["extract"].append(t2 - t1)
+            lat["postprocess"].append(t3 - t2)
+            lat["close"].append(t4 - t3)
+            expected = json.loads(line)["expected"]
+            correct += sum(row[f] == expected[f] for f in fields)
+    per_doc = [sum(v) for v in zip(*lat.values())]
+
+    # ---- 템플릿 판별 (run_routed_batch 첫 단계, 같은 워커 수) ----
+    index = TemplateIndex({"bench": {"norm_rects": rects, "fingerprint": pdf_fingerprint(items[0][1])}})
+    t0 = time.perf_counter()
+    routed, _ = route_files(items, index, workers=workers)
+    route_s = time.perf_counter() - t0
+
+    # ---- 실제 변환 경로 (run_batch → 프레임 → 내보내기) ----
+    t0 = time.perf_counter()
+    res = run_batch(items, rects, fields, mode=mode, workers=workers, validate=False)
+    t1 = time.perf_counter()
+    df = pd.DataFrame(res.rows, columns=fields)
+    validate_frame(df, res.names)
+    t2 = time.perf_counter()
+    typed = type_frame(df)
+    t3 = time.perf_counter()
+    typed = sort_by_date(typed)
+    t4 = time.perf_counter()
+    exporter = ResultExporter(fields, fmt, specs=FIELD_SPECS)
+    with exporter:
+        exporter.write_frame(typed)
+    t5 = time.perf_counter()
+    out_bytes = os.path.getsize(exporter.path)
+    os.remove(exporter.path)
+
+    batch = {"validate": t2 - t1, "type": t3 - t2, "sort": t4 - t3, "export": t5 - t4}
+    return {
+        "template": Path(template).name,
+        "docs": n,
+        "mode": mode,
+        "workers": workers,
+        "format": fmt,
+        "docs_per_sec": {
+            "extract_single": round(n / sum(per_doc), 1),
+            "route": round(n / route_s, 1),
+            "run_batch": round(n / (t1 - t0), 1),
+            "end_to_end": round(n / (t5 - t0), 1),
+        },
+        "stages_ms": {**{k: percentiles(v) for k, v in lat.items()}, "per_doc": percentiles(per_doc)},
+        "batch_stages_ms": {k: round(v * 1e3, 2) for k, v in batch.items()},
+        "accuracy": round(correct / (n * len(fields)), 6) if n else None,
+        "errors": sum(1 for m in res.issues if m.startswith("❌")),
+        "unrouted": n - len(routed.get("bench", [])),
+        "export_bytes": out_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="합성 코퍼스로 엔드투엔드 처리량 측정")
+    ap.add_argument("-t", "--template", action="append", default=None,
+                    help="템플릿 JSON (여러 번 지정 가능, 기본: receipt_template_*.json 전체)")
+    ap.add_argument("--scales", default="100,1000", help="문서 수 목록 (예: 100,1000,10000)")
+    ap.add_argument("--mode", choices=sorted(EXTRACT_MODES), default="clip")
+    ap.add_argument("--workers", type=int, default=1, help="run_batch 워커 수")
+    ap.add_argument("--format", choices=list(EXPORT_FORMATS), default="xlsx")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="JSON으로 출력")
+    ap.add_argument("--out", default=None, help="JSON 결과 저장 경로 (버전 간 비교용)")
+    ap.add_argument("--case", nargs=3, metavar=("TEMPLATE", "N", "CORPUS"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.case:
+        # 자식 프로세스: 케이스 1개 실행 → JSON 1줄
+        tmpl, n, corpus = args.case
+        print(json.dumps(run_case(tmpl, int(n), args.mode, args.workers, args.format, corpus),
+                         ensure_ascii=False))
+        return
+
+    templates = args.template or [str(p) for p in template_files()]
+    if not templates:
+        ap.error("템플릿 파일을 찾을 수 없습니다 (-t 지정)")
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+
+    cases = []
+    for tmpl in templates:
+        for n in scales:
+            with tempfile.TemporaryDirectory(prefix="bench_corpus_") as corpus:
+                gen_s = write_case_corpus(tmpl, n, args.seed, corpus)
+                cmd = [sys.executable, __file__, "--case", tmpl, str(n), corpus, "--mode", args.mode,
+                       "--workers", str(args.workers), "--format", args.format]
+                out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True)
+            case = {**json.loads(out.stdout.strip().splitlines()[-1]), "generate_s": round(gen_s, 3)}
+            cases.append(case)
+            if not args.json:
+                d = case["docs_per_sec"]
+                print(f"{case['template']:<40} {n:>6}건  "
+                      f"route {d['route']:>8.1f}/s  run_batch {d['run_batch']:>8.1f}/s  "
+                      f"e2e {d['end_to_end']:>8.1f}/s  "
+                      f"doc p50 {case['stages_ms']['per_doc']['p50']:.2f} ms  "
+                      f"p99 {case['stages_ms']['per_doc']['p99']:.2f} ms  "
+                      f"RSS {case['peak_rss_mb'].get('self', 0):.0f} MB  정확도 {case['accuracy']:.4f}")
+
+    report = {
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cases": cases,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/bench_postprocess.py
+# ------------------------------------------------------------
+# postprocess_field 필드별 1회 호출 비용: 기존 if-체인(패턴 문자열 re.search) vs 필드 규칙 레지스트리
+# 실행: python benchmarks/bench_postprocess.py [--number 20000] [--json]
+# ------------------------------------------------------------
+
+import argparse
+import json
+import re
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from receipt_engine import FIELDS, PORT_CODE_MAP, postprocess_field  # noqa: E402
+
+# 필드별 대표 raw 텍스트 (ROI 클립 결과 형태)
+SAMPLES = {
+    "b/l(awb)번호": "HDMU1234567 ",
+    "국내도착항": "KRPUS 부산",
+    "신고일": "2025/03/04",
+    "환율": "1,385.2300",
+    "세율(구분)": "관 8.00 (A)",
+    "부가가치세 과표": "12,345,678 원",
+    "관세": "987,654",
+    "부가가치세": "1,234,567",
+    "신고번호": "12345-25-123456M",
+}
+
+
+# ---- 기존 구현 (비교 기준, 변경 전 코드 그대로) ----
+def _legacy_fmt_date_uniform(s):
+    cur_year = datetime.now().year
+    if not s:
+        return f"{cur_year:04d}/00/00"
+    s = " ".join(str(s).split())
+    m = re.search(r'(\d{4})[./-](\d{1,2})[./-](\d{1,2})', s)
+    if m:
+        y, mo, d = m.groups()
+        return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
+    m = re.search(r'(\d{4})\s*년\s*(\d{1,2})\s*월\s*(\d{1,2})\s*일', s)
+    if m:
+        y, mo, d = m.groups()
+        return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
+    m = re.search(r'(?<!\d)(\d{1,2})[./-](\d{1,2})(?!\d)', s)
+    if m:
+        mo, d = m.groups()
+        return f"{cur_year:04d}/{int(mo):02d}/{int(d):02d}"
+    m = re.search(r'(?<!\d)(\d{8})(?!\d)', s)
+    if m:
+        val = m.group(1)
+        return f"{int(val[:4]):04d}/{int(val[4:6]):02d}/{int(val[6:]):02d}"
+    return f"{cur_year:04d}/00/00"
+
+
+def _legacy_clean_number(s):
+    if s is None:
+        return None
+    t = str(s).replace(",", "").strip()
+    if t == "":
+        return None
+    try:
+        return float(t) if re.search(r'\d+\.\d+', t) else int(t)
+    except Exception:
+        return None
+
+
+def _legacy_postprocess_field(name, raw):
+    text = " ".join((raw or "").split())
+    if name == "b/l(awb)번호":
+        m = re.search(r'([A-Za-z0-9\-]+)', text)
+        return m.group(1) if m else ""
+    if name == "국내도착항":
+        m = re.search(r'\b([A-Z]{5})\b', text)
+        if m:
+            return PORT_CODE_MAP.get(m.group(1), m.group(1))
+        m = re.search(r'([가-힣A-Za-z]+)', text)
+        return m.group(1) if m else text
+    if name == "신고일":
+        return _legacy_fmt_date_uniform(text)
+    if name == "환율":
+        m = re.search(r'([\d,]+\.\d+|\d+\.\d+|\d+)', text)
+        return _legacy_clean_number(m.group(1)) if m else _legacy_clean_number(text)
+    if name == "세율(구분)":
+        m = re.search(r'관\s*([0-9.]+)', text)
+        if not m:
+            m = re.search(r'([0-9.]+)', text)
+        return m.group(1) if m else ""
+    if name in ("부가가치세 과표", "관세", "부가가치세"):
+        m = re.search(r'([0-9]{1,3}(?:,[0-9]{3})+|[0-9]{4,})\s*원?', text)
+        if m:
+            return _legacy_clean_number(m.group(1))
+        return _legacy_clean_number(text)
+    if name == "신고번호":
+        m = re.search(r'\b(\d{5}-\d{2}-\d{6}M)\b', text)
+        return m.group(1) if m else text
+    return text
+
+
+def bench(number: int) -> dict:
+    out = {}
+    for name in FIELDS:
+        raw = SAMPLES[name]
+        assert _legacy_postprocess_field(name, raw) == postprocess_field(name, raw), name
+        before = min(timeit.repeat(lambda: _legacy_postprocess_field(name, raw), number=number, repeat=5))
+        after = min(timeit.repeat(lambda: postprocess_field(name, raw), number=number, repeat=5))
+        out[name] = {"before_ns": before / number * 1e9, "after_ns": after / number * 1e9}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="postprocess_field 필드별 비용 비교")
+    ap.add_argument("--number", type=int, default=20000, help="측정 1회당 호출 수")
+    ap.add_argument("--json", action="store_true", help="JSON으로 출력")
+    args = ap.parse_args()
+
+    res = bench(args.number)
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return
+    print(f"{'필드':<14}{'before(ns)':>12}{'after(ns)':>12}{'speedup':>9}")
+    for name, r in res.items():
+        print(f"{name:<14}{r['before_ns']:>12.0f}{r['after_ns']:>12.0f}{r['before_ns'] / r['after_ns']:>8.2f}x")
+    tb = sum(r["before_ns"] for r in res.values())
+    ta = sum(r["after_ns"] for r in res.values())
+    print(f"{'행(9필드) 합계':<14}{tb:>12.0f}{ta:>12.0f}{tb / ta:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# benchmarks/bench_server.py
+# ------------------------------------------------------------
+# 추출 서비스(receipt_server.py) 부하 시험: 동시 클라이언트 N개가 합성 신고필증을 업로드
+# - latency_ms: 요청별 왕복 지연 백분위 (클라이언트 측)
+# - throughput: 성공 요청/s, 문서/s · 503(대기열 초과) 건수
+# - server: 끝난 뒤 /stats 응답 (서버 측 지연 백분위 · 처리량)
+# 실행: python benchmarks/bench_server.py [--clients 8] [--requests 200] [--docs 4] [--workers 2] [--queue 32]
+#       python benchmarks/bench_server.py --url http://127.0.0.1:8765 --template 수입필증1   (이미 떠 있는 서버)
+# ------------------------------------------------------------
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_pipeline import percentiles  # noqa: E402
+from synth_corpus import generate_corpus, load_template_rects, template_files  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_TEMPLATE = "bench"
+
+
+def multipart_body(files: List[Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    """[(파일명, PDF)] → (multipart/form-data 본문, Content-Type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, pdf in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                     f"Content-Type: application/pdf\r\n\r\n".encode("utf-8") + pdf + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(template: str, workers: int, queue: int, tmp: str) -> Tuple[subprocess.Popen, str]:
+    """합성 코퍼스용 템플릿 1개로 서버를 새 프로세스에서 띄움 (캐시·반입 이력 끔 → 매 요청 실제 추출)."""
+    tmpl_path = os.path.join(tmp, "templates.json")
+    with open(tmpl_path, "w", encoding="utf-8") as f:
+        json.dump({"__meta": {}, BENCH_TEMPLATE: {"norm_rects": load_template_rects(template)}}, f,
+                  ensure_ascii=False)
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, str(ROOT / "receipt_server.py"), "--port", str(port), "--templates-file", tmpl_path,
+         "--workers", str(workers), "--queue", str(queue), "--no-cache", "--no-ledger", "-q"],
+        cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/health", timeout=1).read()
+            return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("서버가 시작되지 않았습니다")
+
+
+def run_load(url: str, template: str, bodies: List[Tuple[bytes, str]], clients: int, requests: int,
+             docs: int, fmt: str) -> dict:
+    """클라이언트 clients개가 요청 requests건을 나눠 보냄 (503이면 재시도 없이 거절로 집계)."""
+    endpoint = f"{url}/extract?template={quote(template)}&format={fmt}"
+    lat: List[float] = []
+    counts = {"ok": 0, "rejected": 0, "errors": 0, "rows": 0}
+    lock = threading.Lock()
+
+    def _one(i: int) -> None:
+        body, ctype = bodies[i % len(bodies)]
+        req = urllib.request.Request(endpoint, data=body, headers={"Content-Type": ctype}, method="POST")
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=300) as resp:
+                resp.read()
+                rows = int(resp.headers.get("X-Rows", 0))
+            key = "ok"
+        except urllib.error.HTTPError as e:
+            e.read()
+            key, rows = ("rejected" if e.code == 503 else "errors"), 0
+        dt = time.perf_counter() - t0
+        with lock:
+            counts[key] += 1
+            counts["rows"] += rows
+            if key == "ok":
+                lat.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as ex:
+        list(ex.map(_one, range(requests)))
+    wall = time.perf_counter() - t0
+    return {
+        "clients": clients,
+        "requests": requests,
+        "docs_per_request": docs,
+        "format": fmt,
+        "wall_s": round(wall, 3),
+        **counts,
+        "latency_ms": percentiles(lat),
+        "throughput": {"requests_per_sec": round(counts["ok"] / wall, 2),
+                       "docs_per_sec": round(counts["ok"] * docs / wall, 2)},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="추출 서비스 동시 부하 시험 (오프라인)")
+    ap.add_argument("--url", default=None, help="이미 떠 있는 서버 주소 (없으면 새로 띄움)")
+    ap.add_argument("-t", "--template", default=None,
+                    help="--url: 서버의 템플릿명 / 아니면 템플릿 JSON (기본: receipt_template_*.json 첫 번째)")
+    ap.add_argument("--clients", default="1,4,8", help="동시 클라이언트 수 목록 (예: 1,4,8)")
+    ap.add_argument("--requests", type=int, default=100, help="케이스별 요청 수")
+    ap.add_argument("--docs", type=int, default=4, help="요청 1건에 담는 PDF 수")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="새로 띄우는 서버의 워커 수")
+    ap.add_argument("--queue", type=int, default=32, help="새로 띄우는 서버의 대기열")
+    ap.add_argument("--format", default="json", help="응답 형식 (json/xlsx/csv/parquet)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="JSON으로 출력")
+    args = ap.parse_args()
+
+    if args.url:
+        if not args.template:
+            ap.error("--url에는 -t/--template(서버의 템플릿명)이 필요합니다")
+        rects_from = None
+    else:
+        rects_from = args.template or next(iter(str(p) for p in template_files()), None)
+        if not rects_from:
+            ap.error("템플릿 파일을 찾을 수 없습니다 (-t 지정)")
+
+    with tempfile.TemporaryDirectory(prefix="bench_server_") as tmp:
+        proc = None
+        if args.url:
+            url, template = args.url.rstrip("/"), args.template
+            rects = None
+        else:
+            proc, url = start_server(rects_from, args.workers, args.queue, tmp)
+            template, rects = BENCH_TEMPLATE, load_template_rects(rects_from)
+        try:
+            if rects is None:
+                tmpls = json.load(urllib.request.urlopen(f"{url}/templates"))
+                hit = [t for t in tmpls if t["name"] == template]
+                if not hit:
+                    ap.error(f"서버에 템플릿이 없습니다: {template}")
+                # 서버 템플릿 좌표를 모르므로 저장소 템플릿으로 만든 문서를 보냄 (지연·처리량 측정용)
+                rects = load_template_rects(str(template_files()[0]))
+            docs = list(generate_corpus(rects, 16 * args.docs, args.seed))
+            bodies = [multipart_body([(d.name, d.pdf) for d in docs[i:i + args.docs]])
+                      for i in range(0, len(docs), args.docs)]
+            run_load(url, template, bodies, 1, min(4, args.requests), args.docs, args.format)  # 예열
+            cases = []
+            for c in [int(x) for x in args.clients.split(",") if x.strip()]:
+                case = run_load(url, template, bodies, c, args.requests, args.docs, args.format)
+                cases.append(case)
+                if not args.json:
+                    lat = case["latency_ms"]
+                    print(f"clients {c:>3}  ok {case['ok']:>5}  503 {case['rejected']:>4}  err {case['errors']:>3}  "
+                          f"{case['throughput']['requests_per_sec']:>7.1f} req/s  "
+                          f"{case['throughput']['docs_per_sec']:>8.1f} docs/s  "
+                          f"p50 {lat.get('p50', 0):>8.1f} ms  p99 {lat.get('p99', 0):>8.1f} ms")
+            server = json.load(urllib.request.urlopen(f"{url}/stats"))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    report = {"url": url, "template": template, "cases": cases, "server": server}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    elif not args.url:
+        print(f"server workers {server['workers']}  queue {server['queue']}  "
+              f"rejected {server['counters']['rejected']}  latency {server['latency']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_startup.py
+# ------------------------------------------------------------
+# 콜드 스타트 측정: 새 파이썬 프로세스에서 모듈 임포트(+ 선택: Streamlit 첫 실행)까지 걸리는 시간
+# 실행: python benchmarks/bench_startup.py [--runs 5] [--apptest] [--json]
+# ------------------------------------------------------------
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 측정 대상: 이름 → 자식 프로세스에서 실행할 코드 (경과 초를 stdout 마지막 줄에 출력)
+TARGETS = {
+    "import receipt_engine": "import receipt_engine",
+    "import import_receipt_app": "import import_receipt_app",
+}
+APPTEST_CODE = (
+    "from streamlit.testing.v1 import AppTest\n"
+    "AppTest.from_file('import_receipt_app.py', default_timeout=120).run()"
+)
+
+
+def measure(code: str) -> float:
+    prog = (
+        "import time, sys\n"
+        f"sys.path.insert(0, {str(ROOT)!r})\n"
+        "t0 = time.perf_counter()\n"
+        f"{code}\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", prog], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="콜드 스타트 시간 측정")
+    ap.add_argument("--runs", type=int, default=5, help="대상별 반복 횟수 (매번 새 프로세스)")
+    ap.add_argument("--apptest", action="store_true", help="Streamlit AppTest로 첫 화면 실행까지 측정")
+    ap.add_argument("--json", action="store_true", help="JSON으로 출력")
+    args = ap.parse_args()
+
+    targets = dict(TARGETS)
+    if args.apptest:
+        targets["streamlit 첫 실행(AppTest)"] = APPTEST_CODE
+
+    res = {}
+    for name, code in targets.items():
+        xs = [measure(code) for _ in range(args.runs)]
+        res[name] = {"median_ms": statistics.median(xs) * 1e3, "min_ms": min(xs) * 1e3, "max_ms": max(xs) * 1e3}
+
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return
+    for name, r in res.items():
+        print(f"{name:<32} median {r['median_ms']:8.1f} ms  (min {r['min_ms']:.1f} / max {r['max_ms']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
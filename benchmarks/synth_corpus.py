@@ -0,0 +1,265 @@
+# benchmarks/synth_corpus.py
+# ------------------------------------------------------------
+# 합성 수입신고필증 PDF 생성기
+# - 템플릿 ROI(norm_rects) 안에 값을 써 넣고, 바깥에는 라벨/표 선 등 양식 요소를 배치
+# - 값은 postprocess_field 분기를 모두 거치도록 표기를 섞음
+#   (항 코드/한글명/미등록 코드, 신고번호 정상/비정상, 콤마 금액/소액, 여러 날짜 표기 등)
+# - 각 문서의 기대값(= 써 넣은 원문을 postprocess_field로 정제한 값)을 함께 반환
+# 실행: python benchmarks/synth_corpus.py -t receipt_template_20250813_130742.json -n 1000 -o /tmp/corpus
+# ------------------------------------------------------------
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from receipt_engine import FIELDS, PORT_CODE_MAP, load_all_templates, postprocess_field  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGE_SIZE = (595, 842)  # A4 (pt)
+FONT_NAME = "korea"     # PyMuPDF 내장 CJK 폰트 (임베드 없음 → 파일이 작음)
+TITLE = "수입신고필증"
+# 양식 라벨 (ROI 왼쪽에 공간이 있을 때만 배치)
+FIELD_LABELS = {
+    "b/l(awb)번호": "B/L(AWB)번호",
+    "국내도착항": "국내도착항",
+    "신고일": "신고일",
+    "환율": "환율",
+    "세율(구분)": "세율(구분)",
+    "부가가치세 과표": "부가세과표",
+    "관세": "관세",
+    "부가가치세": "부가가치세",
+    "신고번호": "신고번호",
+}
+
+
+class SynthDoc(NamedTuple):
+    name: str
+    pdf: bytes
+    raws: Dict[str, str]       # ROI에 써 넣은 원문
+    expected: Dict[str, object]  # postprocess_field(원문)
+
+
+# =========================
+# 템플릿 좌표
+# =========================
+def load_template_rects(path: str, name: str | None = None) -> Dict[str, List[float]]:
+    """단일 템플릿 JSON({"norm_rects": ...}) 또는 템플릿 저장소 JSON에서 norm_rects를 읽음."""
+    p = Path(path)
+    with open(p, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "norm_rects" in data:
+        return data["norm_rects"]
+    all_tmpls = load_all_templates(str(p))
+    names = [k for k in all_tmpls if k != "__meta"]
+    if not names:
+        raise ValueError(f"템플릿이 없습니다: {path}")
+    key = name or names[0]
+    if key not in all_tmpls:
+        raise KeyError(f"템플릿 '{key}' 없음 ({path})")
+    return all_tmpls[key]["norm_rects"]
+
+
+def template_files() -> List[Path]:
+    """저장소에 있는 단일 템플릿 파일들 (receipt_template_*.json)."""
+    return sorted(ROOT.glob("receipt_template_*.json"))
+
+
+# =========================
+# 값 생성 (필드별 표기 섞기)
+# =========================
+def _amount(rng: random.Random, lo: int = 10_000, hi: int = 90_000_000) -> int:
+    return rng.randint(lo, hi)
+
+
+def _money_text(rng: random.Random) -> str:
+    r = rng.random()
+    if r < 0.05:
+        return f"{rng.randint(0, 999)}"  # 소액: 금액 패턴 불일치 → 원문 숫자 정제 분기
+    v = _amount(rng)
+    if r < 0.55:
+        return f"{v:,}"
+    if r < 0.85:
+        return f"{v:,} 원"
+    return f"{v}"
+
+
+def random_values(rng: random.Random) -> Dict[str, str]:
+    """FIELDS별 raw 텍스트 1건."""
+    y, mo, d = rng.randint(2019, 2026), rng.randint(1, 12), rng.randint(1, 28)
+
+    r = rng.random()
+    if r < 0.4:
+        bl = f"{rng.choice(['HDMU', 'MAEU', 'COSU', 'ONEY'])}{rng.randint(0, 9_999_999):07d}"
+    elif r < 0.7:
+        bl = f"{rng.randint(100_000_000, 999_999_999)}"
+    else:
+        bl = f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
+
+    code = rng.choice(list(PORT_CODE_MAP))
+    r = rng.random()
+    if r < 0.5:
+        port = code
+    elif r < 0.75:
+        port = f"{code} {PORT_CODE_MAP[code][:2]}"
+    elif r < 0.9:
+        port = PORT_CODE_MAP[code]  # 한글명만 → 두 번째 패턴
+    else:
+        port = rng.choice(["KRYOS", "KRMOK", "KRTSN"])  # 미등록 코드 → 코드 그대로
+
+    date = rng.choice([
+        f"{y:04d}/{mo:02d}/{d:02d}",
+        f"{y:04d}-{mo:02d}-{d:02d}",
+        f"{y:04d}.{mo}.{d}",
+        f"{y}년 {mo}월 {d}일",
+        f"{y:04d}{mo:02d}{d:02d}",
+        f"{mo}/{d}",
+    ])
+    if rng.random() < 0.02:
+        date = "미상"  # 인식 실패 → YYYY/00/00 (형식 점검 대상)
+
+    rate = rng.uniform(800, 1600)
+    fx = rng.choice([f"{rate:,.2f}", f"{rate:.4f}", f"{rate:,.4f}"])
+
+    tr = rng.choice(["0.00", "3.00", "6.50", "8.00", "13.00"])
+    tariff = rng.choice([f"관 {tr} (A)", f"관 {tr} (FTA)", f"관{tr}", tr])
+
+    decl = f"{rng.randint(10000, 99999)}-{y % 100:02d}-{rng.randint(0, 999_999):06d}"
+    decl = decl + "M" if rng.random() < 0.95 else decl  # 5%는 M 누락 → 원문 유지 분기
+
+    return {
+        "b/l(awb)번호": bl,
+        "국내도착항": port,
+        "신고일": date,
+        "환율": fx,
+        "세율(구분)": tariff,
+        "부가가치세 과표": _money_text(rng),
+        "관세": _money_text(rng),
+        "부가가치세": _money_text(rng),
+        "신고번호": decl,
+    }
+
+
+# =========================
+# PDF 그리기
+# =========================
+def _page_rect(norm_rect: List[float], w: float, h: float) -> fitz.Rect:
+    x1n, y1n, x2n, y2n = norm_rect
+    return fitz.Rect(x1n * w, y1n * h, x2n * w, y2n * h)
+
+
+def _fit_fontsize(text: str, box: fitz.Rect) -> float:
+    """높이의 60% 기준, 폭을 넘으면 축소."""
+    fs = box.height * 0.6
+    tl = fitz.get_text_length(text, fontname=FONT_NAME, fontsize=fs)
+    if tl > box.width - 2:
+        fs *= (box.width - 2) / tl
+    return fs
+
+
+def _put_value(page: fitz.Page, box: fitz.Rect, text: str) -> None:
+    fs = _fit_fontsize(text, box)
+    # 글자 박스(기준선 위 1.0fs ~ 아래 0.2fs)를 ROI 세로 중앙에 맞춤
+    baseline = box.y0 + (box.height + fs * 0.8) / 2
+    page.insert_text((box.x0 + 1, baseline), text, fontname=FONT_NAME, fontsize=fs)
+
+
+def _put_label(page: fitz.Page, box: fitz.Rect, label: str, rois: List[fitz.Rect]) -> None:
+    fs = min(box.height * 0.6, 7.0)
+    tl = fitz.get_text_length(label, fontname=FONT_NAME, fontsize=fs)
+    lab = fitz.Rect(box.x0 - tl - 6, box.y0, box.x0 - 4, box.y1)
+    # 다른 ROI와 겹치거나 페이지 밖이면 생략 (ROI 추출값 오염 방지)
+    if lab.x0 < 4 or any(lab.intersects(r) for r in rois):
+        return
+    baseline = box.y0 + (box.height + fs * 0.8) / 2
+    page.insert_text((lab.x0, baseline), label, fontname=FONT_NAME, fontsize=fs)
+
+
+def make_form_base(norm_rects: Dict[str, List[float]], page_size: Tuple[float, float] = PAGE_SIZE) -> bytes:
+    """값 없는 양식(제목/라벨/테두리)만 그린 1쪽 PDF. 문서마다 재사용해 생성 비용을 줄임."""
+    w, h = page_size
+    doc = fitz.open()
+    try:
+        page = doc.new_page(width=w, height=h)
+        rois = [_page_rect(r, w, h) for r in norm_rects.values()]
+        top = min((r.y0 for r in rois), default=h)
+        if top > 40:
+            page.insert_text((w / 2 - 40, min(40, top - 8)), TITLE, fontname=FONT_NAME, fontsize=14)
+        # 표 테두리 (ROI 바깥 여백에 선만 그림 → 텍스트 추출에는 영향 없음)
+        for r in rois:
+            page.draw_rect(r + (-2, -2, 2, 2), color=(0.6, 0.6, 0.6), width=0.3)
+        for f, nr in norm_rects.items():
+            if f in FIELD_LABELS:
+                _put_label(page, _page_rect(nr, w, h), FIELD_LABELS[f], rois)
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+def make_declaration_pdf(values: Dict[str, str], norm_rects: Dict[str, List[float]],
+                         base: bytes | None = None) -> bytes:
+    """양식(base) 위 템플릿 ROI 위치에 values를 배치한 신고필증 PDF."""
+    doc = fitz.open("pdf", base if base is not None else make_form_base(norm_rects))
+    try:
+        page = doc[0]
+        w, h = page.rect.width, page.rect.height
+        for f, v in values.items():
+            if f in norm_rects:
+                _put_value(page, _page_rect(norm_rects[f], w, h), v)
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+
+def generate_corpus(norm_rects: Dict[str, List[float]], n: int, seed: int = 0) -> Iterator[SynthDoc]:
+    """n건의 합성 문서를 생성 (seed 고정 시 재현 가능)."""
+    rng = random.Random(seed)
+    fields = [f for f in FIELDS if f in norm_rects]
+    base = make_form_base(norm_rects)
+    for i in range(n):
+        raws = {f: v for f, v in random_values(rng).items() if f in fields}
+        pdf = make_declaration_pdf(raws, norm_rects, base)
+        expected = {f: postprocess_field(f, raws[f]) for f in fields}
+        yield SynthDoc(f"synth_{i:06d}.pdf", pdf, raws, expected)
+
+
+def write_corpus(out_dir: str, docs: Iterator[SynthDoc]) -> int:
+    """PDF 파일 + manifest.jsonl(파일명, 원문, 기대값) 저장. 저장 건수 반환."""
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(out / "manifest.jsonl", "w", encoding="utf-8") as mf:
+        for d in docs:
+            (out / d.name).write_bytes(d.pdf)
+            mf.write(json.dumps({"name": d.name, "raws": d.raws, "expected": d.expected},
+                                ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="합성 수입신고필증 PDF 생성")
+    ap.add_argument("-t", "--template", default=None,
+                    help="템플릿 JSON (기본: receipt_template_*.json 중 첫 파일)")
+    ap.add_argument("--name", default=None, help="템플릿 저장소 JSON일 때 템플릿명")
+    ap.add_argument("-n", "--count", type=int, default=100, help="생성 건수")
+    ap.add_argument("-o", "--out", required=True, help="출력 폴더")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    path = args.template or (str(template_files()[0]) if template_files() else None)
+    if path is None:
+        ap.error("템플릿 파일을 찾을 수 없습니다 (-t 지정)")
+    rects = load_template_rects(path, args.name)
+    n = write_corpus(args.out, generate_corpus(rects, args.count, args.seed))
+    print(f"{n}건 생성 → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
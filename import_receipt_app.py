@@ -1,45 +1,37 @@
 # import_receipt_app.py
 # ------------------------------------------------------------
 # 📄 수입신고필증 PDF → 엑셀 자동화 (전 항목 ROI 템플릿 · 영구 저장/불러오기 · 시각 오버레이)
-# ✨ 한글 폰트: "맑은 고딕" 우선 + 폴백(Noto/Nanum) + PIL 라벨도 동일 적용
+# ✨ 한글 폰트: "맑은 고딕" 우선 + 폴백(Noto/Nanum) + PIL 라벨도 동일 적용 (오프라인 · 지연 로드)
 # ✨ 템플릿: 최초 저장 → 이후 자동 사용(Last Used) · 필요시 전환/삭제/가져오기/내보내기
 # ------------------------------------------------------------
 
-import io
+import functools
 import json
-import re
 import os
-from datetime import datetime
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Tuple
-from urllib.request import urlretrieve
 
 import streamlit as st
 import pandas as pd
-import fitz  # PyMuPDF
 from PIL import Image, ImageDraw, ImageFont
 
+from receipt_engine import (
+    DPI_DEFAULT, EXPORT_FORMATS, EXTRACT_MODES, BATCH_WORKERS_DEFAULT, BATCH_MEM_BUDGET, JOB_STATUS_LABELS,
+    TEMPLATE_COLUMN, TEMPLATE_KEEP_VERSIONS, DeclarationLedger, ExtractionCache, JobRunner, JobStore,
+    PdfExtractionSession, ResultExporter, StageMetrics, TemplateConflict, TemplateIndex, TemplateStore,
+    build_field_specs, export_unavailable, get_last_used, ocr_available, pdf_sha256, render_page_region, routed_frame,
+    run_batch, run_routed_batch, sort_by_date, spill_to_dir, split_declarations, template_fields, type_frame,
+    validate_frame, validate_row,
+)
+
 # =========================
 # 전역 설정 및 상수
 # =========================
-st.set_page_config(page_title="수입신고필증 PDF → 엑셀 (ROI 템플릿)", page_icon="📄", layout="wide")
-
-TEMPLATES_FILE = "receipt_templates.json"   # 앱 폴더 내 JSON로 영구 저장
-DPI_DEFAULT = 144
-
-# 출력 컬럼(=필드) 순서
-FIELDS: List[str] = [
-    "b/l(awb)번호",
-    "국내도착항",
-    "신고일",
-    "환율",
-    "세율(구분)",
-    "부가가치세 과표",
-    "관세",
-    "부가가치세",
-    "신고번호",
-]
-
 # 필드별 색상 (오버레이용)
 FIELD_COLORS: Dict[str, str] = {
     "b/l(awb)번호": "#E74C3C",
@@ -53,30 +45,33 @@ FIELD_COLORS: Dict[str, str] = {
     "신고번호":      "#D35400",
 }
 
-# 항 코드 → 한글명
-PORT_CODE_MAP = {
-    "KRPTK": "평택항",
-    "KRINC": "인천항",
-    "KRKPO": "포항항",
-    "KRKUV": "군산항",
-    "KRUSN": "울산항",
-    "KRPUS": "부산항",
-    "KRGMP": "김포공항",
-    "KRSEL": "인천공항",
-}
+# ROI 지정 화면 렌더 캐시 (표시용 이미지 최대 보관 수, 1600px 기준 1장 ≈ 10MB)
+RENDER_CACHE_MAX_ENTRIES = 8
+ZOOM_LEVELS = (2, 3, 4)  # 확대 모드 배율 (타일 = 페이지의 1/배율 영역을 표시 너비로 렌더)
 
-_AMOUNT_PATTERN = r'([0-9]{1,3}(?:,[0-9]{3})+|[0-9]{4,})\s*원?'
+# 백그라운드 변환 작업 패널
+JOBS_PANEL_LIMIT = 10      # 목록에 보여 줄 최근 작업 수
+JOBS_POLL_SECONDS = 2      # 진행 중인 작업이 있을 때 상태 갱신 주기
+CURRENT_TEMPLATE_KEY = "(현재 좌표)"  # 이름 없이 변환할 때 작업에 기록하는 템플릿명
 
 # =========================
 # 한글 폰트 설정 (UI + PIL 공통)
+# - 네트워크 다운로드 없음: 환경변수 → 시스템 → 앱 폴더 fonts/ 순으로 탐색
+# - PIL 라벨 폰트는 라벨을 처음 그릴 때 1회만 해석해 프로세스 전역 캐시
 # =========================
-def ensure_korean_fonts():
-    """
-    Streamlit UI 전역 폰트와 PIL 라벨 폰트를 설정한다.
-    - UI: CSS로 '맑은 고딕' 우선, 폴백 스택 지정
-    - PIL: 시스템/동봉/다운로드 순으로 폰트 탐색하여 적용
-    """
-    # 1) UI(CSS) 전역 폰트 적용
+LABEL_FONT_ENV = "RECEIPT_LABEL_FONT"   # 라벨 폰트 경로 지정(선택)
+BUNDLED_FONT_DIR = Path(__file__).resolve().parent / "fonts"  # 동봉 폰트 위치(.ttf/.otf/.ttc)
+SYSTEM_FONT_CANDIDATES = [
+    "C:/Windows/Fonts/malgun.ttf",  # Windows
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",  # macOS
+    "/usr/share/fonts/truetype/nanum/NanumGothic.ttf",  # Ubuntu/Nanum
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansKR-Regular.otf",
+]
+
+
+def apply_ui_fonts() -> None:
+    """Streamlit UI 전역 폰트: CSS로 '맑은 고딕' 우선, 폴백 스택 지정."""
     css_font_stack = "'Malgun Gothic','Apple SD Gothic Neo','Nanum Gothic','Noto Sans KR',sans-serif"
     st.markdown(
         f"""
@@ -93,214 +88,101 @@ def ensure_korean_fonts():
         unsafe_allow_html=True,
     )
 
-    # 2) PIL 라벨 폰트 준비
-    # 우선순위 경로 후보
-    candidates = [
-        "C:/Windows/Fonts/malgun.ttf",  # Windows
-        "/System/Library/Fonts/AppleSDGothicNeo.ttc",  # macOS
-        "/usr/share/fonts/truetype/nanum/NanumGothic.ttf",  # Ubuntu/Nanum
-        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/truetype/noto/NotoSansKR-Regular.otf",
-    ]
-
-    font_path = None
-    for p in candidates:
-        if os.path.exists(p):
-            font_path = p
-            break
-
-    # 없으면 Google Fonts에서 NotoSansKR-Regular 다운로드(런타임 1회)
-    if font_path is None:
-        font_dir = Path("fonts")
-        font_dir.mkdir(exist_ok=True)
-        font_path = str(font_dir / "NotoSansKR-Regular.otf")
-        if not os.path.exists(font_path):
-            try:
-                urlretrieve(
-                    "https://github.com/googlefonts/noto-cjk/raw/main/Sans/OTF/Korean/NotoSansKR-Regular.otf",
-                    font_path
-                )
-            except Exception:
-                # 다운로드 실패 시 기본 폰트(라벨은 영문)로 대체
-                font_path = None
-
-    # PIL Font 객체 생성
-    pil_font = None
-    try:
-        if font_path and os.path.exists(font_path):
-            pil_font = ImageFont.truetype(font_path, size=16)
-    except Exception:
-        pil_font = None
-
-    return pil_font
 
-PIL_LABEL_FONT = ensure_korean_fonts()
-
-# =========================
-# 간단 유틸
-# =========================
-def fmt_date_uniform(s: str) -> str:
-    """여러 날짜 표기를 YYYY/MM/DD로 표준화 (연도 없으면 당해년도, 실패시 YYYY/00/00)."""
-    cur_year = datetime.now().year
-    if not s:
-        return f"{cur_year:04d}/00/00"
-    s = " ".join(str(s).split())
-    m = re.search(r'(\d{4})[./-](\d{1,2})[./-](\d{1,2})', s)
-    if m:
-        y, mo, d = m.groups()
-        return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
-    m = re.search(r'(\d{4})\s*년\s*(\d{1,2})\s*월\s*(\d{1,2})\s*일', s)
-    if m:
-        y, mo, d = m.groups()
-        return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
-    m = re.search(r'(?<!\d)(\d{1,2})[./-](\d{1,2})(?!\d)', s)
-    if m:
-        mo, d = m.groups()
-        return f"{cur_year:04d}/{int(mo):02d}/{int(d):02d}"
-    m = re.search(r'(?<!\d)(\d{8})(?!\d)', s)  # YYYYMMDD
-    if m:
-        val = m.group(1)
-        return f"{int(val[:4]):04d}/{int(val[4:6]):02d}/{int(val[6:]):02d}"
-    return f"{cur_year:04d}/00/00"
-
-
-def clean_number(s: str):
-    """천단위 콤마 제거 → int/float 변환."""
-    if s is None:
-        return None
-    t = str(s).replace(",", "").strip()
-    if t == "":
-        return None
+def resolve_label_font_path() -> str | None:
+    """라벨 폰트 파일 경로 (환경변수 → 시스템 → 동봉 fonts/ · 이전 버전이 받아 둔 ./fonts)."""
+    env = os.environ.get(LABEL_FONT_ENV)
+    if env and os.path.exists(env):
+        return env
+    for p in SYSTEM_FONT_CANDIDATES:
+        if os.path.exists(p):
+            return p
+    for d in (BUNDLED_FONT_DIR, Path("fonts")):
+        if d.is_dir():
+            for f in sorted(d.iterdir()):
+                if f.suffix.lower() in (".ttf", ".otf", ".ttc"):
+                    return str(f)
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_label_font() -> ImageFont.FreeTypeFont | None:
+    """PIL 라벨 폰트 (최초 호출 시 1회 로드). 없으면 None → 기본 폰트(라벨은 영문만 정상)."""
+    font_path = resolve_label_font_path()
     try:
-        return float(t) if re.search(r'\d+\.\d+', t) else int(t)
+        return ImageFont.truetype(font_path, size=16) if font_path else None
     except Exception:
         return None
 
 # =========================
-# 템플릿 저장/불러오기
-# 구조:
-# {
-#   "__meta": {"last_used": "템플릿명"},
-#   "템플릿명": { "created_at": "...", "dpi": 144, "norm_rects": {"필드":[x1n,y1n,x2n,y2n], ...} }
-# }
+# 공유 리소스 (세션·재실행 간 공유)
 # =========================
-def load_all_templates() -> Dict[str, dict]:
-    path = Path(TEMPLATES_FILE)
-    if path.exists():
-        try:
-            return json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            return {"__meta": {}}
-    return {"__meta": {}}
+@st.cache_resource(show_spinner=False)
+def get_extraction_cache() -> ExtractionCache:
+    """프로세스 전역 캐시 인스턴스."""
+    return ExtractionCache()
 
 
-def save_all_templates(all_tmpls: Dict[str, dict]) -> None:
-    # meta 키 보존
-    if "__meta" not in all_tmpls:
-        all_tmpls["__meta"] = {}
-    Path(TEMPLATES_FILE).write_text(json.dumps(all_tmpls, ensure_ascii=False, indent=2), encoding="utf-8")
+@st.cache_resource(show_spinner=False)
+def get_template_store() -> TemplateStore:
+    """프로세스 전역 템플릿 저장소 (세션마다 파일을 다시 읽지 않고, 바뀐 경우에만 다시 읽음)."""
+    return TemplateStore()
 
 
-def set_last_used(all_tmpls: Dict[str, dict], name: str):
-    if "__meta" not in all_tmpls:
-        all_tmpls["__meta"] = {}
-    all_tmpls["__meta"]["last_used"] = name
-    save_all_templates(all_tmpls)
+@st.cache_resource(show_spinner=False)
+def get_job_runner() -> JobRunner:
+    """프로세스 전역 백그라운드 작업 실행기 (앱 재시작 시 진행 중이던 작업은 '중단됨'으로 표시)."""
+    return JobRunner(JobStore(), cache=get_extraction_cache())
 
 
-def get_last_used(all_tmpls: Dict[str, dict]) -> str | None:
-    meta = all_tmpls.get("__meta", {})
-    return meta.get("last_used")
+@st.cache_resource(show_spinner=False)
+def get_ledger() -> DeclarationLedger:
+    """프로세스 전역 반입 이력 (B/L · 신고번호 배치 간 중복 검사)."""
+    return DeclarationLedger()
 
 # =========================
-# PDF 관련: 렌더/텍스트 클립
+# 상태 초기화 + 자동 템플릿 로드
 # =========================
-def pdf_first_page_pix(file_bytes: bytes, dpi: int = DPI_DEFAULT) -> Tuple[Image.Image, int, int, fitz.Rect]:
-    """1페이지를 이미지로 렌더하고, (PIL.Image, width, height, page_rect) 반환."""
-    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-        page = doc.load_page(0)
-        mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        return img, pix.width, pix.height, page.rect
-
-
-def clip_text_by_norm_rect(file_bytes: bytes, norm_rect: List[float], page_rect: fitz.Rect) -> str:
-    """정규화(0~1) rect로 1페이지에서 텍스트 클립."""
-    x1n, y1n, x2n, y2n = norm_rect
-    x1 = page_rect.x0 + page_rect.width * x1n
-    y1 = page_rect.y0 + page_rect.height * y1n
-    x2 = page_rect.x0 + page_rect.width * x2n
-    y2 = page_rect.y0 + page_rect.height * y2n
-    clip = fitz.Rect(x1, y1, x2, y2)
-    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-        page = doc.load_page(0)
-        txt = page.get_text("text", clip=clip) or ""
-        return " ".join(txt.split())
+def load_template_state(name: str, data: dict) -> None:
+    """저장된 템플릿 → 세션 편집 상태 (공유 스냅샷을 건드리지 않도록 복사)."""
+    st.session_state.template_name = name
+    st.session_state.tmpl_dpi = data.get("dpi", DPI_DEFAULT)
+    st.session_state.norm_rects = dict(data.get("norm_rects", {}))
+    st.session_state.field_defs = dict(data.get("fields", {}))
+    st.session_state.tmpl_fingerprint = data.get("fingerprint")
+    st.session_state.tmpl_split = dict(data.get("split") or {})
+    st.session_state.tmpl_field_pages = dict(data.get("field_pages") or {})
+    st.session_state.tmpl_base = (name, data.get("version"))  # 저장 시 충돌 검사 기준
+
+
+def queue_template_load(name: str, data: dict, message: str) -> None:
+    """
+    버튼 처리 중 템플릿 전환: '템플릿 이름' 입력칸이 이미 그려져 값을 바꿀 수 없으므로
+    다음 실행 초반(ensure_state)에 적용하도록 넘기고 즉시 재실행.
+    """
+    st.session_state.pending_template = (name, data, message)
+    st.rerun()
 
-# =========================
-# 필드 후처리 규칙 (ROI에서 추출된 raw 텍스트 → 정제)
-# =========================
-def postprocess_field(name: str, raw: str):
-    text = " ".join((raw or "").split())
-
-    if name == "b/l(awb)번호":
-        m = re.search(r'([A-Za-z0-9\-]+)', text)
-        return m.group(1) if m else ""
-
-    if name == "국내도착항":
-        m = re.search(r'\b([A-Z]{5})\b', text)
-        if m:
-            return PORT_CODE_MAP.get(m.group(1), m.group(1))
-        m = re.search(r'([가-힣A-Za-z]+)', text)
-        return m.group(1) if m else text
-
-    if name == "신고일":
-        return fmt_date_uniform(text)
-
-    if name == "환율":
-        m = re.search(r'([\d,]+\.\d+|\d+\.\d+|\d+)', text)
-        return clean_number(m.group(1)) if m else clean_number(text)
-
-    if name == "세율(구분)":
-        # "관 8.00 (설명)" → 8.00 만 남김, 없으면 숫자만
-        m = re.search(r'관\s*([0-9.]+)', text)
-        if not m:
-            m = re.search(r'([0-9.]+)', text)
-        return m.group(1) if m else ""
-
-    if name in ("부가가치세 과표", "관세", "부가가치세"):
-        m = re.search(_AMOUNT_PATTERN, text)
-        if m:
-            return clean_number(m.group(1))
-        return clean_number(text)
-
-    if name == "신고번호":
-        m = re.search(r'\b(\d{5}-\d{2}-\d{6}M)\b', text)
-        return m.group(1) if m else text
-
-    return text
 
-# =========================
-# 상태 초기화 + 자동 템플릿 로드
-# =========================
 def ensure_state():
-    if "all_templates" not in st.session_state:
-        st.session_state.all_templates = load_all_templates()
+    pending = st.session_state.pop("pending_template", None)
+    if pending:
+        name, data, message = pending
+        load_template_state(name, data)
+        st.session_state.current_field_idx = 0
+        st.session_state.click_phase = 0
+        st.session_state.temp_points = []
+        st.toast(message)
 
     # 🔸 마지막 사용 템플릿 자동 로드(최초 1회)
     if "auto_loaded" not in st.session_state:
         st.session_state.auto_loaded = True
-        last = get_last_used(st.session_state.all_templates)
-        if last and last in st.session_state.all_templates:
-            data = st.session_state.all_templates[last]
-            st.session_state.template_name = last
-            st.session_state.tmpl_dpi = data.get("dpi", DPI_DEFAULT)
-            st.session_state.norm_rects = data.get("norm_rects", {})
+        tmpls = get_template_store().all()
+        last = get_last_used(tmpls)
+        if last and last in tmpls:
+            load_template_state(last, tmpls[last])
         else:
-            st.session_state.template_name = ""
-            st.session_state.tmpl_dpi = DPI_DEFAULT
-            st.session_state.norm_rects = {}
+            load_template_state("", {})
 
     if "display_width" not in st.session_state:
         st.session_state.display_width = 1000
@@ -310,28 +192,154 @@ def ensure_state():
         st.session_state.temp_points = []  # [(x,y)] in 원본 좌표
     if "current_field_idx" not in st.session_state:
         st.session_state.current_field_idx = 0
+    if "rep_page" not in st.session_state:
+        st.session_state.rep_page = 1      # 좌표 지정 중인 대표 PDF 페이지 (1부터)
+    if "zoom_mode" not in st.session_state:
+        st.session_state.zoom_mode = False
+    if "zoom_level" not in st.session_state:
+        st.session_state.zoom_level = 3
+    if "zoom_tile" not in st.session_state:
+        st.session_state.zoom_tile = None  # (페이지, 정규화 타일 영역) — 확대 모드에서 표시 중인 타일
+    if "zoom_seq" not in st.session_state:
+        st.session_state.zoom_seq = 0      # 타일 전환마다 증가 → 클릭 위젯 키를 바꿔 이전 클릭이 다시 적용되지 않게
+    if "extract_mode" not in st.session_state:
+        st.session_state.extract_mode = "clip"
+    if "batch_workers" not in st.session_state:
+        st.session_state.batch_workers = BATCH_WORKERS_DEFAULT
+    if "use_cache" not in st.session_state:
+        st.session_state.use_cache = True
+    if "export_format" not in st.session_state:
+        st.session_state.export_format = "xlsx"
+    if "collect_metrics" not in st.session_state:
+        st.session_state.collect_metrics = True
+    if "auto_route" not in st.session_state:
+        st.session_state.auto_route = False
+    if "spill_uploads" not in st.session_state:
+        st.session_state.spill_uploads = True
+    if "run_in_background" not in st.session_state:
+        st.session_state.run_in_background = True
+    if "use_ledger" not in st.session_state:
+        st.session_state.use_ledger = True
+    if "use_ocr" not in st.session_state:
+        st.session_state.use_ocr = True
+    if "mem_budget_mb" not in st.session_state:
+        st.session_state.mem_budget_mb = BATCH_MEM_BUDGET // (1024 * 1024)
     if "lock_template" not in st.session_state:
         st.session_state.lock_template = True  # ✅ 기본: 마지막 템플릿 고정 사용
 
+def save_template(name: str) -> bool:
+    """
+    현재 좌표를 템플릿 1개로 저장 + 마지막 사용 지정. 내용이 같으면 새 버전을 만들지 않음.
+    다른 세션이 그 사이 같은 템플릿을 저장했으면 덮어쓰지 않고 False.
+    """
+    store = get_template_store()
+    payload = template_payload()
+    cur = store.all().get(name)
+    same = cur is not None and all(cur.get(k) == payload.get(k)
+                                   for k in ("dpi", "norm_rects", "fields", "fingerprint", "split", "field_pages"))
+    if not same:
+        base_name, base_version = st.session_state.get("tmpl_base", ("", None))
+        try:
+            version = store.save(name, payload, base_version=base_version if base_name == name else None)
+        except TemplateConflict as e:
+            st.error(f"{e} — 불러오기로 최신 버전을 확인한 뒤 다시 저장하세요.")
+            return False
+        st.session_state.tmpl_base = (name, version)
+    store.set_last_used(name)
+    return True
+
+
+def template_payload() -> dict:
+    """현재 세션 상태 → 저장/내보내기용 템플릿 dict."""
+    data = {
+        "created_at": datetime.now().isoformat(),
+        "dpi": st.session_state.tmpl_dpi,
+        "norm_rects": st.session_state.norm_rects,
+    }
+    if st.session_state.field_defs:
+        data["fields"] = st.session_state.field_defs
+    if st.session_state.get("tmpl_fingerprint"):
+        data["fingerprint"] = st.session_state.tmpl_fingerprint
+    if st.session_state.get("tmpl_split"):
+        data["split"] = st.session_state.tmpl_split
+    if st.session_state.get("tmpl_field_pages"):
+        data["field_pages"] = st.session_state.tmpl_field_pages
+    return data
+
 # =========================
-# 오버레이 렌더링 (저장 ROI + 임시 클릭점)
+# 대표 페이지 래스터 캐시 (재실행·세션 간 공유)
 # =========================
-def render_with_overlays(img_resized: Image.Image, w_orig: int, h_orig: int, ratio: float,
-                         norm_rects: Dict[str, List[float]], temp_points: List[Tuple[float, float]],
-                         current_field: str | None) -> Image.Image:
-    img = img_resized.copy()
-    draw = ImageDraw.Draw(img)
+@st.cache_resource(max_entries=RENDER_CACHE_MAX_ENTRIES, show_spinner=False)
+def render_page_for_display(file_hash: str, dpi: int, display_width: int,
+                            _file_bytes: bytes, page_no: int = 0) -> Tuple[Image.Image, int, int, float]:
+    """
+    (파일 해시, dpi, 표시 너비, 페이지)별로 표시 크기 그대로 렌더한 결과를 캐시 (dpi 래스터를 만들어 줄이지 않음).
+    반환: (표시용 이미지, 원본 폭, 원본 높이, 표시 배율) — 원본 = 템플릿 dpi 기준 픽셀 좌표(클릭 → 정규화 기준).
+    반환 이미지는 공유되므로 수정 금지(copy 후 사용).
+    """
+    img, page_rect = render_page_region(_file_bytes, display_width, page_no)
+    w, h = round(page_rect.width * dpi / 72), round(page_rect.height * dpi / 72)
+    return img, w, h, display_width / w
 
-    def to_disp(x, y):
-        return (x * ratio, y * ratio)
 
-    # 저장된 ROI 박스
+@st.cache_resource(max_entries=RENDER_CACHE_MAX_ENTRIES, show_spinner=False)
+def render_zoom_tile(file_hash: str, page_no: int, tile: Tuple[float, float, float, float], display_width: int,
+                     _file_bytes: bytes) -> Image.Image:
+    """확대 모드: 페이지의 타일 영역(정규화)만 표시 너비로 렌더 (페이지 전체를 고해상도로 그리지 않음)."""
+    return render_page_region(_file_bytes, display_width, page_no, list(tile))[0]
+
+
+def zoom_tile_rect(xn: float, yn: float, zoom: int) -> Tuple[float, float, float, float]:
+    """클릭 위치(정규화) 중심, 페이지의 1/zoom 크기 타일 (페이지 밖으로 나가지 않게 안쪽으로 밀어 넣음)."""
+    size = 1.0 / zoom
+    x0 = min(max(xn - size / 2, 0.0), 1.0 - size)
+    y0 = min(max(yn - size / 2, 0.0), 1.0 - size)
+    return round(x0, 4), round(y0, 4), round(x0 + size, 4), round(y0 + size, 4)
+
+
+@st.cache_resource(max_entries=RENDER_CACHE_MAX_ENTRIES, show_spinner=False)
+def rep_session(file_hash: str, _file_bytes: bytes) -> Tuple[PdfExtractionSession, threading.Lock]:
+    """
+    대표 PDF를 열어 둔 세션 + 단어 레이어 (파일 해시별 캐시, 재실행·세션 간 공유).
+    PyMuPDF 문서는 스레드 간 동시 사용 불가 → 반환된 lock 안에서만 사용.
+    """
+    sess = PdfExtractionSession(bytes(_file_bytes))
+    sess.word_grid()
+    return sess, threading.Lock()
+
+
+@st.cache_data(max_entries=RENDER_CACHE_MAX_ENTRIES, show_spinner=False)
+def rep_layout_fingerprint(file_hash: str, _file_bytes: bytes) -> dict:
+    """대표 PDF 레이아웃 지문 (파일 해시별 캐시, 미리보기와 같은 단어 레이어 사용)."""
+    sess, lock = rep_session(file_hash, _file_bytes=_file_bytes)
+    with lock:
+        return sess.fingerprint()
+
+
+def roi_preview(file_hash: str, file_bytes: bytes, norm_rects: Dict[str, List[float]],
+                field_defs: dict, field_pages: Dict[str, int] | None = None) -> Dict[str, Tuple[str, object]]:
+    """지정된 ROI별 (추출 원문, 정제 값) — 캐시된 단어 레이어(페이지별)로 계산해 클릭마다 수 ms."""
+    sess, lock = rep_session(file_hash, _file_bytes=file_bytes)
+    with lock:
+        return sess.preview(norm_rects, build_field_specs(field_defs), field_pages)
+
+
+def rep_page_count(file_hash: str, file_bytes: bytes) -> int:
+    """대표 PDF 페이지 수 (열어 둔 세션 재사용 — 페이지를 로드하지 않음)."""
+    return rep_session(file_hash, _file_bytes=file_bytes)[0].span
+
+# =========================
+# 오버레이 렌더링 (저장 ROI + 임시 클릭점)
+# =========================
+def draw_saved_rois(img: Image.Image, w_orig: int, h_orig: int, ratio: float,
+                    norm_rects: Dict[str, List[float]]) -> None:
+    """저장된 ROI 박스+라벨을 img 위에 그린다(제자리 수정)."""
+    draw = ImageDraw.Draw(img)
     for name, rect in norm_rects.items():
         color = FIELD_COLORS.get(name, "#FF00FF")
         x1n, y1n, x2n, y2n = rect
-        x1, y1 = x1n * w_orig, y1n * h_orig
-        x2, y2 = x2n * w_orig, y2n * h_orig
-        dx1, dy1 = to_disp(x1, y1); dx2, dy2 = to_disp(x2, y2)
+        dx1, dy1 = x1n * w_orig * ratio, y1n * h_orig * ratio
+        dx2, dy2 = x2n * w_orig * ratio, y2n * h_orig * ratio
         for off in range(2):
             draw.rectangle([dx1 - off, dy1 - off, dx2 + off, dy2 + off], outline=color, width=2)
         # 라벨
@@ -342,36 +350,260 @@ def render_with_overlays(img_resized: Image.Image, w_orig: int, h_orig: int, rat
         bx1, by1 = dx1, max(0, dy1 - (th + pad*2 + 2))
         bx2, by2 = dx1 + tw + pad*2, by1 + th + pad*2
         draw.rectangle([bx1, by1, bx2, by2], fill=color)
-        if PIL_LABEL_FONT:
-            draw.text((bx1 + pad, by1 + pad), label, fill="white", font=PIL_LABEL_FONT)
+        font = get_label_font()
+        if font:
+            draw.text((bx1 + pad, by1 + pad), label, fill="white", font=font)
         else:
             draw.text((bx1 + pad, by1 + pad), label, fill="white")
 
-    # 임시 클릭점/박스 (현재 필드)
-    if temp_points:
-        color = FIELD_COLORS.get(current_field or "", "#FF00FF")
-        if len(temp_points) == 1:
-            x, y = temp_points[0]
-            dx, dy = to_disp(x, y)
-            draw.line([dx - 12, dy, dx + 12, dy], fill=color, width=3)
-            draw.line([dx, dy - 12, dx, dy + 12], fill=color, width=3)
-            draw.ellipse([dx - 6, dy - 6, dx + 6, dy + 6], outline=color, width=3)
-        elif len(temp_points) == 2:
-            (x1, y1), (x2, y2) = temp_points
-            x1, x2 = sorted([x1, x2]); y1, y2 = sorted([y1, y2])
-            dx1, dy1 = to_disp(x1, y1); dx2, dy2 = to_disp(x2, y2)
-            for off in range(2):
-                draw.rectangle([dx1 - off, dy1 - off, dx2 + off, dy2 + off], outline=color, width=2)
-            for px, py in [(dx1, dy1), (dx2, dy2)]:
-                draw.ellipse([px - 5, py - 5, px + 5, py + 5], fill=color)
 
+def draw_temp_points(img: Image.Image, ratio: float, temp_points: List[Tuple[float, float]],
+                     current_field: str | None) -> None:
+    """임시 클릭점(십자)/박스를 img 위에 그린다(제자리 수정)."""
+    draw = ImageDraw.Draw(img)
+    color = FIELD_COLORS.get(current_field or "", "#FF00FF")
+    if len(temp_points) == 1:
+        x, y = temp_points[0]
+        dx, dy = x * ratio, y * ratio
+        draw.line([dx - 12, dy, dx + 12, dy], fill=color, width=3)
+        draw.line([dx, dy - 12, dx, dy + 12], fill=color, width=3)
+        draw.ellipse([dx - 6, dy - 6, dx + 6, dy + 6], outline=color, width=3)
+    elif len(temp_points) == 2:
+        (x1, y1), (x2, y2) = temp_points
+        x1, x2 = sorted([x1, x2]); y1, y2 = sorted([y1, y2])
+        dx1, dy1, dx2, dy2 = x1 * ratio, y1 * ratio, x2 * ratio, y2 * ratio
+        for off in range(2):
+            draw.rectangle([dx1 - off, dy1 - off, dx2 + off, dy2 + off], outline=color, width=2)
+        for px, py in [(dx1, dy1), (dx2, dy2)]:
+            draw.ellipse([px - 5, py - 5, px + 5, py + 5], fill=color)
+
+
+def rects_cache_key(norm_rects: Dict[str, List[float]]) -> Tuple:
+    """norm_rects 내용 기반 해시 가능 키."""
+    return tuple((name, tuple(rect)) for name, rect in sorted(norm_rects.items()))
+
+
+@st.cache_resource(max_entries=RENDER_CACHE_MAX_ENTRIES, show_spinner=False)
+def saved_roi_layer(file_hash: str, dpi: int, display_width: int, rects_key: Tuple,
+                    _img_resized: Image.Image, w_orig: int, h_orig: int, ratio: float,
+                    page_no: int = 0) -> Image.Image:
+    """
+    표시용 이미지 + 저장 ROI를 미리 합성해 캐시. 키: (파일 해시, dpi, 표시 너비, norm_rects 내용, 페이지).
+    반환 이미지는 공유되므로 수정 금지.
+    """
+    img = _img_resized.copy()
+    draw_saved_rois(img, w_orig, h_orig, ratio, dict(rects_key))
+    return img
+
+
+def render_with_overlays(img_resized: Image.Image, w_orig: int, h_orig: int, ratio: float,
+                         norm_rects: Dict[str, List[float]], temp_points: List[Tuple[float, float]],
+                         current_field: str | None, saved_layer: Image.Image | None = None) -> Image.Image:
+    """
+    저장 ROI 레이어 위에 임시 클릭 레이어만 덧그린다.
+    saved_layer(미리 합성된 저장 ROI 레이어)를 주면 저장 ROI는 다시 그리지 않는다.
+    """
+    if saved_layer is None:
+        img = img_resized.copy()
+        draw_saved_rois(img, w_orig, h_orig, ratio, norm_rects)
+    elif temp_points:
+        img = saved_layer.copy()
+    else:
+        return saved_layer
+    if temp_points:
+        draw_temp_points(img, ratio, temp_points, current_field)
     return img
 
 # =========================
 # 메인 UI
 # =========================
+def render_split_settings() -> None:
+    """여러 건이 합쳐진 PDF의 신고서 구분 규칙 (템플릿 "split")."""
+    split = st.session_state.tmpl_split
+    kinds = {"none": "파일 1개 = 신고서 1건", "pages": "N페이지마다 1건", "anchor": "구분 문구가 있는 페이지마다 새 건"}
+    cur = "pages" if "pages" in split else ("anchor" if "anchor" in split else "none")
+    with st.expander("📑 여러 건이 합쳐진 PDF 분할", expanded=cur != "none"):
+        kind = st.radio("신고서 구분", options=list(kinds), format_func=kinds.get, index=list(kinds).index(cur),
+                        horizontal=True)
+        if kind == "pages":
+            n = st.number_input("신고서 1건의 페이지 수", min_value=1, max_value=100, step=1,
+                                value=int(split.get("pages") or 1))
+            st.session_state.tmpl_split = {"pages": int(n)}
+        elif kind == "anchor":
+            text = st.text_input("구분 문구", value=split.get("anchor", ""), placeholder="예) 수입신고필증",
+                                 help="이 문구가 있는 페이지에서 새 신고서가 시작 (공백·대소문자 무시, 첫 문구 앞 페이지는 제외)")
+            st.session_state.tmpl_split = {"anchor": text.strip()}  # 빈 문구 = 파일 1개 1건
+        else:
+            st.session_state.tmpl_split = {}
+        st.caption("페이지는 필요할 때 1장씩 읽으므로 수백 페이지 파일도 한 번에 메모리에 올리지 않습니다. "
+                   "분할 규칙은 템플릿 저장 시 함께 기록됩니다.")
+
+
+def render_metrics_panel(metrics: StageMetrics) -> None:
+    """변환 후 '성능' 패널: 단계별 시간 백분위 · 카운터 · 느린 파일 · JSON/Prometheus 내려받기."""
+    summ = metrics.summary()
+    with st.expander("⏱️ 성능", expanded=False):
+        c = summ["counters"]
+        cols = st.columns(4)
+        cols[0].metric("파일", c.get("files", 0))
+        cols[1].metric("필드 (새로 클립)", f"{c.get('fields', 0)} ({c.get('clips', 0)})")
+        cols[2].metric("실패", c.get("failures", 0))
+        cols[3].metric("캐시 적중", f"{c.get('cache_hits', 0)}/{c.get('cache_hits', 0) + c.get('cache_misses', 0)}")
+        if summ["stages"]:
+            st.dataframe(pd.DataFrame.from_dict(summ["stages"], orient="index").rename_axis("단계"),
+                         use_container_width=True)
+        st.caption("batch = 변환 전체 경과(병렬 시 파일별 단계 합보다 짧음) · open은 PDF 열기+닫기")
+        slow = metrics.slowest_files(10)
+        if slow:
+            st.markdown("**느린 파일 (단계 합계)**")
+            st.dataframe(pd.DataFrame(slow, columns=["파일", "초"]), use_container_width=True, hide_index=True)
+        d1, d2 = st.columns(2)
+        with d1:
+            st.download_button("JSON", data=metrics.to_json(per_file=True), file_name="receipt_metrics.json",
+                               mime="application/json", use_container_width=True)
+        with d2:
+            st.download_button("Prometheus", data=metrics.to_prometheus(), file_name="receipt_metrics.prom",
+                               mime="text/plain", use_container_width=True)
+
+def render_download(df: pd.DataFrame, stem: str, key: str, specs: dict | None = None) -> None:
+    """
+    df → 선택한 내보내기 형식으로 임시 파일에 행 단위 기록 → 다운로드 버튼.
+    st.download_button은 파일 내용을 메모리에 올려 내려주므로 디스크 스트리밍 이점은 기록 단계까지 (대량은 CLI 권장).
+    """
+    fmt = st.session_state.export_format
+    hint = export_unavailable(fmt)
+    if hint:
+        st.error(hint)
+        return
+    label, ext, mime = EXPORT_FORMATS[fmt]
+    with ResultExporter(list(df.columns), fmt, specs=specs) as ex:
+        ex.write_frame(df)
+    try:
+        with open(ex.path, "rb") as fh:
+            st.download_button(f"⬇️ {label} 다운로드", data=fh, file_name=f"{stem}{ext}", mime=mime,
+                               use_container_width=True, key=key)
+    finally:
+        os.remove(ex.path)
+
+
+def render_results(res, templates: dict, auto: bool, fields: List[str], field_defs: dict,
+                   metrics: StageMetrics, key: str, batch_id: str | None = None) -> None:
+    """
+    변환 결과(BatchResult/RoutedBatchResult) → 검증·타입·정렬 후 표 · 점검 결과 · 다운로드 · 성능 패널.
+    batch_id가 있고 반입 이력 사용 시 지난 배치와의 B/L·신고번호 중복을 점검하고 이번 결과를 기록(같은 원본은 1건으로 갱신).
+    """
+    if not res.rows:
+        st.error("변환 가능한 결과가 없습니다.")
+        if res.issues:
+            st.warning("\n".join(res.issues))
+        return
+
+    # 열 단위 후처리: 형식 검증 → 네이티브 dtype 변환 → 신고일 정렬
+    with metrics.stage("frame"):
+        if auto:
+            df, specs = routed_frame(res, templates)
+        else:
+            df, specs = pd.DataFrame(res.rows, columns=fields), build_field_specs(field_defs)
+        issues = res.issues + validate_frame(df, res.names, specs)
+        df = sort_by_date(type_frame(df, specs))
+    history = []
+    if batch_id and st.session_state.use_ledger:
+        ledger = get_ledger()
+        history = ledger.duplicate_issues(res.rows, res.names, exclude_batch=batch_id, source_keys=res.source_keys)
+        ledger.record(res.rows, res.names, batch_id, getattr(res, "templates", None), res.source_keys)
+
+    # B/L 중복 경고
+    dup_mask = df["b/l(awb)번호"].duplicated(keep=False)
+    if dup_mask.any():
+        dupped = df.loc[dup_mask, "b/l(awb)번호"].unique().tolist()
+        st.warning(f"⚠️ 동일 B/L 번호 중복: {', '.join(dupped)}")
+    if history:
+        st.warning(f"📒 이전 반입 이력과 겹치는 B/L·신고번호 {len(history)}건 — 아래 점검 결과 참고")
+        issues += history
+
+    st.markdown("### ✅ 변환 결과")
+    if auto:
+        counts = df[TEMPLATE_COLUMN].value_counts()
+        st.caption("🧭 템플릿 판별: " + " · ".join(f"{k} {v}건" for k, v in counts.items()))
+    view = df.copy()
+    # 보기 포맷 (금액만 천단위 문자열, 날짜/환율은 column_config로 표시)
+    for k in ["부가가치세 과표", "관세", "부가가치세"]:
+        if k in view.columns:
+            view[k] = view[k].map("{:,.0f}".format, na_action="ignore").fillna("")
+    st.dataframe(view, use_container_width=True, column_config={
+        "신고일": st.column_config.DateColumn(format="YYYY/MM/DD"),
+        "환율": st.column_config.NumberColumn(format="%.4f"),
+    })
+
+    if issues:
+        st.markdown("### 🔎 점검 결과")
+        for line in issues:
+            st.write(line)
+
+    with metrics.stage("export"):
+        render_download(df, f"수입신고필증_추출_{datetime.now().strftime('%Y%m%d_%H%M%S')}", f"download_{key}", specs)
+
+    if metrics.enabled:
+        render_metrics_panel(metrics)
+
+
+def render_ledger_panel() -> None:
+    """'반입 이력' 패널: 신고일 기간 조회 → 대사용 내보내기."""
+    ledger = get_ledger()
+    with st.expander(f"📒 반입 이력 ({len(ledger):,}건)", expanded=False):
+        today = datetime.now().date()
+        period = st.date_input("신고일 기간", value=(today - timedelta(days=30), today), key="ledger_period")
+        if len(period) != 2:
+            st.caption("시작일과 종료일을 선택하세요.")
+            return
+        if st.button("🔍 기간 조회", key="ledger_query"):
+            df = type_frame(ledger.query(period[0].isoformat(), period[1].isoformat()))
+            st.caption(f"{len(df):,}건")
+            st.dataframe(df.head(200), use_container_width=True, hide_index=True)
+            render_download(df, f"반입이력_{period[0]:%Y%m%d}_{period[1]:%Y%m%d}", "ledger_download")
+
+
+def render_jobs_panel() -> None:
+    """'변환 작업' 목록: 진행률 · 중지/재개 · 결과 보기(부분 결과 포함) · 삭제. st.fragment로 감싸 주기적으로 갱신."""
+    runner = get_job_runner()
+    jobs = runner.store.list_jobs(JOBS_PANEL_LIMIT)
+    with st.expander("🗂️ 변환 작업", expanded=True):
+        for job in jobs:
+            jid, running = job["id"], runner.is_running(job["id"])
+            cT, cP, cA, cB, cV = st.columns([2, 2, 1, 1, 1])
+            cT.markdown(f"**{job['title']}**  \n{JOB_STATUS_LABELS[job['status']]}"
+                        f" · {datetime.fromtimestamp(job['created']):%m/%d %H:%M}")
+            cP.progress(job["done"] / job["total"] if job["total"] else 1.0, text=f"{job['done']}/{job['total']}")
+            if job["error"]:
+                cP.caption(f"❌ {job['error']}")
+            if running:
+                if cA.button("⏸ 중지", key=f"job_stop_{jid}", use_container_width=True):
+                    runner.stop(jid)
+            elif job["done"] < job["total"]:
+                if cA.button("▶ 재개", key=f"job_resume_{jid}", use_container_width=True):
+                    runner.start(jid)
+                    st.rerun()  # 앱 전체 재실행 → 진행 중 갱신 주기 적용
+            if not running and cB.button("🗑️", key=f"job_del_{jid}", use_container_width=True, help="작업 삭제"):
+                runner.store.delete(jid)
+                if st.session_state.get("view_job") == jid:
+                    st.session_state.view_job = None
+                st.rerun()
+            if job["done"] and cV.button("결과 보기", key=f"job_view_{jid}", use_container_width=True):
+                st.session_state.view_job = jid
+                st.rerun()
+        # 보고 있는 작업이 방금 끝났으면 앱 전체를 다시 그려 최종 결과 표시 + 갱신 중지
+        viewing = st.session_state.get("view_job")
+        if viewing and st.session_state.get("view_job_running") and not runner.is_running(viewing):
+            st.session_state.view_job_running = False
+            st.rerun()
+        st.session_state.view_job_running = bool(viewing and runner.is_running(viewing))
+        st.caption("작업은 서버에서 계속 진행되며, 처리한 파일은 즉시 저장되어 새로고침·재시작 후에도 이어서 처리합니다.")
+
 def main():
+    st.set_page_config(page_title="수입신고필증 PDF → 엑셀 (ROI 템플릿)", page_icon="📄", layout="wide")
+    apply_ui_fonts()
     ensure_state()
+    fields = template_fields(st.session_state.field_defs)
 
     st.markdown("""
     <h1 style="text-align:center;margin-bottom:0.5rem;">📄 수입신고필증 PDF → 엑셀 (전 항목 ROI 템플릿)</h1>
@@ -394,16 +626,9 @@ def main():
                 name = st.session_state.template_name.strip()
                 if not name:
                     st.warning("템플릿 이름을 입력하세요.")
-                elif len(st.session_state.norm_rects) < len(FIELDS):
+                elif any(f not in st.session_state.norm_rects for f in fields):
                     st.warning("모든 필드 좌표를 먼저 지정하세요.")
-                else:
-                    tmpls = st.session_state.all_templates
-                    tmpls[name] = {
-                        "created_at": datetime.now().isoformat(),
-                        "dpi": st.session_state.tmpl_dpi,
-                        "norm_rects": st.session_state.norm_rects,
-                    }
-                    set_last_used(tmpls, name)
+                elif save_template(name):
                     st.success(f"저장 & 마지막 사용 지정: {name}")
 
         with c3:
@@ -414,16 +639,14 @@ def main():
                     data = json.loads(up.read().decode("utf-8"))
                     st.session_state.tmpl_dpi = data.get("dpi", DPI_DEFAULT)
                     st.session_state.norm_rects = data.get("norm_rects", {})
+                    st.session_state.field_defs = data.get("fields", {})
+                    st.session_state.tmpl_fingerprint = data.get("fingerprint")
+                    st.session_state.tmpl_split = data.get("split") or {}
+                    st.session_state.tmpl_field_pages = data.get("field_pages") or {}
                     if st.session_state.template_name.strip():
                         name = st.session_state.template_name.strip()
-                        tmpls = st.session_state.all_templates
-                        tmpls[name] = {
-                            "created_at": datetime.now().isoformat(),
-                            "dpi": st.session_state.tmpl_dpi,
-                            "norm_rects": st.session_state.norm_rects,
-                        }
-                        set_last_used(tmpls, name)
-                        st.success(f"가져온 좌표를 '{name}' 이름으로 저장 & 사용")
+                        if save_template(name):
+                            st.success(f"가져온 좌표를 '{name}' 이름으로 저장 & 사용")
                     else:
                         st.info("좌측에 템플릿 이름을 입력하면 가져온 좌표를 바로 저장할 수 있어요.")
                 except Exception as e:
@@ -432,11 +655,7 @@ def main():
         with c4:
             # 템플릿 내보내기(JSON)
             if st.session_state.norm_rects:
-                export_data = {
-                    "created_at": datetime.now().isoformat(),
-                    "dpi": st.session_state.tmpl_dpi,
-                    "norm_rects": st.session_state.norm_rects,
-                }
+                export_data = template_payload()
                 st.download_button(
                     "⬇️ 내보내기",
                     data=json.dumps(export_data, ensure_ascii=False, indent=2).encode("utf-8"),
@@ -446,7 +665,10 @@ def main():
                 )
 
         # 기존 템플릿 선택/전환/삭제
-        tmpls = st.session_state.all_templates
+        store = get_template_store()
+        if store.migration_error:
+            st.warning(f"{store.migration_error} — 기존 JSON은 그대로 두었습니다. 파일을 고친 뒤 앱을 다시 시작하세요.")
+        tmpls = store.all()
         names = sorted([n for n in tmpls.keys() if n != "__meta"])
         last_used = get_last_used(tmpls)
 
@@ -457,36 +679,30 @@ def main():
         with cM:
             if st.button("📂 불러오기", use_container_width=True):
                 if sel != "(선택 없음)":
-                    data = tmpls.get(sel)
-                    st.session_state.template_name = sel
-                    st.session_state.tmpl_dpi = data.get("dpi", DPI_DEFAULT)
-                    st.session_state.norm_rects = data.get("norm_rects", {})
-                    st.session_state.current_field_idx = 0
-                    st.session_state.click_phase = 0
-                    st.session_state.temp_points = []
-                    set_last_used(tmpls, sel)
-                    st.success(f"불러오기 & 마지막 사용 지정: {sel}")
+                    store.set_last_used(sel)
+                    queue_template_load(sel, tmpls[sel], f"불러오기 & 마지막 사용 지정: {sel}")
                 else:
                     st.info("불러올 템플릿을 선택하세요.")
         with cR:
             if st.button("🗑️ 삭제", use_container_width=True):
                 if sel != "(선택 없음)" and sel in tmpls:
-                    del tmpls[sel]
-                    save_all_templates(tmpls)
+                    store.delete(sel)
                     if st.session_state.template_name == sel:
-                        st.session_state.template_name = ""
-                        st.session_state.norm_rects = {}
+                        queue_template_load("", {}, f"삭제 완료: {sel}")
                     st.success(f"삭제 완료: {sel}")
                 else:
                     st.info("삭제할 템플릿을 선택하세요.")
         with cD:
             if st.button("⭐ 마지막 사용으로 지정", use_container_width=True):
                 if sel != "(선택 없음)":
-                    set_last_used(tmpls, sel)
+                    store.set_last_used(sel)
                     st.success(f"이 템플릿을 다음에도 자동 사용: {sel}")
                 else:
                     st.info("지정할 템플릿을 선택하세요.")
 
+        if sel != "(선택 없음)":
+            st.caption(f"'{sel}' v{tmpls[sel].get('version', 1)} · 저장할 때마다 버전이 올라가며 최근 "
+                       f"{TEMPLATE_KEEP_VERSIONS}개 버전을 보관합니다.")
         st.caption("※ '마지막 사용'으로 지정된 템플릿은 앱을 다시 켜도 자동 적용됩니다.")
 
     st.markdown("---")
@@ -501,52 +717,113 @@ def main():
     # ----------------------
     show_roi_section = not st.session_state.lock_template
     if show_roi_section:
-        st.markdown("### 🎯 좌표 지정 (대표 PDF 1페이지 기준)")
-        st.caption("필드 순서: " + " → ".join(FIELDS))
+        st.markdown("### 🎯 좌표 지정 (대표 PDF 신고서 1건 기준)")
+        st.caption("필드 순서: " + " → ".join(fields))
+        render_split_settings()
 
         rep_bytes = None
         if files:
             rep = files[0]
             rep_bytes = rep.getvalue() if hasattr(rep, "getvalue") else rep.read()
-            img, w, h, page_rect = pdf_first_page_pix(rep_bytes, dpi=st.session_state.tmpl_dpi)
-
             disp_w = st.slider("표시 너비(px)", min_value=600, max_value=1600,
                                value=st.session_state.display_width, step=50)
             st.session_state.display_width = disp_w
-            ratio = disp_w / w
-            img_resized = img.resize((disp_w, int(h * ratio)))
+            rep_hash = pdf_sha256(rep_bytes)
+            # 대표 PDF 레이아웃 지문 → 저장 시 템플릿에 함께 기록 (혼합 배치 자동 판별용)
+            st.session_state.tmpl_fingerprint = rep_layout_fingerprint(rep_hash, _file_bytes=rep_bytes)
+            # 신고서가 여러 페이지면 필드마다 페이지를 골라 지정 (지정한 페이지가 템플릿 field_pages로 저장)
+            n_pages = rep_page_count(rep_hash, rep_bytes)
+            page_no = 0
+            if n_pages > 1:
+                st.session_state.rep_page = min(st.session_state.rep_page, n_pages)
+                st.number_input(f"페이지 (1~{n_pages})", min_value=1, max_value=n_pages, step=1, key="rep_page",
+                                help="이 페이지에서 지정한 ROI는 신고서 안 같은 순번 페이지에서 추출")
+                page_no = st.session_state.rep_page - 1
+            field_pages = st.session_state.tmpl_field_pages
+            page_rects = {k: r for k, r in st.session_state.norm_rects.items() if field_pages.get(k, 0) == page_no}
+            img_resized, w, h, ratio = render_page_for_display(rep_hash, st.session_state.tmpl_dpi, disp_w,
+                                                               _file_bytes=rep_bytes, page_no=page_no)
 
             # 진행 현황
-            done_cnt = sum(1 for f in FIELDS if f in st.session_state.norm_rects)
-            st.progress(done_cnt / len(FIELDS))
-            st.write(f"완료 {done_cnt}/{len(FIELDS)}")
+            done_cnt = sum(1 for f in fields if f in st.session_state.norm_rects)
+            st.progress(done_cnt / len(fields))
+            st.write(f"완료 {done_cnt}/{len(fields)}")
 
             # 현재 필드
-            current_field = FIELDS[st.session_state.current_field_idx] if st.session_state.current_field_idx < len(FIELDS) else None
+            current_field = fields[st.session_state.current_field_idx] if st.session_state.current_field_idx < len(fields) else None
             if current_field:
                 st.info(f"🖱️ {current_field} 영역을 지정하세요 — 먼저 **좌상단**, 다음 **우하단**")
             else:
                 st.success("✅ 모든 필드 좌표 지정 완료!")
 
-            # 오버레이 이미지
-            overlay = render_with_overlays(
-                img_resized, w_orig=w, h_orig=h, ratio=ratio,
-                norm_rects=st.session_state.norm_rects,
-                temp_points=st.session_state.temp_points[:],
-                current_field=current_field
-            )
+            # 확대 모드: 전체 페이지에서 확대할 곳을 클릭 → 그 주변 타일만 고해상도로 렌더해 좌상단/우하단 지정
+            cZ1, cZ2, cZ3 = st.columns([1, 2, 1])
+            with cZ1:
+                st.checkbox("🔍 확대 모드", key="zoom_mode", help="작은 칸(환율 등)을 정확히 지정할 때 — 먼저 확대할 곳을 클릭")
+            with cZ2:
+                if st.session_state.zoom_mode:
+                    st.select_slider("확대 배율", options=list(ZOOM_LEVELS), key="zoom_level",
+                                     format_func=lambda z: f"{z}배")
+            tile = st.session_state.zoom_tile if st.session_state.zoom_mode else None
+            if tile and tile[0] != page_no:
+                tile = None
+            with cZ3:
+                if tile and st.button("↩ 전체 페이지", use_container_width=True):
+                    st.session_state.zoom_tile = None
+                    st.session_state.zoom_seq += 1
+                    st.rerun()
+
+            # 오버레이 이미지 (to_orig: 표시 좌표 → 원본 w×h 좌표)
+            if tile:
+                tx0, ty0, tx1, ty1 = tile[1]
+                tw, th = tx1 - tx0, ty1 - ty0
+                view = render_zoom_tile(rep_hash, page_no, tile[1], disp_w, _file_bytes=rep_bytes)
+                vw, vh = view.size
+                # 저장 ROI·임시 점을 타일 기준 좌표로 옮겨 같은 그리기 함수 사용 (배율 1)
+                tile_rects = {k: [(r[0] - tx0) / tw, (r[1] - ty0) / th, (r[2] - tx0) / tw, (r[3] - ty0) / th]
+                              for k, r in page_rects.items()}
+                tile_points = [((x / w - tx0) / tw * vw, (y / h - ty0) / th * vh)
+                               for x, y in st.session_state.temp_points]
+                overlay = render_with_overlays(view, w_orig=vw, h_orig=vh, ratio=1.0, norm_rects=tile_rects,
+                                               temp_points=tile_points, current_field=current_field)
+                st.caption(f"🔍 {st.session_state.zoom_level}배 확대 중 — 영역 지정이 끝나면 전체 페이지로 돌아갑니다.")
+
+                def to_orig(cx: float, cy: float) -> Tuple[float, float]:
+                    return (tx0 + cx / vw * tw) * w, (ty0 + cy / vh * th) * h
+            else:
+                saved_layer = saved_roi_layer(rep_hash, st.session_state.tmpl_dpi, disp_w,
+                                              rects_cache_key(page_rects),
+                                              _img_resized=img_resized, w_orig=w, h_orig=h, ratio=ratio,
+                                              page_no=page_no)
+                overlay = render_with_overlays(
+                    img_resized, w_orig=w, h_orig=h, ratio=ratio,
+                    norm_rects=page_rects,
+                    temp_points=st.session_state.temp_points[:],
+                    current_field=current_field,
+                    saved_layer=saved_layer,
+                )
+
+                def to_orig(cx: float, cy: float) -> Tuple[float, float]:
+                    return cx / ratio, cy / ratio
 
             # 클릭 수집
             from streamlit_image_coordinates import streamlit_image_coordinates
             clicked = streamlit_image_coordinates(
                 overlay,
                 key=f"coord_{st.session_state.current_field_idx}_{st.session_state.click_phase}"
+                    f"_{st.session_state.zoom_seq}"
             )
 
             # 클릭 처리
+            if clicked and current_field and st.session_state.zoom_mode and not tile:
+                # 확대할 곳 선택 → 타일로 다시 그림
+                st.session_state.zoom_tile = (page_no, zoom_tile_rect(clicked["x"] / img_resized.width,
+                                                                      clicked["y"] / img_resized.height,
+                                                                      st.session_state.zoom_level))
+                st.session_state.zoom_seq += 1
+                st.rerun()
             if clicked and current_field:
-                ox = clicked["x"] / ratio
-                oy = clicked["y"] / ratio
+                ox, oy = to_orig(clicked["x"], clicked["y"])
                 if st.session_state.click_phase == 0:
                     st.session_state.temp_points = [(ox, oy)]
                     st.session_state.click_phase = 1
@@ -558,10 +835,19 @@ def main():
                     xn1, yn1 = x1 / w, y1 / h
                     xn2, yn2 = x2 / w, y2 / h
                     st.session_state.norm_rects[current_field] = [xn1, yn1, xn2, yn2]
+                    if page_no:
+                        field_pages[current_field] = page_no
+                    else:
+                        field_pages.pop(current_field, None)
                     st.session_state.temp_points = []
                     st.session_state.click_phase = 0
                     st.session_state.current_field_idx += 1
-                    st.toast(f"{current_field} 좌표 저장!")
+                    if tile:
+                        st.session_state.zoom_tile = None
+                        st.session_state.zoom_seq += 1
+                    raw, value = roi_preview(rep_hash, rep_bytes, {current_field: [xn1, yn1, xn2, yn2]},
+                                             st.session_state.field_defs, {current_field: page_no})[current_field]
+                    st.toast(f"{current_field} 좌표 저장! → {value if value != '' else '(빈 값)'}")
 
             # 단축 버튼
             colA, colB, colC, colD = st.columns(4)
@@ -572,34 +858,44 @@ def main():
                     st.session_state.temp_points = []
             with colB:
                 if st.button("⏭ 다음 필드", use_container_width=True):
-                    st.session_state.current_field_idx = min(len(FIELDS) - 1, st.session_state.current_field_idx + 1)
+                    st.session_state.current_field_idx = min(len(fields) - 1, st.session_state.current_field_idx + 1)
                     st.session_state.click_phase = 0
                     st.session_state.temp_points = []
             with colC:
                 if st.button("🧹 현재 필드 좌표 삭제", use_container_width=True):
                     if current_field and current_field in st.session_state.norm_rects:
                         del st.session_state.norm_rects[current_field]
+                        field_pages.pop(current_field, None)
                         st.session_state.temp_points = []
                         st.session_state.click_phase = 0
                         st.toast(f"{current_field} 좌표 삭제")
             with colD:
                 if st.button("🔁 전체 좌표 초기화", use_container_width=True):
                     st.session_state.norm_rects = {}
+                    st.session_state.tmpl_field_pages = {}
                     st.session_state.current_field_idx = 0
                     st.session_state.click_phase = 0
                     st.session_state.temp_points = []
                     st.success("전체 좌표 초기화 완료")
 
-            # 저장된 좌표 테이블
+            # 저장된 좌표 테이블 + 대표 PDF 추출 미리보기 (배치 전에 ROI 어긋남 확인)
             if st.session_state.norm_rects:
-                st.markdown("#### 📋 저장된 좌표(정규화)")
+                st.markdown("#### 📋 저장된 좌표(정규화) · 추출 미리보기")
+                preview = roi_preview(rep_hash, rep_bytes, st.session_state.norm_rects, st.session_state.field_defs,
+                                      field_pages)
+                specs = build_field_specs(st.session_state.field_defs)
                 rows = []
-                for k in FIELDS:
+                for k in fields:
                     rect = st.session_state.norm_rects.get(k)
                     if rect:
                         xn1, yn1, xn2, yn2 = rect
-                        rows.append({"필드": k, "x1": round(xn1, 4), "y1": round(yn1, 4),
-                                     "x2": round(xn2, 4), "y2": round(yn2, 4)})
+                        raw, value = preview[k]
+                        issues = validate_row(getattr(rep, "name", "대표 PDF"), {k: value}, specs)
+                        rows.append({"필드": k, "페이지": field_pages.get(k, 0) + 1,
+                                     "x1": round(xn1, 4), "y1": round(yn1, 4),
+                                     "x2": round(xn2, 4), "y2": round(yn2, 4),
+                                     "추출 원문": raw, "정제 값": "" if value is None else str(value),
+                                     "점검": "⚠️" if issues else ("✅" if raw else "빈 영역")})
                 st.dataframe(pd.DataFrame(rows), use_container_width=True)
         else:
             st.info("대표 PDF를 포함해 파일을 업로드하세요.")
@@ -611,99 +907,149 @@ def main():
     # ----------------------
     # 변환 실행
     # ----------------------
+    if files:
+        cX, cW, cC = st.columns([3, 1, 1])
+        with cX:
+            st.radio("추출 방식", options=list(EXTRACT_MODES), format_func=EXTRACT_MODES.get,
+                     key="extract_mode", horizontal=True)
+            n_fp = len(TemplateIndex(get_template_store().all()))
+            st.checkbox("템플릿 자동 판별 (양식 혼합 배치)", key="auto_route",
+                        help="파일마다 레이아웃 지문(페이지 크기·앵커 라벨 위치)으로 저장된 템플릿을 골라 한 번에 변환. "
+                             "판별 실패 파일은 현재 템플릿으로 처리")
+            if st.session_state.auto_route:
+                st.caption(f"지문 등록 템플릿 {n_fp}개 — 지문은 좌표 지정 화면의 대표 PDF로 템플릿 저장 시 기록됩니다.")
+        with cW:
+            st.number_input("병렬 작업 수", min_value=1, max_value=max(BATCH_WORKERS_DEFAULT, 1) * 2,
+                            step=1, key="batch_workers", help="동시에 변환할 프로세스 수 (1 = 순차)")
+            st.number_input("동시 처리 한도(MB)", min_value=16, max_value=8192, step=16, key="mem_budget_mb",
+                            help="병렬 변환 중 워커에 동시에 맡기는 PDF 크기 합 상한 — 넘으면 앞 파일이 끝날 때까지 대기")
+            st.checkbox("백그라운드 작업으로 실행", key="run_in_background",
+                        help="작업 폴더에 업로드를 저장하고 서버에서 변환 — 새로고침·화면 조작에도 계속 진행되며 "
+                             "파일별로 저장되어 중단 후 이어서 처리")
+            st.checkbox("업로드를 디스크에 두고 처리", key="spill_uploads",
+                        disabled=st.session_state.run_in_background,
+                        help="업로드를 임시 폴더에 저장한 뒤 경로로 열어 메모리 사본을 줄임 (대량 업로드 권장)")
+        with cC:
+            st.selectbox("내보내기 형식", options=list(EXPORT_FORMATS),
+                         format_func=lambda k: EXPORT_FORMATS[k][0] + (" — pyarrow 필요" if export_unavailable(k)
+                                                                       else ""),
+                         key="export_format")
+            st.checkbox("추출 캐시 사용", key="use_cache",
+                        help="같은 PDF·같은 템플릿은 이전 추출 결과를 재사용")
+            if st.button("🧽 캐시 비우기", use_container_width=True):
+                get_extraction_cache().clear()
+                st.toast("추출 캐시를 비웠습니다.")
+            st.checkbox("스캔본 OCR", key="use_ocr", disabled=not ocr_available(),
+                        help="텍스트 레이어가 없는 PDF는 ROI만 고해상도로 잘라 OCR로 읽음"
+                             + ("" if ocr_available() else " — pytesseract·tesseract(한국어 데이터) 설치 필요"))
+            st.checkbox("반입 이력 중복 검사·기록", key="use_ledger",
+                        help="변환 결과를 반입 이력에 기록하고, 지난 배치와 B/L·신고번호가 겹치면 점검 결과에 표시")
+            st.checkbox("성능 측정", key="collect_metrics",
+                        help="단계별 소요 시간(PDF 열기·클립·후처리·프레임·내보내기)을 변환 후 '성능' 패널에 표시")
+
     if files and st.button("🚀 변환 시작", type="primary", use_container_width=True):
-        if not st.session_state.norm_rects or any(f not in st.session_state.norm_rects for f in FIELDS):
+        tmpls = get_template_store().all()
+        auto = st.session_state.auto_route and len(TemplateIndex(tmpls)) > 0
+        complete = bool(st.session_state.norm_rects) and all(f in st.session_state.norm_rects for f in fields)
+        if not complete and not auto:
             st.error("모든 필드의 좌표가 지정되지 않았어요. '템플릿 고정 사용'을 끄고 ROI를 먼저 지정/저장하세요.")
             st.stop()
+        if st.session_state.auto_route and not auto:
+            st.warning("지문이 등록된 템플릿이 없어 현재 템플릿으로 변환합니다.")
+        # 판별 실패 파일은 저장된 현재 템플릿으로 (없으면 점검 결과에 실패로 표시)
+        fallback = st.session_state.template_name if complete and st.session_state.template_name in tmpls else None
+        mem_budget = int(st.session_state.mem_budget_mb) * 1024 * 1024
+
+        if st.session_state.run_in_background:
+            # 작업 폴더로 복사 후 백그라운드 스레드에서 변환 → 새로고침/위젯 조작과 무관하게 진행, 파일별 체크포인트
+            if auto:
+                job_tmpls = {k: v for k, v in tmpls.items() if k != "__meta"}
+            else:
+                fallback = st.session_state.template_name.strip() or CURRENT_TEMPLATE_KEY
+                job_tmpls = {fallback: template_payload()}
+            spec = {"templates": job_tmpls, "template": fallback, "auto": auto,
+                    "mode": st.session_state.extract_mode, "workers": int(st.session_state.batch_workers),
+                    "mem_budget": mem_budget, "use_cache": st.session_state.use_cache,
+                    "ocr": st.session_state.use_ocr}
+            title = f"{getattr(files[0], 'name', '파일')} 외 {len(files) - 1}건" if len(files) > 1 \
+                else getattr(files[0], "name", "파일")
+            st.session_state.view_job = get_job_runner().submit(
+                title, [(getattr(f, "name", "파일"), f) for f in files], spec)
+            st.toast("백그라운드 작업으로 등록했습니다. 아래 '변환 작업'에서 진행 상황을 확인하세요.")
+        else:
+            # 대용량: 업로드를 임시 폴더로 옮겨 경로로 처리 (파일별 바이트 사본을 만들지 않음)
+            spill_dir = tempfile.mkdtemp(prefix="receipt_upload_") if st.session_state.spill_uploads else None
+            prog = st.progress(0.0, text="변환 준비 중…")
 
-        rows, issues = [], []
-        for f in files:
-            try:
-                f_bytes = f.getvalue() if hasattr(f, "getvalue") else f.read()
-                # 페이지 rect
-                _, _, _, page_rect = pdf_first_page_pix(f_bytes, dpi=st.session_state.tmpl_dpi)
-
-                data = {}
-                for name in FIELDS:
-                    rect = st.session_state.norm_rects[name]
-                    raw = clip_text_by_norm_rect(f_bytes, rect, page_rect)
-                    data[name] = postprocess_field(name, raw)
-
-                # 형식 검증
-                if data["신고일"] and not re.match(r'^\d{4}/\d{2}/\d{2}$', data["신고일"]):
-                    issues.append(f"⚠️ {getattr(f,'name','파일')} : 신고일 형식 확인 → {data['신고일']}")
-                for k in ["환율", "부가가치세 과표", "관세", "부가가치세"]:
-                    if data[k] is None or data[k] == "":
-                        issues.append(f"⚠️ {getattr(f,'name','파일')} : {k} 인식 실패/형식 오류")
-
-                rows.append(data)
-
-            except Exception as e:
-                issues.append(f"❌ {getattr(f,'name','파일')} 처리 오류: {e}")
-
-        if not rows:
-            st.error("변환 가능한 결과가 없습니다.")
-            if issues:
-                st.warning("\n".join(issues))
-            st.stop()
-
-        df = pd.DataFrame(rows, columns=FIELDS)
-
-        # B/L 중복 경고
-        dup_mask = df["b/l(awb)번호"].duplicated(keep=False)
-        if dup_mask.any():
-            dupped = df.loc[dup_mask, "b/l(awb)번호"].unique().tolist()
-            st.warning(f"⚠️ 동일 B/L 번호 중복: {', '.join(dupped)}")
+            def _on_progress(done: int, total: int, name: str):
+                prog.progress(done / total, text=f"변환 중 {done}/{total} — {name}")
 
-        # 신고일 오름차순
-        def to_date(s):
+            cache = get_extraction_cache() if st.session_state.use_cache else None
+            # 캐시는 세션·백그라운드 작업이 공유 → 이번 변환 적중 수는 이 변환의 카운터로 집계
+            metrics = StageMetrics(enabled=st.session_state.collect_metrics, counters=True)
             try:
-                return datetime.strptime(s, "%Y/%m/%d")
-            except Exception:
-                return datetime.max
-        df = df.sort_values(by="신고일", key=lambda col: col.map(to_date))
-
-        st.markdown("### ✅ 변환 결과")
-        view = df.copy()
-        # 보기 포맷
-        view["환율"] = view["환율"].map(lambda x: f"{x:.4f}" if isinstance(x, (int, float)) else "")
-        for k in ["부가가치세 과표", "관세", "부가가치세"]:
-            view[k] = view[k].map(lambda x: f"{int(x):,}" if pd.notnull(x) and x != "" else "")
-        st.dataframe(view, use_container_width=True)
-
-        if issues:
-            st.markdown("### 🔎 점검 결과")
-            for line in issues:
-                st.write(line)
-
-        # 엑셀 다운로드(원본 df 사용)
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            df.to_excel(writer, sheet_name="results", index=False)
-            wb = writer.book
-            ws = writer.sheets["results"]
-            money_fmt = wb.add_format({'num_format': '#,##0'})
-            fx_fmt = wb.add_format({'num_format': '0.0000'})
-            date_fmt = wb.add_format({'num_format': 'yyyy/mm/dd'})
-            col_idx = {c: i for i, c in enumerate(df.columns)}
-            if "환율" in col_idx:
-                ws.set_column(col_idx["환율"], col_idx["환율"], 12, fx_fmt)
-            for k in ["부가가치세 과표", "관세", "부가가치세"]:
-                if k in col_idx:
-                    ws.set_column(col_idx[k], col_idx[k], 14, money_fmt)
-            if "신고일" in col_idx:
-                ws.set_column(col_idx["신고일"], col_idx["신고일"], 12, date_fmt)
-            ws.set_column(0, len(df.columns) - 1, 16)
-
-        st.download_button(
-            "⬇️ 엑셀(.xlsx) 다운로드",
-            data=buffer.getvalue(),
-            file_name=f"수입신고필증_추출_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
-
-    st.caption("ⓘ 전역 폰트는 '맑은 고딕' 우선이며, 서버에 없으면 Noto/Nanum으로 자동 폴백합니다. PIL 라벨도 같은 폰트를 사용해 한글이 깨지지 않습니다. 템플릿은 '마지막 사용'으로 지정 시 앱 재시작 후에도 자동 적용됩니다.")
+                if spill_dir:
+                    items = spill_to_dir([(getattr(f, "name", "파일"), f) for f in files], spill_dir)
+                else:
+                    items = [(getattr(f, "name", "파일"), f.getvalue() if hasattr(f, "getvalue") else f.read())
+                             for f in files]
+                if auto:
+                    res = run_routed_batch(items, tmpls, mode=st.session_state.extract_mode,
+                                           workers=st.session_state.batch_workers, on_progress=_on_progress,
+                                           cache=cache, validate=False, fallback=fallback, metrics=metrics,
+                                           mem_budget=mem_budget, ocr=st.session_state.use_ocr)
+                else:
+                    # 여러 건이 합쳐진 PDF → 템플릿 분할 규칙으로 신고서 단위로 나눔
+                    units, _, split_issues = split_declarations(items, st.session_state.tmpl_split)
+                    res = run_batch(units, st.session_state.norm_rects, fields,
+                                    mode=st.session_state.extract_mode,
+                                    workers=st.session_state.batch_workers,
+                                    on_progress=_on_progress,
+                                    cache=cache, dpi=st.session_state.tmpl_dpi,
+                                    field_defs=st.session_state.field_defs,
+                                    validate=False, metrics=metrics, mem_budget=mem_budget,
+                                    field_pages=st.session_state.tmpl_field_pages, ocr=st.session_state.use_ocr)
+                    res = res._replace(issues=split_issues + res.issues)
+            finally:
+                if spill_dir:
+                    shutil.rmtree(spill_dir, ignore_errors=True)
+            prog.empty()
+            if cache:
+                cs = cache.stats()
+                c = metrics.counters
+                st.caption(f"🗄️ 추출 캐시 — 이번 변환: 적중 {c['cache_hits']} / 미적중 {c['cache_misses']}"
+                           f" (새로 클립한 필드 {c['clips']}개)"
+                           f" · 누적: 적중 {cs['hits']} / 미적중 {cs['misses']}"
+                           f" · 저장 {cs['entries']}건 ({cs['bytes'] / 1024 / 1024:.1f}MB)")
+            st.session_state.view_job = None
+            render_results(res, tmpls, auto, fields, st.session_state.field_defs, metrics, key="sync",
+                           batch_id=uuid.uuid4().hex)
+
+    # ----------------------
+    # 백그라운드 변환 작업 (진행 중이면 2초마다 상태 갱신)
+    # ----------------------
+    runner = get_job_runner()
+    jobs = runner.store.list_jobs(JOBS_PANEL_LIMIT)
+    if jobs:
+        polling = any(runner.is_running(j["id"]) for j in jobs)
+        st.fragment(run_every=JOBS_POLL_SECONDS if polling else None)(render_jobs_panel)()
+
+    job_id = st.session_state.get("view_job")
+    job = runner.store.get(job_id) if job_id else None
+    if job:
+        spec = job["spec"]
+        t = spec["templates"].get(spec["template"]) or {}
+        res = runner.store.results(job["id"])
+        if job["done"] < job["total"]:
+            st.info(f"부분 결과: {job['done']}/{job['total']}건 처리됨 ({JOB_STATUS_LABELS[job['status']]})")
+        if res.rows or not runner.is_running(job["id"]):
+            render_results(res, spec["templates"], spec["auto"], template_fields(t.get("fields")),
+                           t.get("fields") or {}, StageMetrics(enabled=False), key=f"job_{job['id']}",
+                           batch_id=job["id"])
+
+    render_ledger_panel()
+
+    st.caption("ⓘ 전역 폰트는 '맑은 고딕' 우선이며, 서버에 없으면 Noto/Nanum으로 자동 폴백합니다. PIL 라벨도 같은 폰트를 사용해 한글이 깨지지 않습니다(서버에 한글 폰트가 없으면 앱 폴더 fonts/ 에 두거나 RECEIPT_LABEL_FONT로 경로 지정). 템플릿은 '마지막 사용'으로 지정 시 앱 재시작 후에도 자동 적용됩니다.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,214 @@
+# receipt_cli.py
+# ------------------------------------------------------------
+# 📄 수입신고필증 PDF 일괄 추출 CLI (Streamlit 없이 실행 · 야간 배치/cron 용)
+# 사용: python receipt_cli.py -t 수입필증1 -i ./pdfs -o 결과.xlsx [--format csv] [--workers 8]
+#       python receipt_cli.py --auto -i ./pdfs -o 결과.xlsx          (양식 혼합: 지문으로 템플릿 자동 판별)
+#       python receipt_cli.py -t 수입필증1 --fingerprint 샘플.pdf     (템플릿에 레이아웃 지문 등록)
+#       python receipt_cli.py --ledger-range 2025-01-01 2025-03-31 -o 대사.xlsx  (반입 이력 신고일 기간 내보내기)
+# ------------------------------------------------------------
+
+import argparse
+import logging
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from receipt_engine import (
+    BATCH_MEM_BUDGET, BATCH_WORKERS_DEFAULT, DPI_DEFAULT, EXPORT_FORMATS, EXTRACT_MODES, TEMPLATES_FILE, CACHE_FILE,
+    LEDGER_FILE, TEMPLATE_DB, DeclarationLedger, ExtractionCache, ResultExporter, StageMetrics, TemplateIndex,
+    TemplateStore, build_field_specs, export_unavailable, load_templates, pdf_fingerprint, routed_frame, run_batch,
+    run_routed_batch, sort_by_date, split_declarations, template_fields, type_frame,
+)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="수입신고필증 PDF 폴더 → XLSX/CSV/Parquet (저장된 ROI 템플릿 사용)")
+    ap.add_argument("-t", "--template", help="템플릿 이름 (--templates-file 안의 이름, --auto면 판별 실패 시 적용)")
+    ap.add_argument("-i", "--input", help="PDF가 들어 있는 폴더")
+    ap.add_argument("-o", "--output", help="결과 파일 경로")
+    ap.add_argument("--auto", action="store_true", help="파일별 레이아웃 지문으로 템플릿 자동 판별 (양식 혼합 배치)")
+    ap.add_argument("--fingerprint", metavar="PDF", help="PDF의 레이아웃 지문을 -t 템플릿에 등록하고 종료")
+    ap.add_argument("--format", choices=list(EXPORT_FORMATS), help="결과 형식 (기본: 출력 확장자로 판단, 없으면 xlsx)")
+    ap.add_argument("--templates-file", default=TEMPLATE_DB,
+                    help=f"템플릿 저장소 경로 (.json이면 JSON 파일, 기본 DB가 비어 있으면 {TEMPLATES_FILE}을 가져옴)")
+    ap.add_argument("--mode", choices=list(EXTRACT_MODES), default="clip", help="ROI 텍스트 추출 방식")
+    ap.add_argument("--no-ocr", action="store_true",
+                    help="텍스트 레이어 없는 스캔본의 ROI OCR 대체 추출 안 함 (기본: pytesseract·tesseract 설치 시 사용)")
+    ap.add_argument("--workers", type=int, default=BATCH_WORKERS_DEFAULT, help="병렬 프로세스 수 (1 = 순차)")
+    ap.add_argument("--mem-budget", type=int, default=BATCH_MEM_BUDGET // (1024 * 1024), metavar="MB",
+                    help="병렬 변환 중 워커에 동시에 맡기는 PDF 크기 합 상한 (MB, 0 = 무제한)")
+    ap.add_argument("--sort", action="store_true", help="신고일 오름차순 정렬 후 기록 (기본: 파일명 순으로 추출 즉시 기록)")
+    ap.add_argument("--cache-file", default=CACHE_FILE, help="추출 캐시 SQLite 경로")
+    ap.add_argument("--no-cache", action="store_true", help="추출 캐시 사용 안 함")
+    ap.add_argument("--ledger-file", default=LEDGER_FILE, help="반입 이력 SQLite 경로")
+    ap.add_argument("--no-ledger", action="store_true", help="반입 이력 중복 검사·기록 안 함")
+    ap.add_argument("--ledger-range", nargs=2, metavar=("FROM", "TO"),
+                    help="반입 이력에서 신고일 기간(YYYY-MM-DD, 양끝 포함)을 -o로 내보내고 종료")
+    ap.add_argument("--metrics-json", metavar="PATH", help="단계별 시간·카운터 요약 JSON 저장 (파일별 포함)")
+    ap.add_argument("--metrics-prom", metavar="PATH", help="Prometheus 텍스트 형식 지표 저장 (textfile collector 용)")
+    ap.add_argument("--metrics-log", action="store_true", help="파일별/요약 지표를 JSON 로그로 stderr에 출력")
+    ap.add_argument("-q", "--quiet", action="store_true", help="진행 상황 출력 안 함")
+    args = ap.parse_args(argv)
+    if args.ledger_range:
+        if not args.output:
+            ap.error("--ledger-range에는 -o/--output이 필요합니다")
+    elif args.fingerprint:
+        if not args.template:
+            ap.error("--fingerprint에는 -t 템플릿 이름이 필요합니다")
+        if args.templates_file.lower().endswith(".json"):
+            ap.error("--fingerprint는 템플릿 DB에만 기록합니다 (JSON 템플릿 파일은 읽기 전용 — DB 경로를 지정)")
+    elif not (args.input and args.output):
+        ap.error("-i/--input, -o/--output이 필요합니다")
+    elif not (args.template or args.auto):
+        ap.error("-t 템플릿 또는 --auto가 필요합니다")
+    return args
+
+
+def register_fingerprint(args: argparse.Namespace, tmpls: dict) -> int:
+    fp = pdf_fingerprint(Path(args.fingerprint).read_bytes())
+    tmpl = tmpls[args.template]
+    TemplateStore(args.templates_file).save(args.template, {**tmpl, "fingerprint": fp},
+                                            base_version=tmpl.get("version"))
+    print(f"지문 등록: {args.template} ← {args.fingerprint} (앵커 {len(fp['anchors'])}개: "
+          f"{', '.join(fp['anchors'])})", file=sys.stderr)
+    return 0
+
+
+def export_ledger(args: argparse.Namespace, fmt: str) -> int:
+    df = DeclarationLedger(args.ledger_file).query(*args.ledger_range)
+    df = type_frame(df)
+    with ResultExporter(list(df.columns), fmt, path=args.output) as ex:
+        ex.write_frame(df)
+    print(f"반입 이력 {len(df)}건 (신고일 {args.ledger_range[0]} ~ {args.ledger_range[1]}) → {args.output}",
+          file=sys.stderr)
+    return 0
+
+
+def output_format(args: argparse.Namespace) -> str:
+    fmt = args.format or Path(args.output).suffix.lstrip(".").lower()
+    return fmt if fmt in EXPORT_FORMATS else "xlsx"
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    hint = None if args.fingerprint else export_unavailable(output_format(args))
+    if hint:
+        print(hint, file=sys.stderr)
+        return 2
+    if args.ledger_range:
+        return export_ledger(args, output_format(args))
+
+    try:
+        tmpls = load_templates(args.templates_file)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    tmpl = tmpls.get(args.template) if args.template and args.template != "__meta" else None
+    if args.template and not tmpl:
+        names = ", ".join(sorted(n for n in tmpls if n != "__meta")) or "(없음)"
+        print(f"템플릿을 찾을 수 없음: {args.template} — 사용 가능: {names}", file=sys.stderr)
+        return 2
+    if args.fingerprint:
+        return register_fingerprint(args, tmpls)
+    if args.auto and not TemplateIndex(tmpls):
+        print("지문이 등록된 템플릿이 없습니다 (--fingerprint로 먼저 등록)", file=sys.stderr)
+        return 2
+    norm_rects = tmpl.get("norm_rects", {}) if tmpl else {}
+    field_defs = tmpl.get("fields", {}) if tmpl else {}
+    fields = template_fields(field_defs)
+    missing = [f for f in fields if f not in norm_rects]
+    if tmpl and missing:
+        print(f"템플릿에 좌표가 없는 필드: {', '.join(missing)}", file=sys.stderr)
+        return 2
+
+    src = Path(args.input)
+    pdfs = sorted(p for p in src.iterdir() if p.is_file() and p.suffix.lower() == ".pdf") if src.is_dir() else []
+    if not pdfs:
+        print(f"PDF 없음: {src}", file=sys.stderr)
+        return 2
+
+    fmt = output_format(args)
+
+    def _on_progress(done: int, total: int, name: str):
+        if not args.quiet:
+            print(f"\r[{done}/{total}] {name}", end="", file=sys.stderr, flush=True)
+
+    t0 = time.perf_counter()
+    items = [(p.name, str(p)) for p in pdfs]  # 경로로 전달 → 워커가 파일에서 직접 열기 (전체를 메모리에 올리지 않음)
+    mem_budget = args.mem_budget * 1024 * 1024 or None
+    cache = None if args.no_cache else ExtractionCache(args.cache_file)
+    metrics = StageMetrics(enabled=bool(args.metrics_json or args.metrics_prom or args.metrics_log))
+
+    if args.auto:
+        # 혼합 배치: 템플릿별 열 합집합이 끝나야 정해지므로 모아서 기록
+        res = run_routed_batch(items, tmpls, mode=args.mode, workers=args.workers, on_progress=_on_progress,
+                               cache=cache, fallback=args.template, metrics=metrics, mem_budget=mem_budget,
+                               ocr=not args.no_ocr)
+        with metrics.stage("frame"):
+            df, specs = routed_frame(res, tmpls)
+            df = type_frame(df, specs)
+            if args.sort:
+                df = sort_by_date(df)
+        with metrics.stage("export"), ResultExporter(list(df.columns), fmt, path=args.output, specs=specs) as ex:
+            ex.write_frame(df)
+        return _report(args, res, items, cache, metrics, t0)
+
+    kw = dict(mode=args.mode, workers=args.workers, on_progress=_on_progress, cache=cache,
+              dpi=tmpl.get("dpi", DPI_DEFAULT), field_defs=field_defs, metrics=metrics, mem_budget=mem_budget,
+              field_pages=tmpl.get("field_pages"), ocr=not args.no_ocr)
+    specs = build_field_specs(field_defs)
+    # 여러 건이 합쳐진 PDF → 템플릿 분할 규칙으로 신고서 단위로 나눔
+    units, _, split_issues = split_declarations(items, tmpl.get("split"))
+
+    with ResultExporter(fields, fmt, path=args.output, specs=specs) as ex:
+        if args.sort:
+            res = run_batch(units, norm_rects, fields, **kw)
+            if res.rows:
+                with metrics.stage("frame"):
+                    df = sort_by_date(type_frame(pd.DataFrame(res.rows, columns=fields), specs))
+                with metrics.stage("export"):
+                    ex.write_frame(df)
+        else:
+            # 스트리밍 기록은 추출과 겹쳐 진행 → export는 batch 경과에 포함
+            res = run_batch(units, norm_rects, fields, on_row=lambda _name, row: ex.write_row(row), **kw)
+    return _report(args, res._replace(issues=split_issues + res.issues), items, cache, metrics, t0)
+
+
+def _report(args: argparse.Namespace, res, items: list, cache, metrics: StageMetrics, t0: float) -> int:
+    """처리 결과/점검 문구/지표 출력 → 종료 코드."""
+    if not args.quiet:
+        print(file=sys.stderr)
+    issues = res.issues
+    if not args.no_ledger and res.rows:
+        # 지난 배치와 겹치는 B/L·신고번호 확인 후 이번 배치 기록
+        ledger = DeclarationLedger(args.ledger_file)
+        issues = issues + ledger.duplicate_issues(res.rows, res.names, source_keys=res.source_keys)
+        ledger.record(res.rows, res.names, uuid.uuid4().hex, getattr(res, "templates", None), res.source_keys)
+    for line in issues:
+        print(line, file=sys.stderr)
+    cache_note = (f" · 캐시 적중 {cache.hits}/{cache.hits + cache.misses}"
+                  f" · 새로 클립한 필드 {cache.field_misses}" if cache else "")
+    print(f"완료: {len(res.rows)}건 (PDF {len(items)}개) → {args.output} ({time.perf_counter() - t0:.1f}s{cache_note})",
+          file=sys.stderr)
+    if args.metrics_json:
+        with open(args.metrics_json, "w", encoding="utf-8") as f:
+            f.write(metrics.to_json(per_file=True))
+    if args.metrics_prom:
+        with open(args.metrics_prom, "w", encoding="utf-8") as f:
+            f.write(metrics.to_prometheus())
+    if args.metrics_log:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("receipt_engine.metrics")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        metrics.log_json(logger)
+    return 0 if res.rows else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2181 @@
+# receipt_engine.py
+# ------------------------------------------------------------
+# 📄 수입신고필증 PDF 추출 엔진 (Streamlit 비의존)
+# ✨ 페이지 로딩 · ROI 클립 · 필드 후처리 · 캐시 · 배치 병렬 · 결과 내보내기
+# ✨ UI(import_receipt_app.py) · CLI(receipt_cli.py) 공용
+# ------------------------------------------------------------
+
+import contextlib
+import csv
+import functools
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import numbers
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, List, NamedTuple, Tuple, Union
+
+import pandas as pd
+import fitz  # PyMuPDF
+import xlsxwriter
+from PIL import Image
+
+try:  # Parquet 내보내기: pyarrow (requirements에 포함, 없으면 형식 선택 시 설치 안내)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:  # 스캔본 OCR(선택): pytesseract + tesseract 실행 파일이 있을 때만 사용
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# =========================
+# 전역 설정 및 상수
+# =========================
+TEMPLATES_FILE = "receipt_templates.json"   # 이전 저장 형식(JSON 통째 기록) — 템플릿 DB가 비어 있으면 1회 가져옴
+TEMPLATE_DB = "receipt_templates.sqlite3"    # 템플릿 저장소 (템플릿별 버전 · 트랜잭션 기록)
+TEMPLATE_KEEP_VERSIONS = 20                  # 템플릿별로 보관할 최근 버전 수
+DPI_DEFAULT = 144
+
+# 출력 컬럼(=필드) 순서
+FIELDS: List[str] = [
+    "b/l(awb)번호",
+    "국내도착항",
+    "신고일",
+    "환율",
+    "세율(구분)",
+    "부가가치세 과표",
+    "관세",
+    "부가가치세",
+    "신고번호",
+]
+
+# 항 코드 → 한글명
+PORT_CODE_MAP = {
+    "KRPTK": "평택항",
+    "KRINC": "인천항",
+    "KRKPO": "포항항",
+    "KRKUV": "군산항",
+    "KRUSN": "울산항",
+    "KRPUS": "부산항",
+    "KRGMP": "김포공항",
+    "KRSEL": "인천공항",
+}
+
+_AMOUNT_PATTERN = r'([0-9]{1,3}(?:,[0-9]{3})+|[0-9]{4,})\s*원?'
+
+# ROI 텍스트 추출 방식
+EXTRACT_MODES: Dict[str, str] = {
+    "clip": "영역별 클립 (기본)",
+    "words": "단어 레이어 일괄 (필드 많을 때 유리)",
+}
+WORD_GRID_COLS = 16
+WORD_GRID_ROWS = 48
+
+# 스캔본(텍스트 레이어 없는 페이지) OCR 대체 추출 — ROI만 잘라 고해상도 렌더 후 인식
+OCR_DPI = 300
+OCR_LANGS: Tuple[str, ...] = ("kor", "eng")  # 설치된 언어 데이터만 사용
+OCR_CONFIG = "--psm 6"                        # ROI 1개 = 균일한 텍스트 블록
+OCR_THREADS = min(4, os.cpu_count() or 1)     # 파일 1건 안에서 동시에 인식할 ROI 수
+
+# 배치 변환 병렬도 (프로세스 수)
+BATCH_WORKERS_DEFAULT = os.cpu_count() or 1
+BATCH_CHUNK_MAX = 16  # 워커 1회 전송당 최대 파일 수
+BATCH_MEM_BUDGET = 256 * 1024 * 1024  # 병렬 변환 중 동시에 워커에 맡기는 PDF 크기 합 상한(바이트)
+SPILL_CHUNK = 1024 * 1024  # 업로드 → 임시 파일 복사 단위
+
+# 반입 이력 (배치 간 중복 검사 · 신고일 기간 조회)
+LEDGER_FILE = "receipt_ledger.sqlite3"
+LEDGER_KEYS: Dict[str, str] = {"bl": "b/l(awb)번호", "decl_no": "신고번호"}  # 이력 컬럼 → 필드
+LEDGER_QUERY_CHUNK = 500  # IN (...) 조회 1회당 키 수 (SQLite 변수 한도 이내)
+
+# 백그라운드 변환 작업 (파일별 체크포인트 · 재개)
+JOBS_FILE = "receipt_jobs.sqlite3"
+JOBS_DIR = "receipt_jobs"  # 작업별 입력 PDF 보관 폴더 (작업 삭제 시 함께 제거)
+JOB_STATUS_LABELS: Dict[str, str] = {
+    "queued": "대기",
+    "running": "진행 중",
+    "done": "완료",
+    "failed": "오류",
+    "cancelled": "중지됨",
+    "interrupted": "중단됨(재개 가능)",
+}
+
+# PDF 입력: 메모리 바이트 또는 파일 경로(경로면 PyMuPDF가 파일에서 직접 읽음),
+#          또는 그 일부 페이지(PageRange — 여러 건이 합쳐진 PDF에서 신고서 1건)
+PdfSource = Union[bytes, str, os.PathLike, "PageRange"]
+
+# 여러 페이지/여러 건 PDF (템플릿 "split", "field_pages")
+# - "split": {"pages": N} → N페이지마다 1건 / {"anchor": "문구"} → 문구가 있는 페이지마다 새 건 시작
+# - "field_pages": {"필드": 페이지} → 신고서 안에서 몇 번째 페이지(0부터)의 ROI인지 (없으면 0)
+
+# 추출 결과 캐시 (PDF 해시 + 템플릿 해시 → raw/후처리 값)
+CACHE_FILE = "extract_cache.sqlite3"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_VERSION = 2  # 텍스트 추출 방식이 바뀌면 올려서 기존 캐시 무효화 (후처리 값은 캐시하지 않음)
+
+# 내보내기 형식: 키 → (표시명, 확장자, MIME)
+EXPORT_FORMATS: Dict[str, Tuple[str, str, str]] = {
+    "xlsx": ("엑셀(.xlsx)", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV(.csv)", ".csv", "text/csv"),
+    "parquet": ("Parquet(.parquet)", ".parquet", "application/vnd.apache.parquet"),
+}
+MONEY_FIELDS: List[str] = ["부가가치세 과표", "관세", "부가가치세"]
+PARQUET_ROW_GROUP = 5000  # Parquet 스트리밍 시 row group 크기
+
+# 레이아웃 지문: 앵커 라벨(키 → 정규화 후 접두어 후보) · 판별 허용 오차
+ANCHOR_LABELS: Dict[str, Tuple[str, ...]] = {
+    "수입신고필증": ("수입신고필증",),
+    "신고번호": ("신고번호",),
+    "신고일": ("신고일",),
+    "B/L": ("b/l", "bl번호", "awb"),
+    "국내도착항": ("국내도착항",),
+    "환율": ("환율",),
+    "세율": ("세율",),
+    "부가가치세": ("부가가치세", "부가세"),
+}
+FINGERPRINT_VERSION = 1
+FINGERPRINT_PAGE_TOL = 0.02        # 페이지 가로/세로 허용 비율 차
+FINGERPRINT_MISSING_PENALTY = 0.1  # 한쪽에만 있는 앵커 1개당 거리
+FINGERPRINT_MAX_DIST = 0.03        # 앵커 평균 거리(정규화 좌표) 상한 — 넘으면 판별 실패
+TEMPLATE_COLUMN = "템플릿"          # 혼합 배치 결과에 붙는 적용 템플릿 열
+
+# 성능 측정 단계 (표시 순서) · Prometheus 지표 접두어
+METRIC_STAGES: Tuple[str, ...] = ("route", "open", "clip", "postprocess", "cache", "frame", "export", "batch")
+METRIC_COUNTERS: Tuple[str, ...] = ("files", "fields", "clips", "failures", "cache_hits", "cache_misses")
+METRIC_PREFIX = "receipt"
+
+# =========================
+# 간단 유틸
+# =========================
+_DATE_YMD_RE = re.compile(r'(\d{4})[./-](\d{1,2})[./-](\d{1,2})')
+_DATE_KOR_RE = re.compile(r'(\d{4})\s*년\s*(\d{1,2})\s*월\s*(\d{1,2})\s*일')
+_DATE_MD_RE = re.compile(r'(?<!\d)(\d{1,2})[./-](\d{1,2})(?!\d)')
+_DATE_8_RE = re.compile(r'(?<!\d)(\d{8})(?!\d)')  # YYYYMMDD
+_DECIMAL_RE = re.compile(r'\d+\.\d+')
+
+
+def fmt_date_uniform(s: str) -> str:
+    """여러 날짜 표기를 YYYY/MM/DD로 표준화 (연도 없으면 당해년도, 실패시 YYYY/00/00)."""
+    if not s:
+        return f"{datetime.now().year:04d}/00/00"
+    s = " ".join(str(s).split())
+    m = _DATE_YMD_RE.search(s) or _DATE_KOR_RE.search(s)
+    if m:
+        y, mo, d = m.groups()
+        return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
+    m = _DATE_MD_RE.search(s)
+    if m:
+        mo, d = m.groups()
+        return f"{datetime.now().year:04d}/{int(mo):02d}/{int(d):02d}"
+    m = _DATE_8_RE.search(s)
+    if m:
+        val = m.group(1)
+        return f"{int(val[:4]):04d}/{int(val[4:6]):02d}/{int(val[6:]):02d}"
+    return f"{datetime.now().year:04d}/00/00"
+
+
+def clean_number(s: str):
+    """천단위 콤마 제거 → int/float 변환."""
+    if s is None:
+        return None
+    t = str(s).replace(",", "").strip()
+    if t == "":
+        return None
+    try:
+        return float(t) if _DECIMAL_RE.search(t) else int(t)
+    except Exception:
+        return None
+
+# =========================
+# 템플릿 저장/불러오기
+# 구조:
+# {
+#   "__meta": {"last_used": "템플릿명"},
+#   "템플릿명": { "created_at": "...", "dpi": 144, "norm_rects": {"필드":[x1n,y1n,x2n,y2n], ...},
+#                "fingerprint": {...} (선택 · 혼합 배치 자동 판별용, layout_fingerprint 참고) }
+# }
+# =========================
+def load_all_templates(path: str = TEMPLATES_FILE) -> Dict[str, dict]:
+    """JSON 템플릿 파일 읽기. 파일이 없으면 빈 구조, 깨져 있으면 ValueError (조용히 비우지 않음)."""
+    path = Path(path)
+    if not path.exists():
+        return {"__meta": {}}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except ValueError as e:
+        raise ValueError(f"템플릿 파일을 읽을 수 없습니다: {path} ({e})") from e
+
+
+def get_last_used(all_tmpls: Dict[str, dict]) -> str | None:
+    meta = all_tmpls.get("__meta", {})
+    return meta.get("last_used")
+
+# =========================
+# 템플릿 저장소 (SQLite · 템플릿별 버전 · 프로세스 간 안전)
+# - 저장/삭제는 템플릿 1개 단위 트랜잭션(BEGIN IMMEDIATE), 삭제는 빈 버전(tombstone)으로 기록
+# - '마지막 사용' 지정은 meta 1행만 갱신 (템플릿 본문을 다시 쓰지 않음)
+# - 쓰기마다 meta.generation 증가 → all()은 세대가 바뀐 경우에만 다시 읽음 (다른 프로세스 변경도 반영)
+# - base_version을 주면 그 사이 다른 세션이 저장했을 때 TemplateConflict (덮어쓰기 방지)
+# - DB가 비어 있으면 TEMPLATES_FILE(JSON)을 1회 가져옴
+# =========================
+class TemplateConflict(Exception):
+    """다른 세션/프로세스가 먼저 같은 템플릿을 저장함."""
+
+
+class TemplateStore:
+    def __init__(self, path: str = TEMPLATE_DB, legacy_json: str | None = TEMPLATES_FILE):
+        self.path = path
+        self.migration_error: str | None = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            " name TEXT NOT NULL, version INTEGER NOT NULL, data TEXT, created REAL NOT NULL,"
+            " PRIMARY KEY (name, version));"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        self._snapshot: Tuple[int, Dict[str, dict]] | None = None
+        if legacy_json:
+            self._migrate(legacy_json)
+
+    @contextlib.contextmanager
+    def _write(self):
+        """프로세스 간 쓰기 잠금 트랜잭션 + 세대 증가."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("INSERT INTO meta VALUES ('generation', '1') ON CONFLICT(key)"
+                                   " DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _migrate(self, legacy_json: str) -> None:
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM templates LIMIT 1").fetchone():
+                return
+        try:
+            legacy = load_all_templates(legacy_json)
+        except ValueError as e:
+            self.migration_error = str(e)
+            logging.getLogger(__name__).error("%s", e)
+            return
+        names = [n for n in legacy if n != "__meta"]
+        if not names:
+            return
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM templates LIMIT 1").fetchone():
+                return  # 다른 프로세스가 먼저 가져옴
+            now = time.time()
+            conn.executemany("INSERT INTO templates VALUES (?, 1, ?, ?)",
+                             [(n, json.dumps(legacy[n], ensure_ascii=False), now) for n in names])
+            last = (legacy.get("__meta") or {}).get("last_used")
+            if last:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_used', ?)", (last,))
+
+    def _generation(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def all(self) -> Dict[str, dict]:
+        """
+        {템플릿명: 최신 버전 dict, "__meta": {"last_used": ...}} (load_all_templates와 같은 구조).
+        바뀐 것이 없으면 공유 스냅샷을 그대로 사용 → 템플릿 dict는 수정하지 말 것(save로 저장).
+        """
+        with self._lock:
+            gen = self._generation()
+            if self._snapshot is None or self._snapshot[0] != gen:
+                rows = self._conn.execute(
+                    "SELECT t.name, t.version, t.data FROM templates t"
+                    " JOIN (SELECT name, MAX(version) AS v FROM templates GROUP BY name) m"
+                    " ON t.name = m.name AND t.version = m.v WHERE t.data IS NOT NULL ORDER BY t.name").fetchall()
+                last = self._conn.execute("SELECT value FROM meta WHERE key='last_used'").fetchone()
+                tmpls: Dict[str, dict] = {"__meta": {"last_used": last[0]} if last else {}}
+                for name, version, data in rows:
+                    tmpls[name] = {**json.loads(data), "version": version}
+                self._snapshot = (gen, tmpls)
+            return dict(self._snapshot[1])
+
+    def version(self, name: str) -> int:
+        """최신 버전 번호 (없으면 0, 삭제됐으면 삭제 버전)."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(version) FROM templates WHERE name=?", (name,)).fetchone()
+        return row[0] or 0
+
+    def save(self, name: str, data: dict, base_version: int | None = None) -> int:
+        """템플릿 1개 저장 → 새 버전 번호. base_version이 현재 최신 버전과 다르면 TemplateConflict."""
+        body = json.dumps({k: v for k, v in data.items() if k != "version"}, ensure_ascii=False)
+        with self._write() as conn:
+            cur = conn.execute("SELECT MAX(version) FROM templates WHERE name=?", (name,)).fetchone()[0] or 0
+            if base_version is not None and base_version != cur:
+                raise TemplateConflict(f"'{name}' 템플릿이 다른 곳에서 먼저 저장되었습니다 (v{base_version} → v{cur})")
+            conn.execute("INSERT INTO templates VALUES (?, ?, ?, ?)", (name, cur + 1, body, time.time()))
+            conn.execute("DELETE FROM templates WHERE name=? AND version<=?", (name, cur + 1 - TEMPLATE_KEEP_VERSIONS))
+        return cur + 1
+
+    def delete(self, name: str) -> None:
+        """삭제 버전 기록 (이전 버전 행은 TEMPLATE_KEEP_VERSIONS개까지 DB에 남음)."""
+        with self._write() as conn:
+            cur = conn.execute("SELECT MAX(version) FROM templates WHERE name=?", (name,)).fetchone()[0] or 0
+            conn.execute("INSERT INTO templates VALUES (?, ?, NULL, ?)", (name, cur + 1, time.time()))
+            conn.execute("DELETE FROM meta WHERE key='last_used' AND value=?", (name,))
+
+    def set_last_used(self, name: str) -> None:
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_used', ?)", (name,))
+
+
+
+def load_templates(path: str = TEMPLATE_DB) -> Dict[str, dict]:
+    """경로가 .json이면 JSON 파일, 아니면 템플릿 저장소(DB)에서 전체 템플릿 읽기."""
+    if str(path).lower().endswith(".json"):
+        return load_all_templates(path)
+    return TemplateStore(path).all()
+
+# =========================
+# PDF 관련: 렌더/텍스트 클립
+# =========================
+class PageGeometry(NamedTuple):
+    """렌더 없이 얻는 페이지 기하 정보."""
+    rect: fitz.Rect       # 회전 반영된 페이지 rect (ROI 정규화 기준)
+    rotation: int         # /Rotate (0/90/180/270)
+    mediabox: fitz.Rect   # 원본 MediaBox
+
+
+def page_geometry(page: fitz.Page) -> PageGeometry:
+    return PageGeometry(page.rect, page.rotation, page.mediabox)
+
+
+class PageRange(NamedTuple):
+    """PDF의 연속된 페이지 일부 = 신고서 1건. 문서를 열 때 이 범위의 페이지만 필요할 때 로드한다."""
+    source: Union[bytes, str, os.PathLike]
+    start: int           # 시작 페이지 (0부터)
+    count: int           # 페이지 수
+    total: int           # 원본 PDF 전체 페이지 수
+    file_sha: str = ""   # 원본 PDF SHA-256 (분할 시 1회 계산 → 건별로 다시 해시하지 않음)
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """바이트면 메모리 스트림, 경로면 파일에서 연다(전체를 메모리에 복사하지 않음)."""
+    if isinstance(source, PageRange):
+        return open_pdf(source.source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(os.fspath(source), filetype="pdf")
+
+
+def source_size(source: PdfSource) -> int:
+    """PDF 입력 크기(바이트) — 병렬 변환 메모리 한도 계산용. PageRange는 페이지 비율만큼."""
+    if isinstance(source, PageRange):
+        return source_size(source.source) * source.count // max(source.total, 1)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _spill_page_ranges(items: List[Tuple[int, str, PdfSource, str | None]], dir_path: str) -> list:
+    """병렬 전송 전: 메모리 PDF의 일부 페이지(PageRange)는 원본을 dir_path에 한 번 써서 경로로 바꿈.
+
+    바이트를 그대로 보내면 묶음마다 원본 전체가 피클되고, source_size는 페이지 비율만 잡아 메모리 한도가 어긋남.
+    """
+    spilled: Dict[int, str] = {}  # id(원본 바이트) → 임시 경로
+    out = []
+    for i, name, src, key in items:
+        if (isinstance(src, PageRange) and src.count < src.total
+                and isinstance(src.source, (bytes, bytearray, memoryview))):
+            path = spilled.get(id(src.source))
+            if path is None:
+                path = spilled[id(src.source)] = os.path.join(dir_path, f"{len(spilled):05d}.pdf")
+                with open(path, "wb") as f:
+                    f.write(src.source)
+            src = src._replace(source=path)
+        out.append((i, name, src, key))
+    return out
+
+
+def pdf_page_count(source: PdfSource) -> int:
+    """페이지 수 (페이지를 로드하지 않음)."""
+    with open_pdf(source) as doc:
+        return doc.page_count
+
+
+def render_page_region(source: PdfSource, width_px: int, page_no: int = 0,
+                       norm_clip: List[float] | None = None) -> Tuple[Image.Image, fitz.Rect]:
+    """
+    페이지 전체(또는 정규화 영역 norm_clip)를 가로 width_px 크기로 바로 렌더 → (이미지, page_rect).
+    배율을 계산한 fitz 행렬로 그리므로 고해상도 래스터를 만든 뒤 줄이지 않음 (ROI 지정 화면 · 확대 타일용).
+    """
+    with open_pdf(source) as doc:
+        page = doc.load_page(page_no)
+        clip = norm_to_page_rect(norm_clip, page.rect) if norm_clip else page.rect
+        zoom = width_px / clip.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+        return Image.frombytes("RGB", [pix.width, pix.height], pix.samples), page.rect
+
+
+def norm_to_page_rect(norm_rect: List[float], page_rect: fitz.Rect) -> fitz.Rect:
+    """정규화(0~1) rect → 페이지 좌표계 fitz.Rect."""
+    x1n, y1n, x2n, y2n = norm_rect
+    x1 = page_rect.x0 + page_rect.width * x1n
+    y1 = page_rect.y0 + page_rect.height * y1n
+    x2 = page_rect.x0 + page_rect.width * x2n
+    y2 = page_rect.y0 + page_rect.height * y2n
+    return fitz.Rect(x1, y1, x2, y2)
+
+
+def clip_text_by_norm_rect(file_bytes: PdfSource, norm_rect: List[float], page_rect: fitz.Rect,
+                           page_no: int = 0) -> str:
+    """정규화(0~1) rect로 페이지(기본 1페이지)에서 텍스트 클립. (단건용 — 배치는 PdfExtractionSession 사용)"""
+    with open_pdf(file_bytes) as doc:
+        page = doc.load_page(page_no)
+        txt = page.get_text("text", clip=norm_to_page_rect(norm_rect, page_rect)) or ""
+        return " ".join(txt.split())
+
+
+class WordGrid:
+    """
+    페이지 단어 bbox를 균일 격자에 버킷팅한 공간 인덱스.
+    ROI 조회 시 겹치는 셀의 단어만 후보로 본다(단어 순서 = get_text("words") 순서 유지).
+    """
+
+    def __init__(self, words: list, page_rect: fitz.Rect,
+                 cols: int = WORD_GRID_COLS, rows: int = WORD_GRID_ROWS):
+        self.words = words
+        self.x0, self.y0 = page_rect.x0, page_rect.y0
+        self.cols, self.rows = cols, rows
+        self.cw = (page_rect.width or 1) / cols
+        self.ch = (page_rect.height or 1) / rows
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, w in enumerate(words):
+            for key in self._cells_for(w[0], w[1], w[2], w[3]):
+                self.cells.setdefault(key, []).append(i)
+
+    def _cells_for(self, x0: float, y0: float, x1: float, y1: float):
+        c0 = min(max(int((x0 - self.x0) // self.cw), 0), self.cols - 1)
+        c1 = min(max(int((x1 - self.x0) // self.cw), 0), self.cols - 1)
+        r0 = min(max(int((y0 - self.y0) // self.ch), 0), self.rows - 1)
+        r1 = min(max(int((y1 - self.y0) // self.ch), 0), self.rows - 1)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                yield (r, c)
+
+    def query(self, clip: fitz.Rect) -> List[int]:
+        """clip과 격자 셀이 겹치는 단어 인덱스(읽기 순서)."""
+        found = set()
+        for key in self._cells_for(clip.x0, clip.y0, clip.x1, clip.y1):
+            found.update(self.cells.get(key, ()))
+        return sorted(found)
+
+    def text_in(self, clip: fitz.Rect) -> str | None:
+        """
+        clip 안 단어를 clip 경로(get_text("text", clip=…) 후 공백 정규화)와 같은 문자열로 반환.
+        결과가 달라질 수 있으면 None(호출측이 clip 경로로 위임).
+        - 완전 포함: 채택 / 겹침 없음: 제외 / 가로 경계에 걸려 잘림: None
+        - 가로는 포함, 세로만 걸침: 단어 세로 중심이 ROI 안이면 채택
+        - 이어 붙이기: 같은 줄(블록·줄 번호) 단어 사이 = 원문 공백, 위아래로 떨어진 줄 사이 = 줄바꿈 → 공백.
+          다른 줄이 옆으로 나란하면(세로 범위 겹침) 클립 텍스트 페이지가 한 줄로 합쳐 공백 없이 붙일 수 있어 None
+        """
+        out = []
+        prev = None
+        for i in self.query(clip):
+            x0, y0, x1, y1, word, block, line = self.words[i][:7]
+            if x1 <= clip.x0 or x0 >= clip.x1 or y1 <= clip.y0 or y0 >= clip.y1:
+                continue
+            if x0 < clip.x0 or x1 > clip.x1:
+                return None
+            if y0 < clip.y0 or y1 > clip.y1:
+                cy = (y0 + y1) / 2
+                if not (clip.y0 <= cy <= clip.y1):
+                    return None
+            if prev is not None and prev[:2] != (block, line) and y0 < prev[3] and prev[2] < y1:
+                return None
+            prev = (block, line, y0, y1)
+            out.append(word)
+        return " ".join(" ".join(out).split())
+
+
+@functools.lru_cache(maxsize=1)
+def ocr_lang() -> str | None:
+    """사용할 OCR 언어("kor+eng" 등). pytesseract·tesseract·언어 데이터가 없으면 None (프로세스당 1회 확인)."""
+    if pytesseract is None:
+        return None
+    try:
+        have = set(pytesseract.get_languages(config=""))
+    except Exception:
+        return None
+    langs = [lang for lang in OCR_LANGS if lang in have]
+    return "+".join(langs) if langs else None
+
+
+def ocr_available() -> bool:
+    return ocr_lang() is not None
+
+
+def _ocr_image(img: Image.Image) -> str:
+    txt = pytesseract.image_to_string(img, lang=ocr_lang(), config=OCR_CONFIG) or ""
+    return " ".join(txt.split())
+
+
+def ocr_images(images: Dict[str, Image.Image]) -> Dict[str, str]:
+    """
+    이미지(ROI 크롭)별 OCR 텍스트(공백 정규화). tesseract는 외부 프로세스로 실행되므로 스레드로 병렬 처리
+    (병렬 워커 프로세스에서는 _init_pool_worker가 tesseract 내부 스레드를 1개로 제한).
+    """
+    if len(images) <= 1 or OCR_THREADS <= 1:
+        return {name: _ocr_image(img) for name, img in images.items()}
+    with ThreadPoolExecutor(max_workers=min(OCR_THREADS, len(images))) as ex:
+        return dict(zip(images, ex.map(_ocr_image, images.values())))
+
+
+class PdfExtractionSession:
+    """
+    PDF 1건을 한 번만 열고, 신고서 첫 페이지를 한 번만 로드해 두고, 모든 ROI 텍스트를 같은 핸들에서 꺼낸다.
+    다른 페이지(field_pages)는 처음 필요할 때만 로드. PageRange면 그 범위 안에서만 페이지를 센다.
+    텍스트 레이어가 없는 페이지(스캔본)의 ROI는 OCR로 대체 추출(extract_texts(ocr=True), 엔진 설치 시).
+    사용: with PdfExtractionSession(f_bytes 또는 경로) as sess: sess.clip_text(rect)
+    """
+
+    def __init__(self, source: PdfSource):
+        self.doc = open_pdf(source)
+        self.start = source.start if isinstance(source, PageRange) else 0
+        self.span = source.count if isinstance(source, PageRange) else self.doc.page_count
+        self._pages: Dict[int, fitz.Page] = {}
+        self._grids: Dict[int, WordGrid] = {}
+        self._has_text: Dict[int, bool] = {}
+        self.no_text: set = set()  # 텍스트 레이어가 없는데 OCR하지 못한 필드 (빈 값 — 캐시하지 않음)
+        self.ocr_fields: set = set()  # OCR로 추출한 필드
+        self.page = self.load_page(0)
+        self.geometry = page_geometry(self.page)
+        self.page_rect = self.geometry.rect
+
+    def __enter__(self) -> "PdfExtractionSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.page = None
+        self._pages.clear()
+        self._grids.clear()
+        self.doc.close()
+
+    def load_page(self, offset: int) -> fitz.Page | None:
+        """신고서 안 offset번째 페이지 (범위 밖이면 None)."""
+        if offset >= self.span:
+            return None
+        if offset not in self._pages:
+            self._pages[offset] = self.doc.load_page(self.start + offset)
+        return self._pages[offset]
+
+    def clip_text(self, norm_rect: List[float], page: int = 0) -> str:
+        p = self.load_page(page)
+        if p is None:
+            return ""
+        txt = p.get_text("text", clip=norm_to_page_rect(norm_rect, p.rect)) or ""
+        return " ".join(txt.split())
+
+    def word_grid(self, page: int = 0) -> WordGrid | None:
+        """단어 레이어를 페이지당 1회 추출해 격자 인덱스를 만든다(세션 내 재사용)."""
+        if page not in self._grids:
+            p = self.load_page(page)
+            if p is None:
+                return None
+            self._grids[page] = WordGrid(p.get_text("words"), p.rect)
+        return self._grids[page]
+
+    def has_text(self, page: int = 0) -> bool:
+        """페이지에 텍스트 레이어가 있는지 (페이지당 1회 확인, 단어 레이어가 있으면 재사용)."""
+        if page not in self._has_text:
+            p = self.load_page(page)
+            if p is None:
+                self._has_text[page] = True  # 범위 밖 페이지는 OCR 대상 아님
+            elif page in self._grids:
+                self._has_text[page] = bool(self._grids[page].words)
+            else:
+                self._has_text[page] = bool(p.get_text("text").strip())
+        return self._has_text[page]
+
+    def ocr_texts(self, rois: Dict[str, Tuple[List[float], int]], dpi: int = OCR_DPI) -> Dict[str, str]:
+        """
+        {필드: (정규화 rect, 페이지)} → OCR 텍스트. 페이지 전체가 아니라 ROI만 pixmap clip으로 렌더하므로
+        비용이 ROI 면적에 비례. 렌더는 이 스레드에서(문서 핸들 공유 불가), 인식은 ocr_images로 병렬.
+        """
+        crops = {}
+        for name, (rect, page) in rois.items():
+            p = self.load_page(page)
+            pix = p.get_pixmap(dpi=dpi, clip=norm_to_page_rect(rect, p.rect), colorspace=fitz.csGRAY, alpha=False)
+            crops[name] = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return ocr_images(crops)
+
+    def fingerprint(self) -> dict:
+        """단어 레이어(word_grid와 공유)로 레이아웃 지문 생성."""
+        return layout_fingerprint(self.word_grid().words, self.page_rect, self.geometry.rotation)
+
+    def extract_texts(self, norm_rects: Dict[str, List[float]], fields: List[str],
+                      mode: str = "clip", field_pages: Dict[str, int] | None = None,
+                      ocr: bool = False) -> Dict[str, str]:
+        """
+        필드 순서대로 ROI raw 텍스트를 추출. field_pages: 필드별 신고서 안 페이지(없으면 0).
+        - clip: 필드마다 get_text("text", clip=...)
+        - words: 단어 레이어 1회 추출 + 격자 인덱스로 전체 ROI를 한 번에 배정
+          (경계에 걸린 단어가 있는 ROI만 clip 경로로 위임해 결과를 동일하게 유지)
+        빈 ROI가 텍스트 레이어 없는 페이지에 있으면 ocr=True일 때 OCR로 대체(엔진이 없으면 no_text에 기록).
+        """
+        pages = field_pages or {}
+        if mode != "words":
+            out = {name: self.clip_text(norm_rects[name], pages.get(name, 0)) for name in fields}
+        else:
+            out = {}
+            for name in fields:
+                pg = pages.get(name, 0)
+                grid = self.word_grid(pg)
+                if grid is None:
+                    out[name] = ""
+                    continue
+                txt = grid.text_in(norm_to_page_rect(norm_rects[name], self._pages[pg].rect))
+                out[name] = txt if txt is not None else self.clip_text(norm_rects[name], pg)
+        blank = [name for name in fields if not out[name] and not self.has_text(pages.get(name, 0))]
+        if blank and ocr and ocr_available():
+            out.update(self.ocr_texts({name: (norm_rects[name], pages.get(name, 0)) for name in blank}))
+            self.ocr_fields.update(blank)
+        else:
+            self.no_text.update(blank)
+        return out
+
+    def preview(self, norm_rects: Dict[str, List[float]], specs: "Dict[str, FieldSpec] | None" = None,
+                field_pages: Dict[str, int] | None = None) -> Dict[str, Tuple[str, object]]:
+        """
+        ROI 지정 중 미리보기: 지정된 필드마다 (raw 텍스트, postprocess_field 값).
+        단어 레이어(세션 내 1회 추출)로 배정하므로 세션을 재사용하면 ROI를 하나 추가할 때마다 수 ms.
+        """
+        raws = self.extract_texts(norm_rects, list(norm_rects), mode="words", field_pages=field_pages)
+        return {name: (raw, postprocess_field(name, raw, specs)) for name, raw in raws.items()}
+
+# =========================
+# 필드 규칙 레지스트리 (ROI에서 추출된 raw 텍스트 → 정제 · 검증)
+# - kind: 변환기 종류 (FIELD_CONVERTERS 키)
+# - patterns: 앞에서부터 시도할 정규식 (모듈 로드 시 1회 컴파일, group(1) 사용)
+# - fallback: 매칭 실패 시 "empty"(빈 문자열) 또는 "text"(정제 전 텍스트)
+# - required: 값이 비면 점검 결과에 "인식 실패"로 보고
+# - check: 값 형식 정규식 (불일치 시 "형식 확인"으로 보고)
+# 템플릿 JSON의 "fields"에 같은 키로 정의하면 코드 수정 없이 필드 추가/재정의 가능
+#   예) "fields": {"총과세가격": {"kind": "number", "patterns": ["([0-9,]+)"], "required": true}}
+# =========================
+@dataclass(frozen=True)
+class FieldSpec:
+    name: str
+    kind: str = "text"
+    patterns: Tuple[re.Pattern, ...] = ()
+    fallback: str = "empty"
+    required: bool = False
+    check: re.Pattern | None = None
+
+
+def _first_group(patterns: Tuple[re.Pattern, ...], text: str) -> str | None:
+    for pat in patterns:
+        m = pat.search(text)
+        if m:
+            return m.group(1)
+    return None
+
+
+def _conv_text(spec: FieldSpec, text: str):
+    return text
+
+
+def _conv_match(spec: FieldSpec, text: str):
+    v = _first_group(spec.patterns, text)
+    if v is not None:
+        return v
+    return text if spec.fallback == "text" else ""
+
+
+def _conv_port(spec: FieldSpec, text: str):
+    # 첫 패턴은 항 코드(→ 한글명), 나머지는 그대로
+    if spec.patterns:
+        m = spec.patterns[0].search(text)
+        if m:
+            return PORT_CODE_MAP.get(m.group(1), m.group(1))
+    v = _first_group(spec.patterns[1:], text)
+    return v if v is not None else text
+
+
+def _conv_date(spec: FieldSpec, text: str):
+    return fmt_date_uniform(text)
+
+
+def _conv_number(spec: FieldSpec, text: str):
+    v = _first_group(spec.patterns, text)
+    return clean_number(v if v is not None else text)
+
+
+FIELD_CONVERTERS: Dict[str, Callable[[FieldSpec, str], object]] = {
+    "text": _conv_text,
+    "match": _conv_match,
+    "port": _conv_port,
+    "date": _conv_date,
+    "number": _conv_number,
+}
+
+
+def make_field_spec(name: str, kind: str = "text", patterns: List[str] | Tuple = (),
+                    fallback: str = "empty", required: bool = False, check: str | None = None) -> FieldSpec:
+    """정규식 문자열 → 컴파일된 FieldSpec. (템플릿 JSON 정의도 이 함수로 생성)"""
+    if kind not in FIELD_CONVERTERS:
+        raise ValueError(f"알 수 없는 필드 종류: {kind} ({name})")
+    return FieldSpec(name=name, kind=kind,
+                     patterns=tuple(re.compile(p) for p in patterns),
+                     fallback=fallback, required=required,
+                     check=re.compile(check) if check else None)
+
+
+FIELD_SPECS: Dict[str, FieldSpec] = {
+    spec.name: spec for spec in [
+        make_field_spec("b/l(awb)번호", "match", [r'([A-Za-z0-9\-]+)']),
+        make_field_spec("국내도착항", "port", [r'\b([A-Z]{5})\b', r'([가-힣A-Za-z]+)']),
+        make_field_spec("신고일", "date", check=r'^\d{4}/\d{2}/\d{2}$'),
+        make_field_spec("환율", "number", [r'([\d,]+\.\d+|\d+\.\d+|\d+)'], required=True),
+        # "관 8.00 (설명)" → 8.00 만 남김, 없으면 숫자만
+        make_field_spec("세율(구분)", "match", [r'관\s*([0-9.]+)', r'([0-9.]+)']),
+        make_field_spec("부가가치세 과표", "number", [_AMOUNT_PATTERN], required=True),
+        make_field_spec("관세", "number", [_AMOUNT_PATTERN], required=True),
+        make_field_spec("부가가치세", "number", [_AMOUNT_PATTERN], required=True),
+        make_field_spec("신고번호", "match", [r'\b(\d{5}-\d{2}-\d{6}M)\b'], fallback="text"),
+    ]
+}
+
+
+def build_field_specs(field_defs: Dict[str, dict] | None = None) -> Dict[str, FieldSpec]:
+    """기본 레지스트리 + 템플릿 "fields" 정의(추가/재정의)."""
+    if not field_defs:
+        return FIELD_SPECS
+    specs = dict(FIELD_SPECS)
+    for name, d in field_defs.items():
+        specs[name] = make_field_spec(name, **d)
+    return specs
+
+
+def template_fields(field_defs: Dict[str, dict] | None = None) -> List[str]:
+    """출력 컬럼(=필드) 순서: 기본 FIELDS 뒤에 템플릿 정의 필드."""
+    return FIELDS + [n for n in (field_defs or {}) if n not in FIELDS]
+
+
+def postprocess_field(name: str, raw: str, specs: Dict[str, FieldSpec] | None = None):
+    text = " ".join((raw or "").split())
+    spec = (specs or FIELD_SPECS).get(name)
+    if spec is None:
+        return text
+    return FIELD_CONVERTERS[spec.kind](spec, text)
+
+# =========================
+# 추출 결과 캐시 (SQLite · 크기 제한 LRU)
+# =========================
+def pdf_sha256(source: PdfSource) -> str:
+    """PDF 내용 해시. PageRange는 원본 해시 + 페이지 범위 (같은 파일의 건끼리 캐시가 섞이지 않음)."""
+    if isinstance(source, PageRange):
+        return f"{source.file_sha or pdf_sha256(source.source)}:{source.start}+{source.count}"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(SPILL_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def roi_hash(norm_rect: List[float], page: int = 0) -> str:
+    """
+    ROI 1개의 캐시 키. raw 텍스트는 (PDF, 페이지, ROI 좌표)로만 정해짐(추출 방식·dpi·필드 규칙과 무관).
+    1페이지(page=0) 키는 페이지 지정 이전과 같음 → 기존 캐시 유지.
+    """
+    key = [CACHE_VERSION, [round(float(v), 6) for v in norm_rect]]
+    payload = json.dumps(key + [page] if page else key)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class ExtractionCache:
+    """
+    (PDF SHA-256, ROI 해시) → ROI raw 텍스트 영구 캐시 (필드 단위).
+    템플릿에서 좌표 하나만 고치면 그 필드만 다시 클립하고 나머지는 재사용. 후처리는 매번 현재 규칙으로 계산.
+    총 용량이 max_bytes를 넘으면 마지막 접근이 오래된 항목부터 제거. 여러 세션(스레드)이 공유.
+    hits/misses는 파일 단위(모든 필드 적중 = hit), field_hits/field_misses는 필드 단위.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self.field_hits = self.field_misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("DROP TABLE IF EXISTS extractions")  # 이전 파일 단위 캐시
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS field_raws ("
+            " pdf_sha TEXT NOT NULL, roi TEXT NOT NULL, raw TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_access REAL NOT NULL,"
+            " PRIMARY KEY (pdf_sha, roi))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_field_raws_access ON field_raws(last_access)")
+        self._conn.commit()
+
+    def get(self, pdf_sha: str, rois: Dict[str, str]) -> Dict[str, str]:
+        """{필드: ROI 해시} 중 캐시에 있는 필드의 {필드: raw} (일부만 있을 수 있음)."""
+        keys = list(dict.fromkeys(rois.values()))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT roi, raw FROM field_raws WHERE pdf_sha=? AND roi IN ({','.join('?' * len(keys))})",
+                (pdf_sha, *keys),
+            ).fetchall()
+            found = dict(rows)
+            if found:
+                self._conn.executemany("UPDATE field_raws SET last_access=? WHERE pdf_sha=? AND roi=?",
+                                       [(time.time(), pdf_sha, k) for k in found])
+                self._conn.commit()
+            out = {name: found[k] for name, k in rois.items() if k in found}
+            if len(out) == len(rois):
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.field_hits += len(out)
+            self.field_misses += len(rois) - len(out)
+        return out
+
+    def put_many(self, entries: List[Tuple[str, str, str]]) -> None:
+        """[(pdf_sha, ROI 해시, raw)] 일괄 저장 후 용량 초과분 제거."""
+        now = time.time()
+        recs = [(pdf_sha, roi, raw, len(raw) + len(roi) + len(pdf_sha), now) for pdf_sha, roi, raw in entries]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO field_raws VALUES (?, ?, ?, ?, ?)", recs)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM field_raws").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cur = self._conn.execute("SELECT rowid, size FROM field_raws ORDER BY last_access")
+        drop = []
+        for rowid, size in cur:
+            if total <= self.max_bytes:
+                break
+            drop.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM field_raws WHERE rowid=?", drop)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM field_raws")
+            self._conn.commit()
+            self.hits = self.misses = self.field_hits = self.field_misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            n, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM field_raws").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "field_hits": self.field_hits,
+                "field_misses": self.field_misses, "entries": n, "bytes": size}
+
+# =========================
+# 성능 측정 (단계별 시간 · 카운터)
+# - 단계: route(템플릿 판별) · open(PDF 열기) · clip(ROI 텍스트) · postprocess(필드 후처리) · cache(조회/저장)
+#         · frame(프레임 구성/검증/타입/정렬) · export(파일 기록) · batch(run_batch 전체 경과)
+# - 카운터: METRIC_COUNTERS (files · fields · clips(실제로 PDF에서 추출한 필드 수) · failures · cache_hits · cache_misses)
+# - 비활성 인스턴스는 stage()가 공용 nullcontext, 나머지는 즉시 반환 → 측정 비용 없음
+# =========================
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "file_name", "t0")
+
+    def __init__(self, metrics: "StageMetrics", name: str, file_name: str | None):
+        self.metrics, self.name, self.file_name = metrics, name, file_name
+
+    def __enter__(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.add(self.name, time.perf_counter() - self.t0, self.file_name)
+
+
+def _percentile(sorted_xs: List[float], p: float) -> float:
+    """최근접 순위 백분위 (sorted_xs는 오름차순, 비어 있지 않음)."""
+    k = max(0, min(len(sorted_xs) - 1, -(-int(p * len(sorted_xs)) // 100) - 1))
+    return sorted_xs[k]
+
+
+class StageMetrics:
+    """
+    변환 1회분 단계별 소요 시간(초)과 카운터.
+    사용: m = StageMetrics(); with m.stage("frame"): … / m.count("files") → m.summary(), m.to_prometheus()
+    counters=True: 시간 측정을 끈 상태(enabled=False)에서도 카운터만 집계 (이번 변환의 캐시 적중 표시 등).
+    """
+
+    def __init__(self, enabled: bool = True, counters: bool = False):
+        self.enabled = enabled
+        self.counting = enabled or counters
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = dict.fromkeys(METRIC_COUNTERS, 0) if self.counting else {}
+        self.files: Dict[str, Dict[str, float]] = {}  # 파일명 → 단계별 합계
+
+    def stage(self, name: str, file_name: str | None = None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name, file_name)
+
+    def add(self, name: str, seconds: float, file_name: str | None = None) -> None:
+        if not self.enabled:
+            return
+        self.stages.setdefault(name, []).append(seconds)
+        if file_name is not None:
+            per_file = self.files.setdefault(file_name, {})
+            per_file[name] = per_file.get(name, 0.0) + seconds
+
+    def add_file(self, file_name: str, timings: Dict[str, float]) -> None:
+        """워커가 돌려준 파일 1건의 단계별 시간 병합."""
+        for name, seconds in timings.items():
+            self.add(name, seconds, file_name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.counting:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _stage_order(self) -> List[str]:
+        return [s for s in METRIC_STAGES if s in self.stages] + sorted(set(self.stages) - set(METRIC_STAGES))
+
+    def summary(self) -> dict:
+        """{"stages": {단계: {count, total_ms, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}, "counters": {...}}"""
+        stages = {}
+        for name in self._stage_order():
+            xs = sorted(self.stages[name])
+            total = sum(xs)
+            stages[name] = {
+                "count": len(xs),
+                "total_ms": round(total * 1e3, 3),
+                "mean_ms": round(total / len(xs) * 1e3, 3),
+                "p50_ms": round(_percentile(xs, 50) * 1e3, 3),
+                "p90_ms": round(_percentile(xs, 90) * 1e3, 3),
+                "p99_ms": round(_percentile(xs, 99) * 1e3, 3),
+                "max_ms": round(xs[-1] * 1e3, 3),
+            }
+        return {"stages": stages, "counters": dict(self.counters)}
+
+    def slowest_files(self, n: int = 10) -> List[Tuple[str, float]]:
+        """파일별 단계 합계(초) 상위 n개."""
+        totals = [(name, sum(t.values())) for name, t in self.files.items()]
+        return sorted(totals, key=lambda x: x[1], reverse=True)[:n]
+
+    def to_json(self, per_file: bool = False) -> str:
+        out = self.summary()
+        if per_file:
+            out["files"] = {name: {k: round(v * 1e3, 3) for k, v in t.items()} for name, t in self.files.items()}
+        return json.dumps(out, ensure_ascii=False)
+
+    def log_json(self, logger: logging.Logger | None = None, level: int = logging.INFO) -> None:
+        """구조화 로그: 파일별 {"event": "file", …} 1줄씩 + {"event": "summary", …} 1줄."""
+        logger = logger or logging.getLogger(f"{__name__}.metrics")
+        if not logger.isEnabledFor(level):
+            return
+        for name, t in self.files.items():
+            logger.log(level, json.dumps({"event": "file", "file": name,
+                                          **{f"{k}_ms": round(v * 1e3, 3) for k, v in t.items()}},
+                                         ensure_ascii=False))
+        logger.log(level, json.dumps({"event": "summary", **self.summary()}, ensure_ascii=False))
+
+    def to_prometheus(self, prefix: str = METRIC_PREFIX) -> str:
+        """Prometheus 텍스트 노출 형식 (단계별 summary + 카운터)."""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per conversion stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name in self._stage_order():
+            xs = sorted(self.stages[name])
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {_percentile(xs, q * 100):.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {sum(xs):.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {len(xs)}')
+        for name in sorted(self.counters):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {self.counters[name]}")
+        return "\n".join(lines) + "\n"
+
+
+_NULL_METRICS = StageMetrics(enabled=False)
+
+# =========================
+# 업로드 → 임시 폴더 (경로 기반 처리)
+# - 업로드 파일 객체를 SPILL_CHUNK 단위로 디스크에 복사 → 이후 추출은 경로로 열어 바이트 사본을 들고 다니지 않음
+# =========================
+def spill_to_dir(uploads: Iterable[Tuple[str, BinaryIO]], dir_path: str) -> List[Tuple[str, str]]:
+    """[(파일명, 파일 객체)] → dir_path에 순서대로 저장 → [(파일명, 경로)]. 같은 이름은 순번 접두어로 구분."""
+    out = []
+    for i, (name, fobj) in enumerate(uploads):
+        path = os.path.join(dir_path, f"{i:05d}_{Path(name).name}")
+        if hasattr(fobj, "seek"):
+            fobj.seek(0)
+        with open(path, "wb") as dst:
+            shutil.copyfileobj(fobj, dst, SPILL_CHUNK)
+        out.append((name, path))
+    return out
+
+# =========================
+# 배치 변환 엔진 (파일 1건 추출 + 프로세스 풀 병렬)
+# =========================
+class BatchResult(NamedTuple):
+    rows: List[dict]       # 성공 파일의 후처리 값 (입력 순서)
+    issues: List[str]      # 처리 오류(❌) + 형식 검증(⚠️)
+    names: List[str]       # rows와 같은 순서의 파일명
+    source_keys: List[str]  # rows와 같은 순서의 원본 키 (pdf_sha256 — 나뉜 건은 원본 해시 + 페이지 범위)
+    indices: List[int]     # rows와 같은 순서의 입력 인덱스 (items 기준)
+
+
+def extract_declaration(source: PdfSource, norm_rects: Dict[str, List[float]], fields: List[str],
+                        mode: str = "clip", specs: Dict[str, FieldSpec] | None = None,
+                        timings: Dict[str, float] | None = None,
+                        known: Dict[str, str] | None = None,
+                        field_pages: Dict[str, int] | None = None,
+                        ocr: bool = False) -> Tuple[Dict[str, str], dict]:
+    """
+    파일 1건 → (ROI raw 텍스트, 후처리 값). timings(dict)를 주면 open/clip/postprocess 소요 시간(초)을 기록.
+    known: 이미 아는 필드 raw(필드 단위 캐시 적중분) → 나머지 필드만 PDF에서 클립.
+    field_pages: 필드별 신고서 안 페이지 (해당 페이지만 로드).
+    ocr: 텍스트 레이어 없는 페이지의 ROI는 OCR로 대체 (clip 시간에 포함).
+    반환 raw에서는 텍스트 레이어가 없어 읽지 못한 필드를 뺀다(캐시에 빈 값이 남지 않게 → OCR 설치 후 재추출).
+    """
+    todo = [name for name in fields if name not in known] if known else fields
+    clock = time.perf_counter
+    t0 = clock()
+    with PdfExtractionSession(source) as sess:
+        t1 = clock()
+        clipped = sess.extract_texts(norm_rects, todo, mode=mode, field_pages=field_pages, ocr=ocr)
+        t2 = clock()
+        unread = sess.no_text
+    t3 = clock()
+    raws = {name: clipped[name] if name in clipped else known[name] for name in fields}
+    data = {name: postprocess_field(name, raws[name], specs) for name in fields}
+    t4 = clock()
+    if timings is not None:
+        timings["open"] = (t1 - t0) + (t3 - t2)  # 열기 + 닫기
+        timings["clip"] = t2 - t1
+        timings["postprocess"] = t4 - t3
+    if unread:
+        raws = {name: raw for name, raw in raws.items() if name not in unread}
+    return raws, data
+
+
+def validate_row(file_name: str, data: dict, specs: Dict[str, FieldSpec] | None = None) -> List[str]:
+    """필드 규칙(check/required)으로 형식 검증 → 점검 결과 문구 목록."""
+    specs = specs or FIELD_SPECS
+    issues = []
+    for name, value in data.items():
+        spec = specs.get(name)
+        if spec is None:
+            continue
+        if spec.check is not None and value and not spec.check.match(str(value)):
+            issues.append(f"⚠️ {file_name} : {name} 형식 확인 → {value}")
+        if spec.required and (value is None or value == ""):
+            issues.append(f"⚠️ {file_name} : {name} 인식 실패/형식 오류")
+    return issues
+
+
+def declaration_ranges(source: PdfSource, split: dict | None) -> List[Tuple[int, int]]:
+    """
+    템플릿 "split" 규칙으로 PDF를 신고서 단위 [(시작 페이지, 페이지 수)]로 나눈다.
+    - {"pages": N}: N페이지마다 1건 (마지막 건은 남은 페이지)
+    - {"anchor": "문구"}: 문구(공백·대소문자 무시)가 있는 페이지마다 새 건 시작. 첫 문구 앞 페이지(표지 등)는 제외,
+      문구가 한 번도 없으면 [] — 페이지를 1장씩 로드해 텍스트만 보고 바로 버림(큰 파일도 전체를 올리지 않음)
+    - 규칙 없음: 파일 전체가 1건
+    """
+    with open_pdf(source) as doc:
+        n = doc.page_count
+        split = split or {}
+        if split.get("pages"):
+            step = max(1, int(split["pages"]))
+            return [(s, min(step, n - s)) for s in range(0, n, step)]
+        anchor = _norm_label(split.get("anchor") or "")
+        if not anchor:
+            return [(0, n)]
+        starts = [p for p in range(n) if anchor in _norm_label(doc.load_page(p).get_text("text"))]
+    return [(s, e - s) for s, e in zip(starts, starts[1:] + [n])]
+
+
+def split_declarations(items: List[Tuple[str, PdfSource]], split: dict | None
+                       ) -> Tuple[List[Tuple[str, PdfSource]], List[int], List[str]]:
+    """
+    (파일명, PDF) 목록 → (신고서 단위 목록, 단위별 입력 인덱스, 분할 실패 문구).
+    한 파일에 여러 건이면 이름에 " [p시작-끝]"을 붙이고 PageRange로 전달(원본 해시는 파일당 1회만 계산).
+    split이 없으면 입력을 그대로 돌려준다.
+    """
+    if not split:
+        return list(items), list(range(len(items))), []
+    units: List[Tuple[str, PdfSource]] = []
+    owners: List[int] = []
+    issues: List[str] = []
+    for i, (name, src) in enumerate(items):
+        try:
+            ranges = declaration_ranges(src, split)
+        except Exception as e:
+            issues.append(f"❌ {name} 처리 오류: {e}")
+            continue
+        if not ranges:
+            issues.append(f"❌ {name} 신고서 구분 문구를 찾지 못함 ({split.get('anchor')})")
+            continue
+        total = sum(ranges[-1])  # 마지막 건의 끝 = 전체 페이지 수
+        if len(ranges) == 1 and ranges[0] == (0, total):
+            units.append((name, src))
+            owners.append(i)
+            continue
+        sha = pdf_sha256(src)
+        for start, count in ranges:
+            units.append((f"{name} [p{start + 1}-{start + count}]", PageRange(src, start, count, total, sha)))
+            owners.append(i)
+    return units, owners, issues
+
+
+# 워커 프로세스 전역 (initializer로 1회 전달 → 작업마다 파일 바이트만 전송) — 풀 워커 프로세스 안에서만 씀
+_WORKER_CTX: dict = {}
+
+
+def _worker_ctx(norm_rects: Dict[str, List[float]], fields: List[str], mode: str,
+                field_defs: Dict[str, dict] | None = None, validate: bool = True,
+                timed: bool = False, field_pages: Dict[str, int] | None = None, ocr: bool = True) -> dict:
+    """run_batch 추출 설정 → _batch_worker가 읽는 컨텍스트 dict."""
+    return dict(norm_rects=norm_rects, fields=fields, mode=mode, specs=build_field_specs(field_defs),
+                validate=validate, timed=timed, field_pages=field_pages, ocr=ocr)
+
+
+def _init_pool_worker(*ctx) -> None:
+    """ProcessPoolExecutor 워커 전용 초기화 (같은 프로세스에서 도는 run_batch는 전역·환경 변수를 건드리지 않음)."""
+    # 크롭 단위로 나눠 OCR하므로 tesseract 내부(OpenMP) 스레드는 1개 (사용자가 지정했으면 유지)
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    _WORKER_CTX.clear()
+    _WORKER_CTX.update(_worker_ctx(*ctx))
+
+
+def _pool_mp_context():
+    """
+    ProcessPoolExecutor 시작 방식. 메인 스레드가 아니면(Streamlit 스크립트·작업 스레드 등 다중 스레드 프로세스)
+    fork한 자식이 다른 스레드가 잡고 있던 잠금에 걸려 멈출 수 있으므로 forkserver(없으면 spawn)를 씀.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return None
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])  # 서버 프로세스가 이 모듈을 한 번 임포트 → 워커 시작 비용 절감
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _batch_worker(ctx: dict, idx: int, file_name: str, source: PdfSource, known: Dict[str, str] | None = None
+                  ) -> Tuple[int, dict | None, dict | None, List[str], Dict[str, float] | None]:
+    timings = {} if ctx["timed"] else None
+    try:
+        raws, data = extract_declaration(source, ctx["norm_rects"], ctx["fields"], mode=ctx["mode"],
+                                         specs=ctx["specs"], timings=timings, known=known,
+                                         field_pages=ctx["field_pages"], ocr=ctx["ocr"])
+        issues = validate_row(file_name, data, ctx["specs"]) if ctx["validate"] else []
+        unread = [name for name in ctx["fields"] if name not in raws]
+        if unread:
+            why = "OCR 엔진(pytesseract·tesseract) 없음" if ctx["ocr"] else "OCR 꺼짐"
+            issues.append(f"⚠️ {file_name} : 텍스트 레이어 없음(스캔본) — {why}, 빈 값 {len(unread)}개 필드")
+        return idx, raws, data, issues, timings
+    except Exception as e:
+        return idx, None, None, [f"❌ {file_name} 처리 오류: {e}"], timings
+
+
+def _batch_worker_chunk(chunk: List[Tuple[int, str, PdfSource, Dict[str, str] | None]]
+                        ) -> List[Tuple[int, dict | None, dict | None, List[str], Dict[str, float] | None]]:
+    return [_batch_worker(_WORKER_CTX, *item) for item in chunk]
+
+
+def _batch_worker_ctx_chunk(ctx: tuple, chunk: List[Tuple[int, str, PdfSource, Dict[str, str] | None]]
+                            ) -> List[Tuple[int, dict | None, dict | None, List[str], Dict[str, float] | None]]:
+    """공유 풀(run_batch(executor=…))용: 묶음마다 _worker_ctx 인자를 받아, 직전과 다를 때만 워커 전역 갱신."""
+    if _WORKER_CTX.get("args") != ctx:
+        _init_pool_worker(*ctx)
+        _WORKER_CTX["args"] = ctx
+    return _batch_worker_chunk(chunk)
+
+
+def run_batch(items: List[Tuple[str, PdfSource]], norm_rects: Dict[str, List[float]], fields: List[str],
+              mode: str = "clip", workers: int = 1,
+              on_progress: Callable[[int, int, str], None] | None = None,
+              cache: "ExtractionCache | None" = None, dpi: int = DPI_DEFAULT,
+              field_defs: Dict[str, dict] | None = None, validate: bool = True,
+              on_row: Callable[[str, dict], None] | None = None,
+              metrics: StageMetrics | None = None, mem_budget: int | None = BATCH_MEM_BUDGET,
+              on_file: Callable[[int, dict | None, List[str]], None] | None = None,
+              field_pages: Dict[str, int] | None = None, ocr: bool = True,
+              executor: Executor | None = None) -> BatchResult:
+    """
+    (파일명, 바이트 또는 경로) 목록을 변환해 BatchResult(rows, issues, names, source_keys, indices) 반환.
+    결과 순서는 완료 순서와 무관하게 입력 순서로 고정. on_progress(완료수, 전체수, 파일명)은 완료 시마다 호출.
+    cache가 있으면 (PDF, ROI) 단위로 조회해 모든 필드가 적중한 파일은 열지 않고, 일부만 적중한 파일은
+      나머지 필드만 클립(템플릿 좌표 하나를 고치면 그 열만 재추출). 새로 클립한 raw는 캐시에 저장.
+    dpi: 템플릿 렌더 해상도 — 텍스트 추출·캐시 키에는 영향 없음(호출 호환용으로 유지).
+    field_defs: 템플릿 "fields" 정의(기본 필드 규칙에 추가/재정의).
+    validate=False면 행별 형식 검증을 생략(호출측이 validate_frame으로 열 단위 검증).
+    on_row(파일명, 행)은 앞선 파일이 모두 끝난 시점마다 입력 순서대로 호출(스트리밍 내보내기용).
+    on_file(입력 인덱스, 후처리 값 또는 None, 문구)은 파일이 끝나는 즉시(완료 순서) 호출(체크포인트용).
+      여기서 예외를 던지면 남은 작업을 취소하고 그대로 전파.
+    metrics: 파일별 open/clip/postprocess 시간, cache/batch 경과, files/fields/failures/cache_* 카운터 기록.
+    mem_budget: 병렬 시 워커에 맡긴(미완료) PDF 크기 합 상한. 넘으면 앞 묶음이 끝날 때까지 제출 대기(None = 무제한).
+    field_pages: 템플릿 "field_pages"(필드별 신고서 안 페이지). 여러 건 PDF는 split_declarations로 먼저 나눠 전달.
+    ocr: 텍스트 레이어 없는 스캔본은 ROI만 잘라 OCR (엔진 설치 시). 결과 raw는 다른 필드처럼 (PDF, ROI)로 캐시.
+    executor: 여러 배치가 함께 쓰는 프로세스 풀(상주 서비스용). 주면 풀을 새로 만들지 않고 파일 수와 무관하게
+      여기에 제출하며(묶음마다 템플릿 설정 동봉), 중단 시 이 배치의 미시작 묶음만 취소. workers는 풀 크기로 전달.
+    """
+    m = metrics if metrics is not None else _NULL_METRICS
+    t_batch = time.perf_counter()
+    specs = build_field_specs(field_defs)
+    total = len(items)
+    results: List[Tuple[dict | None, List[str]] | None] = [None] * total
+    done = 0
+    next_emit = 0
+
+    def _finish(i: int, data: dict | None, iss: List[str]):
+        nonlocal done, next_emit
+        results[i] = (data, iss)
+        done += 1
+        m.count("files")
+        if data is None:
+            m.count("failures")
+        else:
+            m.count("fields", len(data))
+        if on_file:
+            on_file(i, data, iss)
+        if on_progress:
+            on_progress(done, total, items[i][0])
+        while on_row and next_emit < total and results[next_emit] is not None:
+            if results[next_emit][0] is not None:
+                on_row(items[next_emit][0], results[next_emit][0])
+            next_emit += 1
+
+    pending = list(range(total))
+    known: Dict[int, Dict[str, str]] = {}  # 입력 인덱스 → 캐시에서 찾은 필드 raw (일부 적중)
+    fresh: List[Tuple[int, dict]] = []
+    if cache is not None:
+        hits = []
+        with m.stage("cache"):
+            pages = field_pages or {}
+            rois = {name: roi_hash(norm_rects[name], pages.get(name, 0)) for name in fields}
+            keys = [pdf_sha256(b) for _, b in items]
+            pending = []
+            for i in range(total):
+                got = cache.get(keys[i], rois)
+                if len(got) == len(fields):
+                    hits.append((i, {name: postprocess_field(name, got[name], specs) for name in fields}))
+                else:
+                    pending.append(i)
+                    if got:
+                        known[i] = got
+        m.count("cache_hits", len(hits))
+        m.count("cache_misses", len(pending))
+        for i, data in hits:
+            _finish(i, data, validate_row(items[i][0], data, specs) if validate else [])
+
+    def _collect(i: int, raws: dict | None, data: dict | None, iss: List[str], tm: Dict[str, float] | None):
+        if tm:
+            m.add_file(items[i][0], tm)
+        if data is not None:
+            m.count("clips", len(fields) - len(known.get(i, ())))
+            fresh.append((i, raws))
+        _finish(i, data, iss)
+
+    ctx = (norm_rects, fields, mode, field_defs, validate, m.enabled, field_pages, ocr)
+    if executor is None and (workers <= 1 or len(pending) <= 1):
+        # 같은 프로세스: 세션·작업 스레드가 함께 쓰므로 모듈 전역 대신 이 호출만의 컨텍스트를 넘김
+        local = _worker_ctx(*ctx)
+        for i in pending:
+            _collect(*_batch_worker(local, i, *items[i], known.get(i)))
+    elif pending:
+        # 워커 함수는 이 모듈(Streamlit 비의존)에 있으므로 spawn/forkserver 플랫폼에서도 재임포트 가능
+        if executor is None:
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=_pool_mp_context(),
+                                       initializer=_init_pool_worker, initargs=ctx)
+            task: tuple = (_batch_worker_chunk,)
+        else:
+            pool = contextlib.nullcontext(executor)
+            task = (_batch_worker_ctx_chunk, ctx)
+        with tempfile.TemporaryDirectory(prefix="receipt_split_") as spill_dir, pool as ex:
+            # 작은 PDF는 IPC 비용이 추출 비용과 비슷 → 워커당 ~4묶음으로 나눠 전송
+            size = max(1, min(BATCH_CHUNK_MAX, len(pending) // (max(workers, 1) * 4)))
+            indexed = _spill_page_ranges([(i, *items[i], known.get(i)) for i in pending], spill_dir)
+            chunks = [indexed[k:k + size] for k in range(0, len(indexed), size)]
+            budget = mem_budget or float("inf")
+            in_flight: Dict = {}  # future → 묶음 크기
+            used = nxt = 0
+            try:
+                while nxt < len(chunks) or in_flight:
+                    # 한도 안에서 제출 (진행 중인 묶음이 없으면 한도를 넘는 묶음도 1개는 제출 → 교착 없음)
+                    while nxt < len(chunks):
+                        cost = sum(source_size(item[2]) for item in chunks[nxt])
+                        if in_flight and used + cost > budget:
+                            break
+                        in_flight[ex.submit(*task, chunks[nxt])] = cost
+                        used += cost
+                        nxt += 1
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        used -= in_flight.pop(fut)
+                        for out in fut.result():
+                            _collect(*out)
+            except BaseException:
+                # on_file 등에서 중단 → 아직 시작 안 한 묶음은 취소하고 전파 (공유 풀은 이 배치 묶음만)
+                if executor is None:
+                    ex.shutdown(wait=False, cancel_futures=True)
+                else:
+                    for fut in in_flight:
+                        fut.cancel()
+                raise
+
+    if cache is not None and fresh:
+        with m.stage("cache"):
+            cache.put_many([(keys[i], rois[name], raw)
+                            for i, raws in fresh for name, raw in raws.items() if name not in known.get(i, ())])
+
+    rows, issues, names, source_keys, indices = [], [], [], [], []
+    for i, ((name, b), (data, iss)) in enumerate(zip(items, results)):
+        if data is not None:
+            rows.append(data)
+            names.append(name)
+            source_keys.append(keys[i] if cache is not None else pdf_sha256(b))
+            indices.append(i)
+        issues.extend(iss)
+    m.add("batch", time.perf_counter() - t_batch)
+    return BatchResult(rows, issues, names, source_keys, indices)
+
+# =========================
+# 레이아웃 지문 · 템플릿 자동 판별 (혼합 배치)
+# - 지문: 페이지 크기/회전 + 앵커 라벨(ANCHOR_LABELS) 첫 등장 위치(정규화 좌상단)
+# - 판별: 페이지 크기가 맞는 템플릿 중 앵커 평균 거리가 가장 작은 것 (FINGERPRINT_MAX_DIST 이내)
+# - run_routed_batch: 파일별 판별 → 템플릿별로 묶어 run_batch 1회씩 → 입력 순서로 합침
+# =========================
+_LABEL_STRIP_RE = re.compile(r"[\s:：·]")
+
+
+def _norm_label(text: str) -> str:
+    return _LABEL_STRIP_RE.sub("", text).lower()
+
+
+def layout_fingerprint(words: list, page_rect: fitz.Rect, rotation: int = 0) -> dict:
+    """get_text("words") 결과 → {"v", "page": [w, h], "rotation", "anchors": {키: [xn, yn]}}."""
+    w, h = page_rect.width or 1, page_rect.height or 1
+    found: Dict[str, Tuple[float, float]] = {}
+    for wd in sorted(words, key=lambda t: (t[1], t[0])):  # 위→아래, 왼→오른 첫 등장
+        label = _norm_label(wd[4])
+        for key, prefixes in ANCHOR_LABELS.items():
+            if key not in found and label.startswith(prefixes):
+                found[key] = (wd[0], wd[1])
+    anchors = {k: [round((x - page_rect.x0) / w, 4), round((y - page_rect.y0) / h, 4)]
+               for k, (x, y) in found.items()}
+    return {"v": FINGERPRINT_VERSION, "page": [round(w, 1), round(h, 1)], "rotation": rotation,
+            "anchors": anchors}
+
+
+def pdf_fingerprint(source: PdfSource) -> dict:
+    """PDF 1건(1페이지)의 레이아웃 지문."""
+    with PdfExtractionSession(source) as sess:
+        return sess.fingerprint()
+
+
+def fingerprint_distance(doc_fp: dict, tmpl_fp: dict) -> float:
+    """앵커 평균 거리(정규화 좌표). 페이지 크기/회전이 다르거나 비교할 앵커가 없으면 inf."""
+    (dw, dh), (tw, th) = doc_fp["page"], tmpl_fp["page"]
+    if (doc_fp.get("rotation", 0) != tmpl_fp.get("rotation", 0)
+            or abs(dw - tw) > FINGERPRINT_PAGE_TOL * tw or abs(dh - th) > FINGERPRINT_PAGE_TOL * th):
+        return float("inf")
+    da, ta = doc_fp["anchors"], tmpl_fp["anchors"]
+    keys = set(da) | set(ta)
+    if not (set(da) & set(ta)):
+        return float("inf")
+    total = 0.0
+    for k in keys:
+        if k in da and k in ta:
+            total += ((da[k][0] - ta[k][0]) ** 2 + (da[k][1] - ta[k][1]) ** 2) ** 0.5
+        else:
+            total += FINGERPRINT_MISSING_PENALTY
+    return total / len(keys)
+
+
+class TemplateIndex:
+    """
+    지문이 있는 템플릿을 페이지 크기 버킷으로 묶은 판별 인덱스.
+    버킷 폭은 가장 큰 템플릿 변 × FINGERPRINT_PAGE_TOL 이상 → 허용 오차 안의 문서는 항상 인접 버킷에 들어가므로
+    match()는 인접 버킷의 후보만 거리 계산해도 전체 비교와 같은 결과.
+    """
+
+    def __init__(self, templates: Dict[str, dict]):
+        self.buckets: Dict[Tuple[int, int], List[Tuple[str, dict]]] = {}
+        self.names: List[str] = []
+        entries: List[Tuple[str, dict]] = []
+        for name, t in templates.items():
+            fp = t.get("fingerprint") if name != "__meta" and isinstance(t, dict) else None
+            if not fp or fp.get("v") != FINGERPRINT_VERSION:
+                continue
+            rects = t.get("norm_rects") or {}
+            if any(f not in rects for f in template_fields(t.get("fields"))):
+                continue  # 좌표가 빠진 템플릿은 판별 대상에서 제외
+            entries.append((name, fp))
+        self.width = max([1, *(math.ceil(max(fp["page"]) * FINGERPRINT_PAGE_TOL) for _, fp in entries)])
+        for name, fp in entries:
+            self.buckets.setdefault(self._bucket(fp), []).append((name, fp))
+            self.names.append(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _bucket(self, fp: dict) -> Tuple[int, int]:
+        return int(fp["page"][0] // self.width), int(fp["page"][1] // self.width)
+
+    def match(self, fp: dict, max_dist: float = FINGERPRINT_MAX_DIST) -> Tuple[str, float] | None:
+        """(템플릿명, 거리) 또는 None."""
+        bx, by = self._bucket(fp)
+        best = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for name, tfp in self.buckets.get((bx + dx, by + dy), ()):
+                    d = fingerprint_distance(fp, tfp)
+                    if d <= max_dist and (best is None or d < best[1]):
+                        best = (name, d)
+        return best
+
+
+class RoutedBatchResult(NamedTuple):
+    rows: List[dict]
+    issues: List[str]
+    names: List[str]
+    templates: List[str]   # rows와 같은 순서의 적용 템플릿명
+    source_keys: List[str]  # rows와 같은 순서의 원본 키 (BatchResult.source_keys)
+
+
+def _fingerprint_worker(source: PdfSource) -> Tuple[dict | None, str | None, float]:
+    """route_files 작업 1건 → (지문, 오류 문구, 소요 초). 풀 워커에서도 돌므로 예외 대신 문구로 돌려줌."""
+    t0 = time.perf_counter()
+    try:
+        return pdf_fingerprint(source), None, time.perf_counter() - t0
+    except Exception as e:
+        return None, str(e), time.perf_counter() - t0
+
+
+def route_files(items: List[Tuple[str, PdfSource]], index: TemplateIndex, fallback: str | None = None,
+                metrics: StageMetrics | None = None, workers: int = 1,
+                executor: Executor | None = None) -> Tuple[Dict[str, List[int]], List[str]]:
+    """
+    파일별 템플릿 판별 → ({템플릿명: [입력 인덱스]}, 판별 실패 문구).
+    지문(파일 열기 + 첫 페이지 단어 추출)은 executor가 있거나 workers > 1이면 프로세스 풀에서 병렬로 뽑고,
+    판별(TemplateIndex.match)은 호출 프로세스에서 입력 순서대로.
+    """
+    m = metrics if metrics is not None else _NULL_METRICS
+    sources = [b for _, b in items]
+    if executor is not None or (workers > 1 and len(items) > 1):
+        pool = (contextlib.nullcontext(executor) if executor is not None else
+                ProcessPoolExecutor(max_workers=min(workers, len(items)), mp_context=_pool_mp_context()))
+        with pool as ex:
+            size = max(1, min(BATCH_CHUNK_MAX, len(items) // (max(workers, 1) * 4)))
+            fps: Iterable = list(ex.map(_fingerprint_worker, sources, chunksize=size))
+    else:
+        fps = map(_fingerprint_worker, sources)
+    groups: Dict[str, List[int]] = {}
+    issues: List[str] = []
+    for i, ((name, _), (fp, err, seconds)) in enumerate(zip(items, fps)):
+        m.add("route", seconds, name)
+        if err is not None:
+            issues.append(f"❌ {name} 처리 오류: {err}")
+            m.count("files")
+            m.count("failures")
+            continue
+        hit = index.match(fp)
+        if hit is None and fallback is None:
+            issues.append(f"❌ {name} 템플릿 판별 실패 (일치하는 레이아웃 없음)")
+            m.count("files")
+            m.count("failures")
+            continue
+        groups.setdefault(hit[0] if hit else fallback, []).append(i)
+    return groups, issues
+
+
+def run_routed_batch(items: List[Tuple[str, PdfSource]], templates: Dict[str, dict], mode: str = "clip",
+                     workers: int = 1, on_progress: Callable[[int, int, str], None] | None = None,
+                     cache: "ExtractionCache | None" = None, validate: bool = True,
+                     fallback: str | None = None, metrics: StageMetrics | None = None,
+                     mem_budget: int | None = BATCH_MEM_BUDGET, ocr: bool = True,
+                     executor: Executor | None = None) -> RoutedBatchResult:
+    """
+    혼합 양식 배치: 지문으로 파일별 템플릿을 고른 뒤 템플릿별로 run_batch를 한 번씩 돌리고 입력 순서로 합친다.
+    fallback: 판별 실패 파일에 적용할 템플릿명(없으면 점검 결과에 실패로 보고).
+    템플릿에 "split"이 있으면 판별된 파일을 신고서 단위로 나눠 건마다 1행 (이름에 페이지 범위).
+    executor가 없고 workers > 1이면 풀 1개를 만들어 판별(지문)과 템플릿별 변환에 함께 씀.
+    """
+    if executor is None and workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(items)), mp_context=_pool_mp_context()) as pool:
+            return run_routed_batch(items, templates, mode=mode, workers=workers, on_progress=on_progress,
+                                    cache=cache, validate=validate, fallback=fallback, metrics=metrics,
+                                    mem_budget=mem_budget, ocr=ocr, executor=pool)
+    index = TemplateIndex(templates)
+    groups, issues = route_files(items, index, fallback, metrics, workers=workers, executor=executor)
+    # 템플릿별 분할 규칙으로 신고서 단위로 나눔 (판별은 파일 첫 페이지 기준)
+    split: Dict[str, Tuple[List[Tuple[str, PdfSource]], List[int]]] = {}
+    for tname, idxs in groups.items():
+        units, owners, errs = split_declarations([items[i] for i in idxs], templates[tname].get("split"))
+        split[tname] = (units, [idxs[k] for k in owners])
+        issues.extend(errs)
+    total = sum(len(units) for units, _ in split.values())
+    done_before = 0
+    placed: List[Tuple[int, int, dict, str, str, str]] = []  # (입력 인덱스, 단위 순번, 행, 이름, 템플릿명, 원본 키)
+    for tname, (group, owners) in split.items():
+        t = templates[tname]
+
+        def _on_progress(done: int, _total: int, name: str, _base=done_before):
+            if on_progress:
+                on_progress(_base + done, total, name)
+
+        res = run_batch(group, t["norm_rects"], template_fields(t.get("fields")), mode=mode, workers=workers,
+                        on_progress=_on_progress, cache=cache, dpi=t.get("dpi", DPI_DEFAULT),
+                        field_defs=t.get("fields"), validate=validate, metrics=metrics, mem_budget=mem_budget,
+                        field_pages=t.get("field_pages"), ocr=ocr, executor=executor)
+        done_before += len(group)
+        issues.extend(res.issues)
+        # 실패 건은 빠지므로 이름이 아니라 입력 인덱스로 대응 (같은 파일명이 여러 개일 수 있음)
+        for u, row, name, key in zip(res.indices, res.rows, res.names, res.source_keys):
+            placed.append((owners[u], u, row, name, tname, key))
+    placed.sort(key=lambda x: x[:2])
+    return RoutedBatchResult([p[2] for p in placed], issues, [p[3] for p in placed], [p[4] for p in placed],
+                             [p[5] for p in placed])
+
+
+def routed_frame(res: RoutedBatchResult, templates: Dict[str, dict]) -> Tuple[pd.DataFrame, Dict[str, FieldSpec]]:
+    """혼합 배치 결과 → (적용 템플릿들의 필드 합집합 + TEMPLATE_COLUMN 프레임, 합친 필드 규칙)."""
+    field_defs: Dict[str, dict] = {}
+    for name in dict.fromkeys(res.templates):
+        field_defs.update(templates[name].get("fields") or {})
+    df = pd.DataFrame(res.rows, columns=template_fields(field_defs))
+    df[TEMPLATE_COLUMN] = res.templates
+    return df, build_field_specs(field_defs)
+
+# =========================
+# 백그라운드 변환 작업 (SQLite 체크포인트 · 재개)
+# - JobStore: 작업/파일 상태와 파일별 결과를 즉시 기록 → 새로고침·세션 만료·재시작 후에도 이어서 처리
+# - JobRunner: 작업마다 스레드 1개에서 run_batch(on_file 체크포인트) 실행, 끝난 파일은 다시 처리하지 않음
+# - spec: {"templates": {이름: 템플릿}, "template": 기본 템플릿명, "auto": 자동 판별 여부,
+#          "mode", "workers", "mem_budget", "use_cache"}
+# =========================
+class JobCancelled(Exception):
+    """JobRunner.stop() 요청으로 작업을 멈출 때 on_file에서 던진다."""
+
+
+class JobStore:
+    """작업/파일 상태 저장소. 여러 스레드(작업 스레드 + UI)가 공유."""
+
+    def __init__(self, path: str = JOBS_FILE, spool_dir: str = JOBS_DIR):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, title TEXT NOT NULL, spec TEXT NOT NULL, status TEXT NOT NULL,"
+            " total INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, name TEXT NOT NULL, path TEXT NOT NULL,"
+            " template TEXT, status TEXT NOT NULL DEFAULT 'pending', data TEXT, issues TEXT,"
+            " PRIMARY KEY (job_id, idx));"
+        )
+        self._conn.commit()
+
+    def create(self, title: str, uploads: Iterable[Tuple[str, BinaryIO]], spec: dict) -> str:
+        """입력을 작업 폴더에 복사하고 작업 등록 → 작업 ID."""
+        job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        files = spill_to_dir(uploads, job_dir)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO jobs (id, title, spec, status, total, created, updated)"
+                               " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                               (job_id, title, json.dumps(spec, ensure_ascii=False), len(files), now, now))
+            self._conn.executemany("INSERT INTO job_files (job_id, idx, name, path) VALUES (?, ?, ?, ?)",
+                                   [(job_id, i, name, path) for i, (name, path) in enumerate(files)])
+            self._conn.commit()
+        return job_id
+
+    def _job_row(self, row) -> dict:
+        keys = ("id", "title", "spec", "status", "total", "done", "error", "created", "updated")
+        job = dict(zip(keys, row))
+        job["spec"] = json.loads(job["spec"])
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT id, title, spec, status, total, done, error, created, updated"
+                                     " FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._job_row(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, title, spec, status, total, done, error, created, updated"
+                                      " FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job_row(r) for r in rows]
+
+    def set_status(self, job_id: str, status: str, error: str | None = None) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status=?, error=?, updated=? WHERE id=?",
+                               (status, error, time.time(), job_id))
+            self._conn.commit()
+
+    def pending_files(self, job_id: str) -> List[Tuple[int, str, str, str | None]]:
+        """아직 끝나지 않은 파일 [(idx, 파일명, 경로, 판별 템플릿)] (입력 순서)."""
+        with self._lock:
+            return self._conn.execute("SELECT idx, name, path, template FROM job_files"
+                                      " WHERE job_id=? AND status='pending' ORDER BY idx", (job_id,)).fetchall()
+
+    def set_templates(self, job_id: str, routes: List[Tuple[int, str]]) -> None:
+        """[(idx, 템플릿명)] 판별 결과 기록 (재개 시 다시 판별하지 않음)."""
+        with self._lock:
+            self._conn.executemany("UPDATE job_files SET template=? WHERE job_id=? AND idx=?",
+                                   [(t, job_id, i) for i, t in routes])
+            self._conn.commit()
+
+    def checkpoint(self, job_id: str, idx: int, data: dict | list | None, issues: List[str]) -> None:
+        """파일 1건 결과를 즉시 커밋. data = [[건 이름, 행, 원본 키], ...] (나뉘지 않은 파일은 1개)."""
+        with self._lock:
+            self._conn.execute("UPDATE job_files SET status=?, data=?, issues=? WHERE job_id=? AND idx=?",
+                               ("done" if data is not None else "failed",
+                                json.dumps(data, ensure_ascii=False) if data is not None else None,
+                                json.dumps(issues, ensure_ascii=False), job_id, idx))
+            self._conn.execute("UPDATE jobs SET done=done+1, updated=? WHERE id=?", (time.time(), job_id))
+            self._conn.commit()
+
+    def results(self, job_id: str) -> RoutedBatchResult:
+        """지금까지 끝난 파일의 결과 (입력 순서, 진행 중이면 부분 결과)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, template, data, issues FROM job_files"
+                                      " WHERE job_id=? AND status!='pending' ORDER BY idx", (job_id,)).fetchall()
+        out = RoutedBatchResult([], [], [], [], [])
+        for name, tmpl, data, issues in rows:
+            out.issues.extend(json.loads(issues or "[]"))
+            if data is None:
+                continue
+            data = json.loads(data)
+            # 이전 형식: 행 dict 또는 [[건 이름, 행], ...] (원본 키 없음)
+            for unit_name, row, *key in data if isinstance(data, list) else [(name, data)]:
+                out.rows.append(row)
+                out.names.append(unit_name)
+                out.templates.append(tmpl or "")
+                out.source_keys.append(key[0] if key else None)
+        return out
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM job_files WHERE job_id=?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+            self._conn.commit()
+        shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+
+
+class JobRunner:
+    """
+    JobStore의 작업을 백그라운드 스레드에서 실행. 프로세스당 1개(앱은 st.cache_resource로 공유).
+    생성 시 '진행 중'으로 남은 작업(이전 프로세스가 죽은 경우)은 '중단됨'으로 바꿔 재개 대상으로 둔다.
+    """
+
+    def __init__(self, store: JobStore, cache: ExtractionCache | None = None):
+        self.store = store
+        self.cache = cache
+        self._threads: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+        self._lock = threading.Lock()
+        for job in store.list_jobs(limit=1000):
+            if job["status"] in ("queued", "running"):
+                store.set_status(job["id"], "interrupted")
+
+    def submit(self, title: str, uploads: Iterable[Tuple[str, BinaryIO]], spec: dict) -> str:
+        job_id = self.store.create(title, uploads, spec)
+        self.start(job_id)
+        return job_id
+
+    def start(self, job_id: str) -> bool:
+        """작업 시작/재개 (이미 실행 중이면 False)."""
+        with self._lock:
+            if self.is_running(job_id):
+                return False
+            stop = threading.Event()
+            t = threading.Thread(target=self._run, args=(job_id, stop), name=f"receipt-job-{job_id}", daemon=True)
+            self._threads[job_id] = (t, stop)
+            self.store.set_status(job_id, "running")
+            t.start()
+            return True
+
+    def stop(self, job_id: str) -> None:
+        entry = self._threads.get(job_id)
+        if entry:
+            entry[1].set()
+
+    def is_running(self, job_id: str) -> bool:
+        entry = self._threads.get(job_id)
+        return bool(entry and entry[0].is_alive())
+
+    def _run(self, job_id: str, stop: threading.Event) -> None:
+        store = self.store
+        try:
+            spec = store.get(job_id)["spec"]
+            templates = spec["templates"]
+            pending = store.pending_files(job_id)
+
+            def _checkpoint(idx: int, data: dict | None, issues: List[str]) -> None:
+                store.checkpoint(job_id, idx, data, issues)
+                if stop.is_set():
+                    raise JobCancelled()
+
+            # 판별: 자동이면 아직 템플릿이 없는 파일만 지문으로 판별 (결과 기록 → 재개 시 재사용)
+            routes = {idx: tmpl for idx, _, _, tmpl in pending if tmpl}
+            todo = [(idx, name, path) for idx, name, path, tmpl in pending if not tmpl]
+            if todo and spec.get("auto"):
+                groups, issues = route_files([(n, p) for _, n, p in todo], TemplateIndex(templates),
+                                             fallback=spec.get("template"), workers=spec.get("workers", 1))
+                for tname, ks in groups.items():
+                    routes.update((todo[k][0], tname) for k in ks)
+                failed = sorted(set(range(len(todo))) - {k for ks in groups.values() for k in ks})
+                for k, msg in zip(failed, issues):
+                    _checkpoint(todo[k][0], None, [msg])
+            elif todo:
+                routes.update((idx, spec["template"]) for idx, _, _ in todo)
+            store.set_templates(job_id, sorted(routes.items()))
+
+            by_tmpl: Dict[str, List[Tuple[int, str, str]]] = {}
+            for idx, name, path, _ in pending:
+                if idx in routes:
+                    by_tmpl.setdefault(routes[idx], []).append((idx, name, path))
+            for tname, group in by_tmpl.items():
+                t = templates[tname]
+                units, owners, errs = split_declarations([(name, path) for _, name, path in group], t.get("split"))
+                failed = set(range(len(group))) - set(owners)
+                for k, msg in zip(sorted(failed), errs):
+                    _checkpoint(group[k][0], None, [msg])
+                # 여러 건으로 나뉜 파일은 모든 건이 끝나야 체크포인트 (재개 단위는 파일)
+                left = {k: owners.count(k) for k in set(owners)}
+                parts: Dict[int, Tuple[List[list], List[str]]] = {k: ([], []) for k in left}
+
+                def _on_unit(u: int, data: dict | None, iss: List[str], _g=group, _units=units, _owners=owners,
+                             _left=left, _parts=parts) -> None:
+                    k = _owners[u]
+                    if data is not None:
+                        _parts[k][0].append([_units[u][0], data, pdf_sha256(_units[u][1])])
+                    _parts[k][1].extend(iss)
+                    _left[k] -= 1
+                    if _left[k] == 0:
+                        rows, iss_all = _parts.pop(k)
+                        _checkpoint(_g[k][0], rows or None, iss_all)
+
+                run_batch(units, t["norm_rects"], template_fields(t.get("fields")),
+                          mode=spec.get("mode", "clip"), workers=spec.get("workers", 1),
+                          cache=self.cache if spec.get("use_cache") else None, dpi=t.get("dpi", DPI_DEFAULT),
+                          field_defs=t.get("fields"), validate=False, mem_budget=spec.get("mem_budget"),
+                          on_file=_on_unit, field_pages=t.get("field_pages"), ocr=spec.get("ocr", True))
+            store.set_status(job_id, "done")
+        except JobCancelled:
+            store.set_status(job_id, "cancelled")
+        except Exception as e:
+            store.set_status(job_id, "failed", f"{type(e).__name__}: {e}")
+
+# =========================
+# 반입 이력 (SQLite · B/L · 신고번호 · 신고일 인덱스)
+# - 변환한 행을 원본 키(PDF SHA-256 + 페이지 범위)로 기록 → 같은 신고서를 다시 변환하면 이전 기록을 덮어씀
+# - 다음 배치에서 지난 반입과 겹치는 B/L/신고번호를 행마다 인덱스 조회 — 같은 원본의 기록은 중복으로 보지 않음
+# - 신고일은 ISO(YYYY-MM-DD)로 따로 저장해 기간 조회(대사용 내보내기)
+# =========================
+def _ledger_key(value) -> str:
+    return re.sub(r"\s", "", str(value or "")).upper()
+
+
+def _ledger_source(source_keys: List[str | None] | None, i: int, batch_id: str, name: str) -> str:
+    """이력 행의 원본 키 (없으면 배치 ID + 파일명)."""
+    key = source_keys[i] if source_keys else None
+    return key or f"{batch_id}/{name}"
+
+
+def _ledger_date(value) -> str | None:
+    try:
+        return datetime.strptime(str(value), "%Y/%m/%d").date().isoformat()
+    except ValueError:
+        return None
+
+
+class DeclarationLedger:
+    """반입 이력 저장소. 여러 세션(스레드)이 공유."""
+
+    def __init__(self, path: str = LEDGER_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS declarations ("
+            " id INTEGER PRIMARY KEY, batch_id TEXT NOT NULL, file_name TEXT NOT NULL, template TEXT,"
+            " bl TEXT, decl_no TEXT, decl_date TEXT, imported REAL NOT NULL, data TEXT NOT NULL,"
+            " source_key TEXT);"
+        )
+        if "source_key" not in {r[1] for r in self._conn.execute("PRAGMA table_info(declarations)")}:
+            self._conn.execute("ALTER TABLE declarations ADD COLUMN source_key TEXT")  # 원본 키 이전 이력
+        self._conn.executescript(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_declarations_source ON declarations(source_key);"
+            "CREATE INDEX IF NOT EXISTS ix_declarations_bl ON declarations(bl);"
+            "CREATE INDEX IF NOT EXISTS ix_declarations_decl_no ON declarations(decl_no);"
+            "CREATE INDEX IF NOT EXISTS ix_declarations_date ON declarations(decl_date);"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM declarations").fetchone()[0]
+
+    def record(self, rows: List[dict], names: List[str], batch_id: str,
+               templates: List[str] | None = None, source_keys: List[str | None] | None = None) -> int:
+        """
+        배치 결과(후처리 값 행) 기록 → 기록(추가·갱신)한 행 수.
+        source_keys(BatchResult.source_keys)가 같은 기록은 새 값으로 바꿈 → 같은 폴더를 다시 변환해도 1건.
+        원본 키가 없으면 (batch_id, 파일명)으로 대신함.
+        """
+        now = time.time()
+        recs = [(batch_id, name, templates[i] if templates else None,
+                 _ledger_key(row.get(LEDGER_KEYS["bl"])) or None,
+                 _ledger_key(row.get(LEDGER_KEYS["decl_no"])) or None,
+                 _ledger_date(row.get("신고일")), now, json.dumps(row, ensure_ascii=False),
+                 _ledger_source(source_keys, i, batch_id, name))
+                for i, (row, name) in enumerate(zip(rows, names))]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO declarations"
+                " (batch_id, file_name, template, bl, decl_no, decl_date, imported, data, source_key)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", recs)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def find_duplicates(self, rows: List[dict], exclude_batch: str | None = None,
+                        source_keys: List[str | None] | None = None) -> List[Tuple[int, str, List[dict]]]:
+        """
+        행마다 B/L · 신고번호로 지난 이력 조회(인덱스) → [(행 인덱스, 필드, 이전 기록들(최근 순))].
+        exclude_batch: 같은 배치의 기록은 제외(재표시·부분 결과 재기록 시).
+        source_keys: 행과 원본 키가 같은 기록(같은 신고서를 다시 변환)은 제외 → 다른 파일에서 온 것만 중복.
+        """
+        found: List[Tuple[int, str, List[dict]]] = []
+        for col, field in LEDGER_KEYS.items():
+            by_key: Dict[str, List[int]] = {}
+            for i, row in enumerate(rows):
+                k = _ledger_key(row.get(field))
+                if k:
+                    by_key.setdefault(k, []).append(i)
+            keys = list(by_key)
+            prev: Dict[str, List[dict]] = {}
+            with self._lock:
+                for c in range(0, len(keys), LEDGER_QUERY_CHUNK):
+                    part = keys[c:c + LEDGER_QUERY_CHUNK]
+                    q = (f"SELECT {col}, file_name, batch_id, decl_date, imported, source_key FROM declarations"
+                         f" WHERE {col} IN ({','.join('?' * len(part))}) AND batch_id IS NOT ?"
+                         f" ORDER BY imported DESC")
+                    for k, file_name, batch_id, decl_date, imported, source in self._conn.execute(
+                            q, (*part, exclude_batch)):
+                        prev.setdefault(k, []).append({"file_name": file_name, "batch_id": batch_id,
+                                                       "decl_date": decl_date, "imported": imported,
+                                                       "source_key": source})
+            for k, idxs in by_key.items():
+                for i in idxs:
+                    own = source_keys[i] if source_keys else None
+                    others = [p for p in prev.get(k, ()) if own is None or p["source_key"] != own]
+                    if others:
+                        found.append((i, field, others))
+        return sorted(found, key=lambda t: t[0])
+
+    def duplicate_issues(self, rows: List[dict], names: List[str], exclude_batch: str | None = None,
+                         source_keys: List[str | None] | None = None) -> List[str]:
+        """find_duplicates → 점검 결과 문구 (행 순서)."""
+        out = []
+        for i, field, prev in self.find_duplicates(rows, exclude_batch, source_keys):
+            p = prev[0]
+            more = f" 외 {len(prev) - 1}건" if len(prev) > 1 else ""
+            out.append(f"⚠️ {names[i]} : {field} {rows[i].get(field)} 이전 반입 이력 → {p['file_name']}"
+                       f" ({datetime.fromtimestamp(p['imported']):%Y-%m-%d} 반입{more})")
+        return out
+
+    def query(self, start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """신고일 기간(ISO 'YYYY-MM-DD', 양끝 포함) 이력 → 후처리 값 + 파일명/반입일시 프레임 (신고일 순)."""
+        cond, args = [], []
+        if start:
+            cond.append("decl_date >= ?")
+            args.append(str(start))
+        if end:
+            cond.append("decl_date <= ?")
+            args.append(str(end))
+        where = f" WHERE {' AND '.join(cond)}" if cond else ""
+        with self._lock:
+            recs = self._conn.execute(
+                f"SELECT file_name, template, imported, data FROM declarations{where}"
+                f" ORDER BY decl_date, imported", args).fetchall()
+        rows = []
+        for file_name, template, imported, data in recs:
+            row = json.loads(data)
+            row.update({"파일명": file_name, TEMPLATE_COLUMN: template or "",
+                        "반입일시": datetime.fromtimestamp(imported).strftime("%Y-%m-%d %H:%M")})
+            rows.append(row)
+        fields = list(dict.fromkeys(FIELDS + [k for r in rows for k in r]))
+        return pd.DataFrame(rows, columns=fields)
+
+# =========================
+# 결과 프레임 후처리 (열 단위: 타입 변환 · 검증 · 정렬)
+# =========================
+def type_frame(df: pd.DataFrame, specs: Dict[str, FieldSpec] | None = None) -> pd.DataFrame:
+    """
+    후처리 값 프레임 → 네이티브 dtype.
+    - date: datetime64 (YYYY/MM/DD 고정 포맷, 00월/00일 등 실패는 NaT)
+    - number: 정수만 있으면 Int64, 아니면 Float64 (빈 값은 <NA>)
+    """
+    specs = specs or FIELD_SPECS
+    out = df.copy()
+    for name in out.columns:
+        spec = specs.get(name)
+        if spec is None:
+            continue
+        if spec.kind == "date":
+            out[name] = pd.to_datetime(out[name], format="%Y/%m/%d", errors="coerce")
+        elif spec.kind == "number":
+            col = pd.to_numeric(out[name].replace("", None), errors="coerce")
+            vals = col.dropna()
+            out[name] = col.astype("Int64" if (vals == vals.round()).all() else "Float64")
+    return out
+
+
+def validate_frame(df: pd.DataFrame, names: List[str], specs: Dict[str, FieldSpec] | None = None) -> List[str]:
+    """
+    후처리 값(문자열/숫자, type_frame 이전) 프레임을 필드 규칙(check/required)으로 열 단위 검증.
+    문구는 validate_row와 동일, 순서는 행(파일) 순 → 필드 순.
+    """
+    specs = specs or FIELD_SPECS
+    found: List[Tuple[int, int, str]] = []
+    for j, name in enumerate(df.columns):
+        spec = specs.get(name)
+        if spec is None:
+            continue
+        col = df[name]
+        empty = col.isna() | (col == "")
+        if spec.check is not None:
+            bad = ~empty & ~col.astype(str).str.match(spec.check)
+            for i in bad.to_numpy().nonzero()[0]:
+                found.append((i, 2 * j, f"⚠️ {names[i]} : {name} 형식 확인 → {col.iat[i]}"))
+        if spec.required:
+            for i in empty.to_numpy().nonzero()[0]:
+                found.append((i, 2 * j + 1, f"⚠️ {names[i]} : {name} 인식 실패/형식 오류"))
+    return [msg for _, _, msg in sorted(found)]
+
+
+def sort_by_date(df: pd.DataFrame, col: str = "신고일") -> pd.DataFrame:
+    """신고일 오름차순 (날짜 인식 실패는 맨 뒤)."""
+    if col not in df.columns:
+        return df
+    return df.sort_values(by=col, na_position="last", kind="stable")
+
+# =========================
+# 결과 내보내기 (행 단위 스트리밍: XLSX constant_memory / CSV / Parquet → 임시 파일)
+# =========================
+def _is_blank(v) -> bool:
+    if isinstance(v, str):
+        return v == ""
+    return v is None or v is pd.NA or v is pd.NaT or (isinstance(v, float) and v != v)
+
+
+def _as_datetime(v) -> datetime | None:
+    """Timestamp/datetime 또는 'YYYY/MM/DD' 문자열 → datetime (실패 시 None)."""
+    if isinstance(v, datetime):
+        return v.to_pydatetime() if isinstance(v, pd.Timestamp) else v
+    try:
+        return datetime.strptime(str(v), "%Y/%m/%d")
+    except ValueError:
+        return None
+
+
+def export_unavailable(fmt: str) -> str | None:
+    """내보내기 형식에 필요한 패키지가 없으면 설치 안내 문구, 쓸 수 있으면 None."""
+    if fmt == "parquet" and pa is None:
+        return "Parquet 내보내기에는 pyarrow 설치가 필요합니다 (pip install pyarrow)."
+    return None
+
+
+class ResultExporter:
+    """
+    결과 행을 받는 즉시 임시 파일에 기록. 워크북 전체를 메모리에 쌓지 않는다.
+    - xlsx: xlsxwriter constant_memory (행 순서대로만 기록), 환율 0.0000 / 금액 #,##0 / 신고일 yyyy/mm/dd
+    - csv: UTF-8 BOM (엑셀 한글 호환), 신고일 YYYY/MM/DD, 환율 소수 4자리
+    - parquet: PARQUET_ROW_GROUP 행마다 row group 기록 (pyarrow 필요)
+    사용: with ResultExporter(cols, "xlsx") as ex: ex.write_row(row) … → ex.path
+    """
+
+    def __init__(self, columns: List[str], fmt: str = "xlsx", path: str | None = None,
+                 specs: Dict[str, FieldSpec] | None = None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"지원하지 않는 내보내기 형식: {fmt}")
+        self.columns = list(columns)
+        self.fmt = fmt
+        specs = specs or FIELD_SPECS
+        self.date_cols = {c for c in self.columns if getattr(specs.get(c), "kind", "") == "date"}
+        self.num_cols = {c for c in self.columns if getattr(specs.get(c), "kind", "") == "number"}
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="receipt_export_", suffix=EXPORT_FORMATS[fmt][1])
+            os.close(fd)
+        self.path = path
+        self.rows_written = 0
+        getattr(self, f"_open_{fmt}")()
+
+    def __enter__(self) -> "ResultExporter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- xlsx ----
+    def _open_xlsx(self) -> None:
+        self._wb = xlsxwriter.Workbook(self.path, {"constant_memory": True})
+        self._ws = self._wb.add_worksheet("results")
+        money_fmt = self._wb.add_format({'num_format': '#,##0'})
+        fx_fmt = self._wb.add_format({'num_format': '0.0000'})
+        date_fmt = self._wb.add_format({'num_format': 'yyyy/mm/dd'})
+        self._cell_fmt = {}
+        for j, c in enumerate(self.columns):
+            if c == "환율":
+                self._ws.set_column(j, j, 12)
+                self._cell_fmt[c] = fx_fmt
+            elif c in MONEY_FIELDS:
+                self._ws.set_column(j, j, 14)
+                self._cell_fmt[c] = money_fmt
+            elif c in self.date_cols:
+                self._ws.set_column(j, j, 12)
+                self._cell_fmt[c] = date_fmt
+            else:
+                self._ws.set_column(j, j, 16)
+        for j, c in enumerate(self.columns):
+            self._ws.write_string(0, j, c)
+
+    def _row_xlsx(self, row: dict) -> None:
+        r = self.rows_written + 1
+        for j, c in enumerate(self.columns):
+            v = row.get(c)
+            if _is_blank(v):
+                continue
+            fmt = self._cell_fmt.get(c)
+            if c in self.date_cols:
+                d = _as_datetime(v)
+                if d is not None:
+                    self._ws.write_datetime(r, j, d, fmt)
+                else:
+                    self._ws.write_string(r, j, str(v))
+            elif isinstance(v, numbers.Real) and not isinstance(v, bool):
+                self._ws.write_number(r, j, float(v), fmt)
+            else:
+                self._ws.write_string(r, j, str(v))
+
+    def _close_xlsx(self) -> None:
+        self._wb.close()
+
+    # ---- csv ----
+    def _open_csv(self) -> None:
+        self._fh = open(self.path, "w", encoding="utf-8-sig", newline="")
+        self._csv = csv.writer(self._fh)
+        self._csv.writerow(self.columns)
+
+    def _row_csv(self, row: dict) -> None:
+        out = []
+        for c in self.columns:
+            v = row.get(c)
+            if _is_blank(v):
+                out.append("")
+            elif c in self.date_cols:
+                d = _as_datetime(v)
+                out.append(d.strftime("%Y/%m/%d") if d else str(v))
+            elif c == "환율" and isinstance(v, numbers.Real):
+                out.append(f"{v:.4f}")
+            else:
+                out.append(v)
+        self._csv.writerow(out)
+
+    def _close_csv(self) -> None:
+        self._fh.close()
+
+    # ---- parquet ----
+    def _open_parquet(self) -> None:
+        hint = export_unavailable("parquet")
+        if hint:
+            raise RuntimeError(hint)
+        fields = []
+        for c in self.columns:
+            if c in self.date_cols:
+                fields.append(pa.field(c, pa.timestamp("ms")))
+            elif c in MONEY_FIELDS:
+                fields.append(pa.field(c, pa.int64()))
+            elif c in self.num_cols:
+                fields.append(pa.field(c, pa.float64()))
+            else:
+                fields.append(pa.field(c, pa.string()))
+        self._schema = pa.schema(fields)
+        self._pq = pq.ParquetWriter(self.path, self._schema)
+        self._buf: Dict[str, list] = {c: [] for c in self.columns}
+
+    def _row_parquet(self, row: dict) -> None:
+        for c in self.columns:
+            v = row.get(c)
+            if _is_blank(v):
+                v = None
+            elif c in self.date_cols:
+                v = _as_datetime(v)
+            elif c in MONEY_FIELDS:
+                v = int(round(v)) if isinstance(v, numbers.Real) else None
+            elif c in self.num_cols:
+                v = float(v) if isinstance(v, numbers.Real) else None
+            else:
+                v = str(v)
+            self._buf[c].append(v)
+        if len(self._buf[self.columns[0]]) >= PARQUET_ROW_GROUP:
+            self._flush_parquet()
+
+    def _flush_parquet(self) -> None:
+        if self._buf[self.columns[0]]:
+            self._pq.write_table(pa.Table.from_pydict(self._buf, schema=self._schema))
+            self._buf = {c: [] for c in self.columns}
+
+    def _close_parquet(self) -> None:
+        self._flush_parquet()
+        self._pq.close()
+
+    # ---- 공통 ----
+    def write_row(self, row: dict) -> None:
+        getattr(self, f"_row_{self.fmt}")(row)
+        self.rows_written += 1
+
+    def write_frame(self, df: pd.DataFrame) -> None:
+        """프레임을 행 단위로 흘려 기록 (프레임 크기만큼의 추가 버퍼를 만들지 않음)."""
+        cols = list(df.columns)
+        for values in df.itertuples(index=False, name=None):
+            self.write_row(dict(zip(cols, values)))
+
+    def close(self) -> str:
+        if not getattr(self, "_closed", False):
+            getattr(self, f"_close_{self.fmt}")()
+            self._closed = True
+        return self.path
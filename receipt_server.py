@@ -0,0 +1,411 @@
+# receipt_server.py
+# ------------------------------------------------------------
+# 📄 수입신고필증 PDF 추출 로컬 HTTP 서비스 (표준 라이브러리만 · 오프라인 · ERP 연동/부하 시험용)
+# 실행: python receipt_server.py [--port 8765] [--workers 4] [--queue 32]
+# 요청: curl -F file=@a.pdf -F file=@b.pdf "http://127.0.0.1:8765/extract?template=수입필증1"        (JSON)
+#       curl -F file=@a.pdf "http://127.0.0.1:8765/extract?template=수입필증1&format=xlsx" -o 결과.xlsx
+#       curl --data-binary @a.pdf -H "Content-Type: application/pdf" \
+#            "http://127.0.0.1:8765/extract?auto=1&name=a.pdf"                                  (PDF 1건 본문 전송)
+#       curl http://127.0.0.1:8765/stats                                   (지연 백분위 · 처리량 · 대기열)
+# - 프로세스 풀 1개(--workers)를 모든 요청이 공유, 동시에 받는 요청은 --queue개까지(넘으면 503 + Retry-After)
+# - 템플릿은 시작 시 미리 읽어 두고, 템플릿 DB가 바뀐 경우에만 다시 읽음 (앱에서 저장하면 재시작 없이 반영)
+# ------------------------------------------------------------
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from receipt_engine import (
+    BATCH_MEM_BUDGET, BATCH_WORKERS_DEFAULT, CACHE_FILE, DPI_DEFAULT, EXPORT_FORMATS, EXTRACT_MODES, LEDGER_FILE,
+    TEMPLATE_COLUMN, TEMPLATE_DB, DeclarationLedger, ExtractionCache, ResultExporter, TemplateIndex, TemplateStore,
+    build_field_specs, export_unavailable, load_templates, routed_frame, run_batch, run_routed_batch, sort_by_date,
+    split_declarations, template_fields, type_frame, validate_frame,
+)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_QUEUE = 32              # 동시에 받아 두는 요청 수 (처리 중 + 풀 대기) — 넘으면 503
+SERVER_MAX_BODY_MB = 256       # 요청 본문 상한
+SERVER_RETRY_AFTER = 1         # 503 응답의 Retry-After(초)
+STATS_WINDOW = 10000           # 지연 백분위 계산에 쓰는 최근 요청 수
+STATS_RECENT_SECONDS = 60      # 최근 처리량 계산 구간
+
+logger = logging.getLogger("receipt_server")
+
+
+class ServiceError(Exception):
+    """HTTP 상태와 함께 클라이언트에 돌려줄 오류."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# =========================
+# 처리 통계 (지연 백분위 · 처리량)
+# =========================
+def _percentile_ms(sorted_xs: List[float], p: float) -> float:
+    """최근접 순위 백분위(ms)."""
+    k = max(0, min(len(sorted_xs) - 1, -(-int(p * len(sorted_xs)) // 100) - 1))
+    return round(sorted_xs[k] * 1e3, 3)
+
+
+class ServiceStats:
+    """요청별 지연(최근 STATS_WINDOW건)과 누적 건수. 핸들러 스레드에서 동시에 기록하므로 lock으로 보호."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.recent: deque = deque(maxlen=STATS_WINDOW)  # (완료 시각, 지연 초, PDF 수)
+        self.counters: Dict[str, int] = dict.fromkeys(("requests", "files", "rows", "errors", "rejected"), 0)
+
+    def record(self, seconds: float, files: int, rows: int, ok: bool = True) -> None:
+        with self._lock:
+            self.recent.append((time.time(), seconds, files))
+            self.counters["requests"] += 1
+            self.counters["files"] += files
+            self.counters["rows"] += rows
+            if not ok:
+                self.counters["errors"] += 1
+
+    def reject(self) -> None:
+        with self._lock:
+            self.counters["rejected"] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            recent = list(self.recent)
+            counters = dict(self.counters)
+        now = time.time()
+        uptime = max(now - self.started, 1e-9)
+        last = [r for r in recent if r[0] >= now - STATS_RECENT_SECONDS]
+        window = min(uptime, STATS_RECENT_SECONDS)
+        xs = sorted(r[1] for r in recent)
+        latency = {f"p{p}_ms": _percentile_ms(xs, p) for p in (50, 90, 99)} if xs else {}
+        if xs:
+            latency.update(mean_ms=round(sum(xs) / len(xs) * 1e3, 3), max_ms=round(xs[-1] * 1e3, 3), count=len(xs))
+        return {
+            "uptime_s": round(uptime, 1),
+            "counters": counters,
+            "latency": latency,
+            "throughput": {
+                "requests_per_sec": round(counters["requests"] / uptime, 3),
+                "files_per_sec": round(counters["files"] / uptime, 3),
+                f"recent_{STATS_RECENT_SECONDS}s_requests_per_sec": round(len(last) / window, 3),
+                f"recent_{STATS_RECENT_SECONDS}s_files_per_sec": round(sum(r[2] for r in last) / window, 3),
+            },
+        }
+
+
+# =========================
+# 추출 서비스 (공유 프로세스 풀 · 요청 수 제한 · 템플릿 미리 읽기)
+# =========================
+class ExtractionService:
+    """
+    HTTP와 무관한 처리부: 요청 1건 = 업로드 PDF 목록 → run_batch/run_routed_batch → JSON 또는 내보내기 파일.
+    프로세스 풀은 시작 시 만들어 워커를 띄워 두고 모든 요청이 공유(run_batch(executor=…)).
+    """
+
+    def __init__(self, templates_file: str = TEMPLATE_DB, workers: int = BATCH_WORKERS_DEFAULT,
+                 queue: int = SERVER_QUEUE, mode: str = "clip", cache: ExtractionCache | None = None,
+                 ledger: DeclarationLedger | None = None, mem_budget: int | None = BATCH_MEM_BUDGET,
+                 ocr: bool = True):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.cache = cache
+        self.ledger = ledger
+        self.mem_budget = mem_budget
+        self.ocr = ocr
+        self.queue = queue
+        self._slots = threading.BoundedSemaphore(queue)
+        self._count_lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = ServiceStats()
+        # 템플릿: .json은 시작 시 1회, DB는 스냅샷(세대가 바뀔 때만 다시 읽음)
+        self.store = None if templates_file.lower().endswith(".json") else TemplateStore(templates_file)
+        self._static = load_templates(templates_file) if self.store is None else None
+        self.templates()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        for fut in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            fut.result()  # 첫 요청 지연에 워커 기동 시간이 섞이지 않게 미리 띄움
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def templates(self) -> Dict[str, dict]:
+        return self._static if self.store is None else self.store.all()
+
+    def template_list(self) -> List[dict]:
+        tmpls = self.templates()
+        return [{"name": name, "version": t.get("version"), "fields": template_fields(t.get("fields")),
+                 "fingerprint": bool(t.get("fingerprint")), "split": t.get("split")}
+                for name, t in sorted(tmpls.items()) if name != "__meta"]
+
+    def health(self) -> dict:
+        return {"status": "ok", "workers": self.workers, "queue": self.queue, "in_flight": self.in_flight,
+                "templates": len([n for n in self.templates() if n != "__meta"])}
+
+    def stats_summary(self) -> dict:
+        out = self.stats.summary()
+        out.update(workers=self.workers, queue=self.queue, in_flight=self.in_flight)
+        if self.cache is not None:
+            out["cache"] = self.cache.stats()
+        return out
+
+    def extract(self, files: List[Tuple[str, bytes]], template: str | None = None, auto: bool = False,
+                fmt: str = "json") -> Tuple[bytes, str, Dict[str, str]]:
+        """요청 1건 처리 → (응답 본문, Content-Type, 추가 헤더). 대기열이 차 있으면 ServiceError(503)."""
+        if not self._slots.acquire(blocking=False):
+            self.stats.reject()
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE,
+                               f"요청이 많습니다 (처리·대기 {self.queue}건) — 잠시 후 다시 시도하세요")
+        with self._count_lock:
+            self.in_flight += 1
+        t0 = time.perf_counter()
+        ok, rows = False, 0
+        try:
+            body, ctype, headers, rows = self._extract(files, template, auto, fmt)
+            ok = True
+            return body, ctype, headers
+        finally:
+            self.stats.record(time.perf_counter() - t0, len(files), rows, ok)
+            with self._count_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _extract(self, files: List[Tuple[str, bytes]], template: str | None, auto: bool, fmt: str
+                 ) -> Tuple[bytes, str, Dict[str, str], int]:
+        if not files:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "PDF가 없습니다 (multipart 'file' 또는 application/pdf 본문)")
+        if fmt != "json" and fmt not in EXPORT_FORMATS:
+            raise ServiceError(HTTPStatus.BAD_REQUEST,
+                               f"지원하지 않는 형식: {fmt} (json, {', '.join(EXPORT_FORMATS)})")
+        if fmt != "json" and export_unavailable(fmt):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, export_unavailable(fmt))
+        tmpls = self.templates()
+        tmpl = tmpls.get(template) if template and template != "__meta" else None
+        if template and not tmpl:
+            names = ", ".join(sorted(n for n in tmpls if n != "__meta")) or "(없음)"
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"템플릿을 찾을 수 없음: {template} — 사용 가능: {names}")
+        t0 = time.perf_counter()
+        kw = dict(mode=self.mode, workers=self.workers, cache=self.cache, validate=False,
+                  mem_budget=self.mem_budget, ocr=self.ocr, executor=self.pool)
+        if auto:
+            if not TemplateIndex(tmpls):
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "지문이 등록된 템플릿이 없습니다")
+            res = run_routed_batch(files, tmpls, fallback=template, **kw)
+            df, specs = routed_frame(res, tmpls)
+        else:
+            if not tmpl:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "template 또는 auto=1이 필요합니다")
+            field_defs = tmpl.get("fields", {})
+            fields = template_fields(field_defs)
+            missing = [f for f in fields if f not in tmpl.get("norm_rects", {})]
+            if missing:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"템플릿에 좌표가 없는 필드: {', '.join(missing)}")
+            units, _, split_issues = split_declarations(files, tmpl.get("split"))
+            res = run_batch(units, tmpl["norm_rects"], fields, dpi=tmpl.get("dpi", DPI_DEFAULT),
+                            field_defs=field_defs, field_pages=tmpl.get("field_pages"), **kw)
+            res = res._replace(issues=split_issues + res.issues)
+            df, specs = pd.DataFrame(res.rows, columns=fields), build_field_specs(field_defs)
+
+        issues = res.issues + validate_frame(df, res.names, specs)
+        batch_id = uuid.uuid4().hex
+        if self.ledger is not None and res.rows:
+            issues += self.ledger.duplicate_issues(res.rows, res.names, exclude_batch=batch_id,
+                                                   source_keys=res.source_keys)
+            self.ledger.record(res.rows, res.names, batch_id, getattr(res, "templates", None), res.source_keys)
+        headers = {"X-Batch-Id": batch_id, "X-Rows": str(len(res.rows)), "X-Issues": str(len(issues))}
+
+        if fmt == "json":
+            templates = getattr(res, "templates", None)
+            rows = [{"파일명": name, **row, **({TEMPLATE_COLUMN: templates[k]} if templates else {})}
+                    for k, (name, row) in enumerate(zip(res.names, res.rows))]
+            payload = {"batch_id": batch_id, "files": len(files), "rows": rows, "issues": issues,
+                       "elapsed_ms": round((time.perf_counter() - t0) * 1e3, 3)}
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            return body, "application/json; charset=utf-8", headers, len(res.rows)
+
+        df = sort_by_date(type_frame(df, specs))
+        with ResultExporter(list(df.columns), fmt, specs=specs) as ex:
+            ex.write_frame(df)
+        try:
+            with open(ex.path, "rb") as f:
+                body = f.read()
+        finally:
+            os.remove(ex.path)
+        headers["Content-Disposition"] = f'attachment; filename="receipts{EXPORT_FORMATS[fmt][1]}"'
+        return body, EXPORT_FORMATS[fmt][2], headers, len(res.rows)
+
+
+# =========================
+# HTTP 처리 (표준 라이브러리 http.server · 요청마다 스레드 1개)
+# =========================
+def parse_body(content_type: str, body: bytes, name: str | None = None
+               ) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+    """
+    요청 본문 → ([(파일명, PDF 바이트)], 폼 필드). multipart는 한 번만 해석해 두 가지를 함께 꺼냄.
+    - multipart/form-data: 파일이 든 모든 부분 (필드 이름 무관, 파일명 없으면 fileN.pdf)
+      + 일반 폼 필드(template, format, auto) — 쿼리 문자열 대신 폼으로 보낼 때
+    - application/pdf(또는 octet-stream): 본문 전체가 PDF 1건 (파일명은 ?name=), 폼 필드 없음
+    """
+    if not content_type.lower().startswith("multipart/form-data"):
+        return ([(os.path.basename(name or "upload.pdf"), body)] if body else []), {}
+    msg = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not msg.is_multipart():
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "multipart 본문을 해석할 수 없습니다")
+    files, fields = [], {}
+    for part in msg.iter_parts():
+        data = part.get_payload(decode=True) or b""
+        if part.get_filename() is None and part.get_content_type() != "application/pdf":
+            field = part.get_param("name", header="content-disposition")
+            if field:
+                fields[field] = data.decode("utf-8", "replace").strip()
+            continue
+        files.append((os.path.basename(part.get_filename() or f"file{len(files) + 1}.pdf"), data))
+    return files, fields
+
+
+class ReceiptRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ReceiptServer/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive (부하 시험 클라이언트가 연결 재사용)
+
+    @property
+    def service(self) -> ExtractionService:
+        return self.server.service
+
+    def log_message(self, fmt: str, *args) -> None:
+        logger.info("%s %s", self.address_string(), fmt % args)
+
+    def _send(self, status: HTTPStatus, body: bytes, ctype: str, headers: Dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, obj, headers: Dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"),
+                   "application/json; charset=utf-8", headers)
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path.rstrip("/") or "/"
+        if path in ("/", "/health"):
+            self._send_json(HTTPStatus.OK, self.service.health())
+        elif path == "/templates":
+            self._send_json(HTTPStatus.OK, self.service.template_list())
+        elif path == "/stats":
+            self._send_json(HTTPStatus.OK, self.service.stats_summary())
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"없는 경로: {path}"})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/extract":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"없는 경로: {url.path}"})
+            return
+        try:
+            raw = (self.headers.get("Content-Length") or "").strip()
+            length = int(raw) if raw.isdecimal() else -1  # 없음·숫자 아님·음수("-1")는 모두 -1
+            if length < 0 or length > self.server.max_body:
+                self.close_connection = True  # 본문을 읽지 않았으므로 연결 재사용 불가
+                if length < 0:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, f"Content-Length가 없거나 잘못되었습니다: {raw!r}")
+                raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                   f"요청 본문이 너무 큽니다 (상한 {self.server.max_body // (1024 * 1024)}MB)")
+            body = self.rfile.read(length) if length else b""
+            ctype = self.headers.get("Content-Type", "")
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            files, form = parse_body(ctype, body, q.get("name"))
+            q = {**form, **q}
+            auto = q.get("auto", "").lower() in ("1", "true", "yes")
+            out, out_type, headers = self.service.extract(files, q.get("template") or None, auto,
+                                                          (q.get("format") or "json").lower())
+            self._send(HTTPStatus.OK, out, out_type, headers)
+        except ServiceError as e:
+            extra = {"Retry-After": str(SERVER_RETRY_AFTER)} if e.status == HTTPStatus.SERVICE_UNAVAILABLE else None
+            self._send_json(e.status, {"error": str(e)}, extra)
+        except Exception as e:
+            logger.exception("extract 실패")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"})
+
+
+class ReceiptHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog (기본 5) — 동시 접속이 몰려도 연결을 끊지 않고 받아서 503으로 응답
+
+
+def make_server(service: ExtractionService, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                max_body_mb: int = SERVER_MAX_BODY_MB) -> ReceiptHTTPServer:
+    server = ReceiptHTTPServer((host, port), ReceiptRequestHandler)
+    server.service = service
+    server.max_body = max_body_mb * 1024 * 1024
+    return server
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="수입신고필증 PDF 추출 로컬 HTTP 서비스 (오프라인)")
+    ap.add_argument("--host", default=SERVER_HOST, help="바인드 주소 (기본: 로컬만)")
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--templates-file", default=TEMPLATE_DB, help="템플릿 저장소 경로 (.json이면 JSON 파일)")
+    ap.add_argument("--workers", type=int, default=BATCH_WORKERS_DEFAULT, help="추출 프로세스 수 (모든 요청이 공유)")
+    ap.add_argument("--queue", type=int, default=SERVER_QUEUE,
+                    help="동시에 받아 두는 요청 수 (처리 중 + 대기) — 넘으면 503")
+    ap.add_argument("--max-body", type=int, default=SERVER_MAX_BODY_MB, metavar="MB", help="요청 본문 상한 (MB)")
+    ap.add_argument("--mem-budget", type=int, default=BATCH_MEM_BUDGET // (1024 * 1024), metavar="MB",
+                    help="요청 1건이 워커에 동시에 맡기는 PDF 크기 합 상한 (MB, 0 = 무제한)")
+    ap.add_argument("--mode", choices=list(EXTRACT_MODES), default="clip", help="ROI 텍스트 추출 방식")
+    ap.add_argument("--no-ocr", action="store_true", help="스캔본 ROI OCR 대체 추출 안 함")
+    ap.add_argument("--cache-file", default=CACHE_FILE, help="추출 캐시 SQLite 경로")
+    ap.add_argument("--no-cache", action="store_true", help="추출 캐시 사용 안 함")
+    ap.add_argument("--ledger-file", default=LEDGER_FILE, help="반입 이력 SQLite 경로")
+    ap.add_argument("--no-ledger", action="store_true", help="반입 이력 중복 검사·기록 안 함 (부하 시험 시 권장)")
+    ap.add_argument("-q", "--quiet", action="store_true", help="요청 로그 출력 안 함")
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        service = ExtractionService(
+            args.templates_file, workers=args.workers, queue=args.queue, mode=args.mode,
+            cache=None if args.no_cache else ExtractionCache(args.cache_file),
+            ledger=None if args.no_ledger else DeclarationLedger(args.ledger_file),
+            mem_budget=args.mem_budget * 1024 * 1024 or None, ocr=not args.no_ocr)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    server = make_server(service, args.host, args.port, args.max_body)
+    print(f"수입신고필증 추출 서비스: http://{args.host}:{server.server_address[1]} "
+          f"(워커 {service.workers} · 대기열 {service.queue} · 템플릿 {len(service.template_list())}개)",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
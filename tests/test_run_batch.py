@@ -0,0 +1,65 @@
+# tests/test_run_batch.py
+# ------------------------------------------------------------
+# run_batch — 같은 프로세스에서 동시에 도는 배치끼리 추출 설정(좌표·필드)이 섞이지 않는지
+# run_routed_batch — 실패 건 뒤에 같은 파일명이 와도 행이 제 입력 자리에 놓이는지
+# 실행: python -m pytest -q tests
+# ------------------------------------------------------------
+
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import receipt_engine  # noqa: E402
+from receipt_engine import FIELDS, pdf_fingerprint, run_batch, run_routed_batch  # noqa: E402
+from synth_corpus import (  # noqa: E402
+    generate_corpus, load_template_rects, make_declaration_pdf, make_form_base, template_files,
+)
+
+RECTS = load_template_rects(str(template_files()[0]))
+FIELDS_IN = [f for f in FIELDS if f in RECTS]
+
+
+def test_concurrent_in_process_batches_keep_their_own_rects():
+    docs = list(generate_corpus(RECTS, 20, 5))
+    items = [(d.name, d.pdf) for d in docs]
+    off = {f: [0.0, 0.0, 0.01, 0.01] for f in RECTS}  # 값이 없는 구석 → 빈 행
+    out = {}
+    barrier = threading.Barrier(2)
+
+    def _run(key, rects):
+        barrier.wait()
+        out[key] = run_batch(items, rects, FIELDS_IN, validate=False, workers=1)
+
+    threads = [threading.Thread(target=_run, args=("a", RECTS)), threading.Thread(target=_run, args=("b", off))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out["a"].rows == [d.expected for d in docs]
+    assert out["b"].rows == run_batch(items[:1], off, FIELDS_IN, validate=False).rows * len(docs)
+
+
+def test_routed_rows_follow_input_index_when_same_name_fails(monkeypatch):
+    docs = list(generate_corpus(RECTS, 3, 5))
+    extract = receipt_engine.extract_declaration
+
+    def _extract(source, *args, **kwargs):
+        if source == docs[0].pdf:
+            raise ValueError("손상된 PDF")
+        return extract(source, *args, **kwargs)
+
+    monkeypatch.setattr(receipt_engine, "extract_declaration", _extract)
+    # 다른 양식(A3) 1건이 두 scan.pdf 사이에 끼도록 → 템플릿 그룹 2개
+    a3 = make_declaration_pdf(docs[1].raws, RECTS, make_form_base(RECTS, (842, 1190)))
+    templates = {"A4": {"norm_rects": RECTS, "fingerprint": pdf_fingerprint(docs[0].pdf)},
+                 "A3": {"norm_rects": RECTS, "fingerprint": pdf_fingerprint(a3)}}
+    items = [("scan.pdf", docs[0].pdf), ("a3.pdf", a3), ("scan.pdf", docs[2].pdf)]
+    res = run_routed_batch(items, templates, validate=False)
+    assert res.names == ["a3.pdf", "scan.pdf"]
+    assert res.templates == ["A3", "A4"]
+    assert res.rows == [docs[1].expected, docs[2].expected]
+    assert any("손상된 PDF" in msg for msg in res.issues)
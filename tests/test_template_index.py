@@ -0,0 +1,55 @@
+# tests/test_template_index.py
+# ------------------------------------------------------------
+# TemplateIndex(버킷 판별) == 전체 템플릿 선형 비교 — 페이지 허용 오차(FINGERPRINT_PAGE_TOL) 경계 포함
+# 실행: python -m pytest -q tests
+# ------------------------------------------------------------
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from receipt_engine import (  # noqa: E402
+    FINGERPRINT_MAX_DIST, FINGERPRINT_PAGE_TOL, FINGERPRINT_VERSION, TemplateIndex, fingerprint_distance,
+    template_fields,
+)
+
+ANCHORS = {"bl": [0.08, 0.21], "port": [0.52, 0.21], "date": [0.08, 0.12], "no": [0.52, 0.12]}
+
+
+def _fp(w: float, h: float) -> dict:
+    return {"v": FINGERPRINT_VERSION, "page": [w, h], "rotation": 0, "anchors": dict(ANCHORS)}
+
+
+def _templates(*pages) -> dict:
+    rects = {f: [0.1, 0.1, 0.2, 0.2] for f in template_fields()}
+    return {f"T{i}": {"norm_rects": rects, "fingerprint": _fp(w, h)} for i, (w, h) in enumerate(pages)}
+
+
+def _linear(fp: dict, templates: dict):
+    best = None
+    for name, t in templates.items():
+        d = fingerprint_distance(fp, t["fingerprint"])
+        if d <= FINGERPRINT_MAX_DIST and (best is None or d < best[1]):
+            best = (name, d)
+    return best
+
+
+def test_offset_within_tolerance_two_old_buckets_away():
+    # 세로 849pt 템플릿 · 문서 +15pt (허용 약 17pt) — 10pt 고정 버킷이면 두 칸 떨어져 못 찾던 경우
+    templates = _templates((595.0, 849.0))
+    assert 15 <= FINGERPRINT_PAGE_TOL * 849.0
+    hit = TemplateIndex(templates).match(_fp(595.0, 864.0))
+    assert hit is not None and hit[0] == "T0"
+
+
+@pytest.mark.parametrize("dw, dh", [(dw, dh) for dw in (-12.0, -6.0, 0.0, 6.0, 11.5)
+                                    for dh in (-18.0, -16.5, -9.0, 0.0, 9.0, 15.0, 16.9, 18.0)])
+def test_index_matches_linear_scan(dw, dh):
+    templates = _templates((595.0, 849.0), (612.0, 792.0), (842.0, 1190.0), (420.0, 595.0))
+    index = TemplateIndex(templates)
+    for w, h in [(595.0, 849.0), (612.0, 792.0), (842.0, 1190.0), (420.0, 595.0)]:
+        fp = _fp(w + dw, h + dh)
+        assert index.match(fp) == _linear(fp, templates)
@@ -0,0 +1,58 @@
+# tests/test_word_grid.py
+# ------------------------------------------------------------
+# 추출 모드 words(WordGrid.text_in) == clip(get_text("text", clip=…)) — 같은 ROI면 같은 문자열
+# 실행: python -m pytest -q tests
+# ------------------------------------------------------------
+
+import random
+import sys
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from receipt_engine import PdfExtractionSession  # noqa: E402
+from synth_corpus import FIELD_LABELS, generate_corpus, load_template_rects, template_files  # noqa: E402
+
+RECTS = load_template_rects(str(template_files()[0]))
+DOCS = list(generate_corpus(RECTS, 12, 5))
+
+
+def _norm(clip: fitz.Rect, page_rect: fitz.Rect) -> list:
+    w, h = page_rect.width, page_rect.height
+    return [(clip.x0 - page_rect.x0) / w, (clip.y0 - page_rect.y0) / h,
+            (clip.x1 - page_rect.x0) / w, (clip.y1 - page_rect.y0) / h]
+
+
+def _both(sess: PdfExtractionSession, rect) -> tuple:
+    rois = {"f": rect}
+    return (sess.extract_texts(rois, ["f"], mode="clip")["f"], sess.extract_texts(rois, ["f"], mode="words")["f"])
+
+
+@pytest.mark.parametrize("doc", DOCS, ids=lambda d: d.name)
+def test_label_and_value_side_by_side(doc):
+    # 라벨 "환율" 오른쪽에 값 — 문서(값 글자 크기·위치)에 따라 클립 텍스트가 두 줄을 한 줄로 합쳐 "환율888.66"
+    with PdfExtractionSession(doc.pdf) as sess:
+        page = sess.load_page(0)
+        words = page.get_text("words")
+        label = next(w for w in words if w[4] == FIELD_LABELS["환율"])
+        value = next(w for w in words if w[0] > label[2] and abs(w[1] - label[1]) < 3)
+        for y1 in (value[3] + 1, (value[1] + value[3]) / 2 + 0.5):
+            clip = fitz.Rect(label[0] - 1, min(label[1], value[1]) - 1, value[2] + 1, y1)
+            clip_txt, words_txt = _both(sess, _norm(clip, page.rect))
+            assert words_txt == clip_txt
+
+
+def test_random_rois_match_clip():
+    rng = random.Random(1)
+    for doc in DOCS:
+        with PdfExtractionSession(doc.pdf) as sess:
+            for _ in range(100):
+                x0, y0 = rng.random() * 0.9, rng.random() * 0.9
+                rect = [x0, y0, x0 + rng.random() * 0.5, y0 + rng.random() * rng.choice([0.08, 0.3])]
+                clip_txt, words_txt = _both(sess, rect)
+                assert words_txt == clip_txt, rect